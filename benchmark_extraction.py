@@ -0,0 +1,124 @@
+"""
+Benchmark of LLM calls per negotiation in the legacy negotiator (main.py), by term
+extraction mode, using a scripted repository instead of a real model.
+
+  • llm    → the previous behaviour: one extra LLM call per message to extract terms
+  • auto   → deterministic parser, LLM only when the parse is not confident
+  • parser → deterministic parser only
+
+Usage:
+  • python benchmark_extraction.py --negotiations 20 --max-rounds 10
+"""
+import argparse, json, os, random, tempfile, time
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Dict, List, Optional
+
+from main import AIRepository, AINegotiator, negotiate
+
+SELLER_CONSTRAINTS = {"price": (1000, 1500), "delivery_time": (7, 14), "payment_terms": (50, 100)}
+BUYER_CONSTRAINTS = {"price": (800, 1200), "delivery_time": (5, 10), "payment_terms": (0, 50)}
+
+EXTRACTION_MARKER = "Extract the negotiation terms"
+
+class ScriptedRepository(AIRepository):
+    """
+    Offline negotiator: concedes a fixed step per round, quotes the terms on the table
+    before countering and, now and then, proposes two alternatives in one message
+    (the ambiguous case the parser hands over to the LLM). Extraction prompts get the
+    JSON of the last offer. Counts both kinds of calls.
+    """
+    def __init__(self, is_seller: bool, seed: int = 0):
+        self.model_name = "scripted"
+        self.is_seller = is_seller
+        self.rng = random.Random(seed)
+        self.price = 1450.0 if is_seller else 850.0
+        self.delivery = 12.0 if is_seller else 6.0
+        self.upfront = 80.0 if is_seller else 20.0
+        self.last_offer: Dict[str, float] = {}
+        self.calls = {"negotiation": 0, "extraction": 0}
+
+    def run(self, prompt: str) -> str:
+        if EXTRACTION_MARKER in prompt:
+            self.calls["extraction"] += 1
+            return json.dumps(self.last_offer)
+        self.calls["negotiation"] += 1
+        step = 1 if self.is_seller else -1
+        on_table = self._on_table(prompt)
+        if on_table is not None and (on_table <= 1060 if not self.is_seller else on_table >= 1160) \
+                and self.rng.random() < 0.5:
+            return f"Done deal! ${on_table:g} works for me."
+        self.price -= step * 60
+        self.delivery -= step * 0.5
+        self.upfront -= step * 5
+        self.last_offer = {"price": self.price, "delivery_time": self.delivery,
+                           "payment_terms": self.upfront}
+        quote = f"${on_table:g} does not work for me. " if on_table is not None else ""
+        if self.rng.random() < 0.2:
+            return (f"{quote}I could do ${self.price:g} with {self.upfront:g}% upfront, or "
+                    f"${self.price + step * 40:g} with {self.upfront - step * 10:g}% upfront, "
+                    f"delivery in {self.delivery:g} days.")
+        return (f"{quote}I propose ${self.price:g}, delivery in {self.delivery:g} days "
+                f"and {self.upfront:g}% upfront.")
+
+    @staticmethod
+    def _on_table(prompt: str) -> Optional[float]:
+        for line in prompt.splitlines():
+            if line.strip().startswith("- Price: $"):
+                return float(line.strip()[len("- Price: $"):])
+        return None
+
+def make_negotiator(is_seller: bool, mode: str, max_rounds: int, seed: int) -> AINegotiator:
+    negotiator = AINegotiator(name="Seller" if is_seller else "Buyer", is_seller=is_seller,
+                              constraints=SELLER_CONSTRAINTS if is_seller else BUYER_CONSTRAINTS,
+                              repository_type="ollama", model_name="scripted",
+                              max_rounds=max_rounds, term_extraction=mode)
+    negotiator.ai_model.repository = ScriptedRepository(is_seller, seed)
+    return negotiator
+
+def run_benchmark(mode: str, negotiations: int = 20, max_rounds: int = 10,
+                  seed: int = 0) -> Dict[str, float]:
+    repos: List[ScriptedRepository] = []
+    deals = 0
+    t0 = time.perf_counter()
+    for i in range(negotiations):
+        seller = make_negotiator(True, mode, max_rounds, seed + 2 * i)
+        buyer = make_negotiator(False, mode, max_rounds, seed + 2 * i + 1)
+        repos += [seller.ai_model.repository, buyer.ai_model.repository]
+        with redirect_stdout(StringIO()):
+            deals += negotiate(seller, buyer, max_rounds=max_rounds, round_delay=0) is not None
+    wall = time.perf_counter() - t0
+
+    messages = sum(r.calls["negotiation"] for r in repos)
+    extraction = sum(r.calls["extraction"] for r in repos)
+    return {
+        "negotiations":     negotiations,
+        "deals":            deals,
+        "messages":         messages,
+        "extraction_calls": extraction,
+        "calls_per_neg":    round((messages + extraction) / negotiations, 2),
+        "calls_per_msg":    round((messages + extraction) / messages, 2) if messages else 0.0,
+        "wall_s":           round(wall, 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="LLM calls per negotiation by term extraction mode")
+    ap.add_argument("--negotiations", type=int, default=20)
+    ap.add_argument("--max-rounds", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", default=None, help="where data/ is written (default: temp dir)")
+    args = ap.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="extraction-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)                       # NegotiationLogger escribe en ./data
+
+    print("\n==== BENCHMARK ====")
+    for mode in ("llm", "auto", "parser"):
+        res = run_benchmark(mode, args.negotiations, args.max_rounds, args.seed)
+        print(f"\n[{mode}]")
+        for k, v in res.items():
+            print(f"{k:>17}: {v}")
+
+if __name__ == "__main__":
+    main()
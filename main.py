@@ -199,6 +199,15 @@ class NegotiationState:
             )
         return False
 
+# Patterns for each term; the captured group is the value
+TERM_PATTERNS = {
+    "price": r'\$\s*(\d+(?:,\d+)?(?:\.\d+)?)|(\d+(?:,\d+)?(?:\.\d+)?)\s*dollars',
+    "delivery_time": r'(\d+(?:\.\d+)?)\s*(?:-|\s)?days?',
+    "payment_terms": r'(\d+(?:\.\d+)?)\s*(?:%|percent|percentage)',
+}
+
+TERM_EXTRACTION_MODES = ("auto", "parser", "llm")
+
 class AINegotiator:
     def __init__(self, 
                  name: str, 
@@ -207,7 +216,11 @@ class AINegotiator:
                  repository_type: str = "ollama",
                  model_name: str = "llama2:latest",
                  api_key: str = None,
-                 max_rounds: int = 20):
+                 max_rounds: int = 20,
+                 term_extraction: str = "auto"):
+        if term_extraction not in TERM_EXTRACTION_MODES:
+            raise ValueError(f"Unsupported term extraction: {term_extraction}. "
+                             f"Supported: {', '.join(TERM_EXTRACTION_MODES)}")
         self.name = name
         self.is_seller = is_seller
         self.constraints = constraints
@@ -217,6 +230,7 @@ class AINegotiator:
             api_key=api_key
         )
         self.max_rounds = max_rounds
+        self.term_extraction = term_extraction
         self.role = "seller" if is_seller else "buyer"
         self.last_message = None
         self.template_manager = TemplateManager()
@@ -292,43 +306,66 @@ class AINegotiator:
             print(f"Error extracting terms with LLM: {e}")
             return {}
     
-    def extract_terms(self, response: str) -> Dict[str, float]:
-        """Extract numerical terms from a natural language response."""
+    def parse_terms(self, response: str,
+                    current_terms: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, float], bool]:
+        """
+        Deterministic term extraction from a negotiation message.
+
+        Returns the terms found and whether the parse is confident. A term mentioned
+        with several values (e.g. "$1000 is too low, I propose $1200") is resolved by
+        dropping the values already on the table; if that still leaves more than one,
+        the first one is kept and the parse is flagged as not confident. A message
+        with numbers but no recognizable term is not confident either.
+        """
         terms = {}
-        
-        try:
-            # First try to extract terms using LLM
+        confident = True
+        text = response.lower()
+        current_terms = current_terms or {}
+
+        for term, pattern in TERM_PATTERNS.items():
+            values = []
+            for match in re.findall(pattern, text):
+                groups = match if isinstance(match, tuple) else (match,)
+                for group in groups:
+                    if group:
+                        value = float(group.replace(',', ''))
+                        if value not in values:
+                            values.append(value)
+            if not values:
+                continue
+            if len(values) > 1:
+                # Values already on the table are usually quoted, not proposed
+                new_values = [v for v in values if v != current_terms.get(term)]
+                if len(new_values) == 1:
+                    values = new_values
+                else:
+                    confident = False
+            terms[term] = values[0]
+
+        if not terms and re.search(r'\d', text):
+            confident = False
+        return terms, confident
+
+    def extract_terms(self, response: str,
+                      current_terms: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """
+        Extract numerical terms from a natural language response.
+
+        With term_extraction="auto" (default) the deterministic parser runs first and
+        the LLM is asked only when the parse is not confident. "parser" never calls
+        the LLM; "llm" asks the LLM for every message and uses the parser as fallback.
+        """
+        if self.term_extraction == "llm":
+            llm_terms = self.extract_terms_with_llm(response)
+            if llm_terms:
+                return llm_terms
+            return self.parse_terms(response, current_terms)[0]
+
+        terms, confident = self.parse_terms(response, current_terms)
+        if not confident and self.term_extraction == "auto":
             llm_terms = self.extract_terms_with_llm(response)
             if llm_terms:
                 return llm_terms
-        except Exception as e:
-            print(f"Error extracting terms with LLM: {e}")
-        
-        # Fall back to regex extraction if LLM extraction fails
-        try:
-            # Price extraction
-            price_matches = re.findall(r'\$\s*(\d+(?:,\d+)?(?:\.\d+)?)|(\d+(?:,\d+)?(?:\.\d+)?)\s*dollars', response.lower())
-            if price_matches:
-                flat_matches = [match for tup in price_matches for match in tup if match]
-                if flat_matches:
-                    terms["price"] = float(flat_matches[0].replace(',', ''))
-            
-            # Delivery time extraction
-            delivery_matches = re.findall(r'(\d+(?:\.\d+)?)\s*(?:-|\s)?days?|(\d+(?:\.\d+)?)\s*(?:-|\s)?day delivery', response.lower())
-            if delivery_matches:
-                flat_matches = [match for tup in delivery_matches for match in tup if match]
-                if flat_matches:
-                    terms["delivery_time"] = float(flat_matches[0])
-            
-            # Payment terms extraction
-            payment_matches = re.findall(r'(\d+(?:\.\d+)?)\s*(?:%|percent|percentage)(?:\s*upfront|\s*payment|\s*deposit)?', response.lower())
-            if payment_matches:
-                terms["payment_terms"] = float(payment_matches[0])
-            
-            print(f"Regex extracted terms: {terms}")
-        except Exception as e:
-            print(f"Error in regex term extraction: {e}")
-        
         return terms
 
     def extract_acceptance(self, response: str) -> bool:
@@ -380,13 +417,13 @@ class AINegotiator:
         # Check if terms are accepted (explicit "Done deal!" phrase)
         accepted = self.extract_acceptance(response)
         
-        # Extract terms from response
-        proposed_terms = self.extract_terms(response)
-        
         # If accepting, return empty terms dict to use current terms
         if accepted:
             return {}, True
         
+        # Extract terms from response
+        proposed_terms = self.extract_terms(response, negotiation_state.current_terms)
+        
         # Ensure proposed terms are within constraints
         for term in negotiation_state.current_terms:
             if term in proposed_terms:
@@ -464,7 +501,8 @@ class NegotiationLogger:
             f.write("\n=== Final State ===\n")
             f.write(f"Last proposed terms: {final_terms}\n")
 
-def negotiate(seller: AINegotiator, buyer: AINegotiator, max_rounds: int = 10) -> Dict[str, float]:
+def negotiate(seller: AINegotiator, buyer: AINegotiator, max_rounds: int = 10,
+              round_delay: float = 1.0) -> Dict[str, float]:
     """Simulate a negotiation between seller and buyer with improved state management."""
     logger = NegotiationLogger(seller, buyer)
     
@@ -516,7 +554,7 @@ def negotiate(seller: AINegotiator, buyer: AINegotiator, max_rounds: int = 10) -
             logger.log_warning(state.get_rounds_left())
             print(f"\n[Warning: {state.get_rounds_left()} rounds remaining]")
             
-        time.sleep(1)
+        time.sleep(round_delay)
 
     logger.log_negotiation_failed(state.current_terms)
     print("\n[Negotiation failed: No deal reached]")
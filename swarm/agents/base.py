@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Tuple
 from ..utils.template_manager import TemplateManager
 from ..core.negotiation import Negotiation
 from ..core.terms import MultiItemTerms
+from ..core.structured import STRUCTURED_INSTRUCTIONS, parse_reply, reply_schema
+
+# Negociación para la que se está generando el turno actual. Lo fija Agent.decide
+# para que las capas de repositorio (streaming, validación...) tengan contexto.
+current_negotiation: ContextVar[Optional[Negotiation]] = ContextVar("current_negotiation", default=None)
+# Id del agente que habla en ese turno (p.ej. para sesiones por agente y negociación)
+current_agent: ContextVar[Optional[str]] = ContextVar("current_agent", default=None)
 
 class Agent(ABC):
     """
@@ -15,7 +23,8 @@ class Agent(ABC):
                  urgency: float,
                  term_weights: Dict[str, float],
                  custom_prompt: Optional[str] = None,
-                 multi_item_prompt_path: Optional[str] = None):
+                 multi_item_prompt_path: Optional[str] = None,
+                 structured: bool = False):
         self.id           = agent_id
         self.repo         = repo
         self.urgency      = urgency
@@ -23,13 +32,89 @@ class Agent(ABC):
         self.prompt_path  = prompt_path
         self.multi_item_prompt_path = multi_item_prompt_path
         self.custom_prompt = custom_prompt
+        # Respuestas JSON {message, offer, accept} validadas contra un schema
+        self.structured   = structured
         self.tmpl         = TemplateManager()
         self.negotiations: Dict[str, Negotiation] = {}
 
     @abstractmethod
+    def _other_negotiations(self, negotiation: Negotiation) -> List[Negotiation]:
+        """Negotiations whose status is shown to the agent as market context."""
+
     def decide(self, negotiation: Negotiation) -> str:
         """Returns the next message for a given negotiation."""
-    
+        system, prompt = self.build_prompt(negotiation)
+        return self.complete(negotiation, system, prompt)
+
+    def complete(self, negotiation: Negotiation, system: str, prompt: str) -> str:
+        """Send an already rendered prompt for `negotiation` through the repository."""
+        token, agent_token = current_negotiation.set(negotiation), current_agent.set(self.id)
+        try:
+            out = self.repo.run(prompt, **self._repo_kwargs(negotiation, system))
+        finally:
+            current_agent.reset(agent_token)
+            current_negotiation.reset(token)
+        return self.read_reply(negotiation, out)
+
+    async def adecide(self, negotiation: Negotiation) -> str:
+        """Async variant of decide(); awaits the repository instead of blocking."""
+        system, prompt = self.build_prompt(negotiation)
+        token, agent_token = current_negotiation.set(negotiation), current_agent.set(self.id)
+        try:
+            out = await self.repo.arun(prompt, **self._repo_kwargs(negotiation, system))
+        finally:
+            current_agent.reset(agent_token)
+            current_negotiation.reset(token)
+        return self.read_reply(negotiation, out)
+
+    def _repo_kwargs(self, negotiation: Negotiation, system: str) -> Dict:
+        # Sólo se pasa `system` si la plantilla tiene un prefijo estable
+        kwargs = {"system": system} if system else {}
+        if self.structured:
+            kwargs["schema"] = reply_schema(negotiation.terms)
+        return kwargs
+
+    def read_reply(self, negotiation: Negotiation, out: str) -> str:
+        """Structured replies become AgentReply; anything that does not parse stays free text."""
+        if not self.structured:
+            return out
+        return parse_reply(out, negotiation) or out
+
+    def build_prompt(self, negotiation: Negotiation) -> Tuple[str, str]:
+        """
+        Render the prompt as (system, user). `system` is the part of the template
+        before any per-turn variable, so it stays byte-identical across the turns of
+        a negotiation and providers can reuse its cached prefix.
+        """
+        other_status = [
+            {
+                "buyer": n.buyer_id,
+                "status": n.status.name,
+                "last_msg": n.turns[-1].message if n.turns else "",
+            }
+            for n in self._other_negotiations(negotiation)
+        ]
+        conversation_history = "\n".join(f"{t.sender_id}: {t.message}" for t in negotiation.turns)
+        ctx = dict(
+            current_terms = negotiation.final_terms or negotiation.terms,
+            rounds_left   = negotiation.max_turns - len(negotiation.turns)//2,
+            constraints   = negotiation.terms,
+            conversation_history = conversation_history,
+            urgency       = self.urgency,
+            weights       = self.term_weights,
+            other_negotiations = other_status,
+            agent_name    = self.id,
+        )
+
+        # Use custom prompt if available, otherwise use appropriate template
+        if self.custom_prompt:
+            system, prompt = self.tmpl.render_custom_split(self.custom_prompt, **ctx)
+        else:
+            system, prompt = self.tmpl.render_split(self._get_prompt_path(negotiation), **ctx)
+        if self.structured:
+            prompt += STRUCTURED_INSTRUCTIONS
+        return system, prompt
+
     def _get_prompt_path(self, negotiation: Negotiation) -> str:
         """Get the appropriate prompt path based on negotiation type"""
         if negotiation.is_multi_item() and self.multi_item_prompt_path:
@@ -43,49 +128,12 @@ class SellerAgent(Agent):
             kwargs['multi_item_prompt_path'] = 'multi_item_seller_prompt.j2'
         super().__init__(*args, **kwargs)
 
-    def decide(self, negotiation: Negotiation) -> str:
+    def _other_negotiations(self, negotiation: Negotiation) -> List[Negotiation]:
         # Todas las negociaciones de este vendedor
-        all_negos = [
+        return [
             n for n in self.negotiations.values()
             if n.seller_id == self.id
         ]
-        other_status = [
-            {
-                "buyer": n.buyer_id,
-                "status": n.status.name,
-                "last_msg": n.turns[-1].message if n.turns else "",
-            }
-            for n in all_negos
-        ]
-        conversation_history = "\n".join(f"{t.sender_id}: {t.message}" for t in negotiation.turns)
-        
-        # Use custom prompt if available, otherwise use appropriate template
-        if self.custom_prompt:
-            prompt = self.tmpl.render_custom(
-                self.custom_prompt,
-                current_terms = negotiation.final_terms or negotiation.terms,
-                rounds_left   = negotiation.max_turns - len(negotiation.turns)//2,
-                constraints   = negotiation.terms,
-                conversation_history = conversation_history,
-                urgency       = self.urgency,
-                weights       = self.term_weights,
-                other_negotiations = other_status,
-                agent_name    = self.id,
-            )
-        else:
-            prompt_path = self._get_prompt_path(negotiation)
-            prompt = self.tmpl.render(
-                prompt_path,
-                current_terms = negotiation.final_terms or negotiation.terms,
-                rounds_left   = negotiation.max_turns - len(negotiation.turns)//2,
-                constraints   = negotiation.terms,
-                conversation_history = conversation_history,
-                urgency       = self.urgency,
-                weights       = self.term_weights,
-                other_negotiations = other_status,
-                agent_name    = self.id,
-            )
-        return self.repo.run(prompt)
 
 class BuyerAgent(Agent):
     def __init__(self, *args, **kwargs):
@@ -94,46 +142,9 @@ class BuyerAgent(Agent):
             kwargs['multi_item_prompt_path'] = 'multi_item_buyer_prompt.j2'
         super().__init__(*args, **kwargs)
 
-    def decide(self, negotiation: Negotiation) -> str:
+    def _other_negotiations(self, negotiation: Negotiation) -> List[Negotiation]:
         # Todas las negociaciones de este vendedor
-        all_negos = [
+        return [
             n for n in self.negotiations.values()
             if n.seller_id == negotiation.seller_id
         ]
-        other_status = [
-            {
-                "buyer": n.buyer_id,
-                "status": n.status.name,
-                "last_msg": n.turns[-1].message if n.turns else "",
-            }
-            for n in all_negos
-        ]
-        conversation_history = "\n".join(f"{t.sender_id}: {t.message}" for t in negotiation.turns)
-        
-        # Use custom prompt if available, otherwise use appropriate template
-        if self.custom_prompt:
-            prompt = self.tmpl.render_custom(
-                self.custom_prompt,
-                current_terms = negotiation.final_terms or negotiation.terms,
-                rounds_left   = negotiation.max_turns - len(negotiation.turns)//2,
-                constraints   = negotiation.terms,
-                conversation_history = conversation_history,
-                urgency       = self.urgency,
-                weights       = self.term_weights,
-                other_negotiations = other_status,
-                agent_name    = self.id,
-            )
-        else:
-            prompt_path = self._get_prompt_path(negotiation)
-            prompt = self.tmpl.render(
-                prompt_path,
-                current_terms = negotiation.final_terms or negotiation.terms,
-                rounds_left   = negotiation.max_turns - len(negotiation.turns)//2,
-                constraints   = negotiation.terms,
-                conversation_history = conversation_history,
-                urgency       = self.urgency,
-                weights       = self.term_weights,
-                other_negotiations = other_status,
-                agent_name    = self.id,
-            )
-        return self.repo.run(prompt) 
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Backend de batch sobre la Batch API de OpenAI: sube el archivo JSONL del turno,
+crea el job y descarga el archivo de salida cuando termina (descuento de ~50% a
+cambio de una ventana de hasta 24h).
+"""
+import io, json, os
+from typing import List, Optional
+from .clients import get_openai_client
+from ..core.batch import BatchBackend, BatchRequest, BatchResults, parse_batch_output
+
+class OpenAIBatchBackend(BatchBackend):
+    FAILED = ("failed", "expired", "cancelled")
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 completion_window: str = "24h"):
+        self.client = get_openai_client(api_key or os.getenv("OPENAI_API_KEY"), base_url)
+        self.completion_window = completion_window
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        payload = "".join(json.dumps(r.to_line()) + "\n" for r in requests).encode("utf-8")
+        upload = self.client.files.create(file=("batch.jsonl", io.BytesIO(payload)), purpose="batch")
+        job = self.client.batches.create(input_file_id=upload.id, endpoint="/v1/chat/completions",
+                                         completion_window=self.completion_window)
+        return job.id
+
+    def poll(self, job_id: str) -> Optional[BatchResults]:
+        job = self.client.batches.retrieve(job_id)
+        if job.status != "completed" and job.status not in self.FAILED:
+            return None
+        results = BatchResults()
+        # Las requests fallidas van a un archivo aparte. Un job vencido o cancelado
+        # también trae las que alcanzaron a terminar; sólo el resto falla.
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id:
+                part = parse_batch_output(self.client.files.content(file_id).text.splitlines())
+                results.replies.update(part.replies)
+                results.errors.update(part.errors)
+        if job.status in self.FAILED:
+            results.job_error = f"batch {job_id} {job.status}"
+        return results
@@ -0,0 +1,320 @@
+"""
+Caché de respuestas LLM direccionada por contenido.
+
+Dos niveles: un LRU acotado en memoria y una tabla SQLite en disco (por defecto
+`data/llm_cache.sqlite`) que varios procesos pueden compartir. La clave es un hash
+de (provider, model, parámetros de generación, prompt) más el contexto que el
+repositorio declare (cache_context: p.ej. agente y negociación del simulador).
+
+Con la misma clave, SingleFlight agrupa las llamadas idénticas que están en curso:
+la primera va al proveedor y las demás esperan su respuesta.
+"""
+import asyncio, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from .repositories import AIRepository, RepositoryWrapper
+
+DEFAULT_CACHE_PATH = os.path.join("data", "llm_cache.sqlite")
+
+def cache_key(provider: str, model: str, params: Dict, prompt: str,
+              context: Optional[Dict] = None, **kwargs) -> str:
+    """Stable hash of everything that determines a completion."""
+    fields = {"provider": provider, "model": model, "params": params,
+              "prompt": prompt, "kwargs": kwargs}
+    # Sin contexto la clave no cambia: las cachés en disco existentes siguen valiendo
+    if context:
+        fields["context"] = context
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def request_key(repo: AIRepository, prompt: str, kwargs: Dict) -> str:
+    """cache_key of a call to `repo` (read through any wrappers), with its cache_context()."""
+    return cache_key(repo.provider, getattr(repo, "model", None),
+                     repo.generation_params, prompt, repo.cache_context(), **kwargs)
+
+class LRUCache:
+    """Thread-safe in-memory LRU with optional TTL (seconds)."""
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            created, value = item
+            if self.ttl is not None and self.clock() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, created: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (created if created is not None else self.clock(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SQLiteCache:
+    """
+    Persistent tier. WAL mode lets several processes read and write the same file;
+    expired rows and, past `max_entries`, the least recently used rows are pruned
+    every `prune_every` writes.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None, prune_every: int = 100, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = prune_every
+        self.clock = clock
+        self._writes = 0
+        self._lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+
+    def get(self, key: str) -> Optional[Tuple[float, str]]:
+        """Returns (created, value) or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = self.clock()
+            if self.ttl is not None and now - row[0] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0], row[1]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            now = self.clock()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now))
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(now)
+
+    def prune(self) -> None:
+        with self._lock:
+            self._prune(self.clock())
+
+    def _prune(self, now: float) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+class ResponseCache:
+    """Memory LRU in front of an optional SQLite tier, with hit/miss counters."""
+    def __init__(self, memory_size: int = 1024, path: Optional[str] = DEFAULT_CACHE_PATH,
+                 ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.memory = LRUCache(memory_size, ttl=ttl)
+        self.disk = SQLiteCache(path, ttl=ttl, max_entries=max_entries) if path else None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "ResponseCache":
+        return cls(memory_size = cfg.get("memory_size", 1024),
+                   path        = cfg.get("path", DEFAULT_CACHE_PATH),
+                   ttl         = cfg.get("ttl"),
+                   max_entries = cfg.get("max_entries"))
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits_memory")
+            return value
+        if self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                created, value = row
+                self.memory.set(key, value, created=created)
+                self._count("hits_disk")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def _count(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.hits_memory + self.hits_disk
+        total = hits + self.misses
+        return {"hits_memory": self.hits_memory, "hits_disk": self.hits_disk,
+                "misses": self.misses, "hit_rate": round(hits / total, 3) if total else 0.0}
+
+def cacheable(reply: str) -> bool:
+    """
+    False for replies the primary model did not produce (a circuit breaker's
+    FallbackReply carries `served_by`): stored under the primary's key, they would
+    keep being served as its answers after the circuit closes.
+    """
+    return getattr(reply, "served_by", None) is None
+
+class CachedRepository(RepositoryWrapper):
+    """Serves repeated (provider, model, params, prompt, context) calls from a ResponseCache."""
+    stats_name = "cache"
+
+    def __init__(self, inner: AIRepository, cache: ResponseCache):
+        super().__init__(inner)
+        self.cache = cache
+
+    def run(self, prompt: str, **kwargs) -> str:
+        key = request_key(self.inner, prompt, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        out = self.inner.run(prompt, **kwargs)
+        if cacheable(out):
+            self.cache.set(key, out)
+        return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        key = request_key(self.inner, prompt, kwargs)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        out = await self.inner.arun(prompt, **kwargs)
+        if cacheable(out):
+            self.cache.set(key, out)
+        return out
+
+    @property
+    def stats_source(self):
+        return self.cache
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
+
+class _Call:
+    """A pending synchronous call that other threads can wait on."""
+    __slots__ = ("done", "result", "error")
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls. The first caller of a key (the leader) runs
+    it; callers arriving before it finishes wait and get the same result or
+    exception. Nothing is remembered afterwards, that is the cache's job.
+
+    Threads and coroutines are tracked separately; coroutine calls are per event
+    loop. The shared call runs as its own task, so cancelling one waiter (or the
+    leader) does not cancel it for the others.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._pending: Dict[str, _Call] = {}
+        self._tasks: Dict[Tuple[int, str], "asyncio.Task"] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], str]) -> str:
+        with self._lock:
+            call = self._pending.get(key)
+            leader = call is None
+            if leader:
+                call = self._pending[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[str]]) -> str:
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(slot)
+            if task is None:
+                task = self._tasks[slot] = loop.create_task(fn())
+                task.add_done_callback(lambda _: self._forget(slot))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, slot: Tuple[int, str]) -> None:
+        with self._lock:
+            self._tasks.pop(slot, None)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.calls + self.coalesced
+        return {"calls": self.calls, "coalesced": self.coalesced,
+                "saved_rate": round(self.coalesced / total, 3) if total else 0.0}
+
+class CoalescingRepository(RepositoryWrapper):
+    """Sends at most one request per distinct (provider, model, params, prompt, context) at a time."""
+    stats_name = "coalesce"
+
+    def __init__(self, inner: AIRepository, flight: SingleFlight):
+        super().__init__(inner)
+        self.flight = flight
+
+    def run(self, prompt: str, **kwargs) -> str:
+        key = request_key(self.inner, prompt, kwargs)
+        return self.flight.do(key, lambda: self.inner.run(prompt, **kwargs))
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        key = request_key(self.inner, prompt, kwargs)
+        return await self.flight.ado(key, lambda: self.inner.arun(prompt, **kwargs))
+
+    @property
+    def stats_source(self):
+        return self.flight
+
+    def stats(self) -> Dict[str, float]:
+        return self.flight.stats()
@@ -0,0 +1,268 @@
+"""
+Registro de clientes HTTP compartidos.
+
+Un cliente keep-alive (con pool de conexiones) por (provider, api_key, base_url),
+compartido por todos los agentes que lo usan, en lugar de uno por agente.
+Los clientes async quedan ligados a su event loop: se guardan por loop y se
+cierran cuando ese loop termina (asyncio.run).
+Para servidores propios (Ollama) un EndpointPool reparte las llamadas entre varias
+URLs: menos requests en curso primero, health checks periódicos y failover.
+"""
+import asyncio, inspect, threading, time
+from typing import Dict, List, Optional, Sequence, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+# Defaults; configure_clients() los cambia antes de construir los repositorios
+POOL_SIZE = 10
+TIMEOUT = 120.0
+CONNECT_TIMEOUT = 10.0
+
+_clients: Dict[Tuple, object] = {}
+# Por objeto loop, no por id(): un id reciclado le daría a un loop nuevo clientes de uno cerrado
+_loop_clients: Dict[asyncio.AbstractEventLoop, Dict[Tuple, object]] = {}
+_loop_closers: Dict[asyncio.AbstractEventLoop, object] = {}
+_lock = threading.RLock()      # las factories pueden pedir otros clientes (EndpointPool → sesiones)
+
+def configure_clients(pool_size: Optional[int] = None,
+                      timeout: Optional[float] = None,
+                      connect_timeout: Optional[float] = None) -> None:
+    """Set pool size and timeouts for clients created from now on."""
+    global POOL_SIZE, TIMEOUT, CONNECT_TIMEOUT
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if timeout is not None:
+        TIMEOUT = timeout
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+
+def reset_clients() -> None:
+    """Close and forget every cached client (tests, or after fork)."""
+    with _lock:
+        dropped = list(_clients.values())
+        by_loop = [(loop, list(loop_clients.values())) for loop, loop_clients in _loop_clients.items()]
+        _clients.clear()
+        for loop_clients in _loop_clients.values():
+            loop_clients.clear()        # ya no son de su closer
+        _loop_clients.clear()
+        _loop_closers.clear()
+    for client in dropped:
+        _close(client)
+    for loop, loop_clients in by_loop:
+        if loop.is_closed():
+            continue
+        closing = _aclose_all(loop_clients)
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(closing, loop)
+        else:
+            loop.run_until_complete(closing)
+
+def _close(client) -> None:
+    close = getattr(client, "close", None)
+    # Un cliente async creado fuera de un loop no se puede cerrar desde aquí
+    if callable(close) and not inspect.iscoroutinefunction(close):
+        close()
+
+async def _aclose_all(loop_clients: List[object]) -> None:
+    for client in loop_clients:
+        close = getattr(client, "aclose", None) or client.close     # httpx | SDKs
+        await close()
+
+async def _close_on_shutdown(loop: asyncio.AbstractEventLoop, loop_clients: Dict[Tuple, object]):
+    # asyncio.run cierra los async generators vivos (shutdown_asyncgens) antes de cerrar
+    # el loop: el finally es el último momento en que los clientes se pueden cerrar
+    try:
+        yield
+    finally:
+        with _lock:
+            if _loop_clients.get(loop) is loop_clients:
+                del _loop_clients[loop]
+                _loop_closers.pop(loop, None)
+            closing = list(loop_clients.values())
+            loop_clients.clear()
+        await _aclose_all(closing)
+
+def _get_or_create(key: Tuple, factory):
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = factory()
+        return client
+
+def _get_or_create_async(key: Tuple, factory):
+    """Like _get_or_create, for clients bound to the running event loop."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _get_or_create(key, factory)
+    with _lock:
+        # Loops cerrados sin shutdown_asyncgens (no vía asyncio.run): soltar sus clientes
+        for closed in [l for l in _loop_clients if l.is_closed()]:
+            del _loop_clients[closed]
+            _loop_closers.pop(closed, None)
+        loop_clients = _loop_clients.get(loop)
+        if loop_clients is None:
+            loop_clients = _loop_clients[loop] = {}
+            closer = _loop_closers[loop] = _close_on_shutdown(loop, loop_clients)
+            asyncio.ensure_future(closer.__anext__())
+        client = loop_clients.get(key)
+        if client is None:
+            client = loop_clients[key] = factory()
+        return client
+
+def _httpx_options(async_: bool = False, pool_size: Optional[int] = None) -> Dict:
+    import httpx
+    size = max(POOL_SIZE, pool_size or 0)
+    limits = httpx.Limits(max_connections=size, max_keepalive_connections=size)
+    timeout = httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT)
+    cls = httpx.AsyncClient if async_ else httpx.Client
+    return {"http_client": cls(limits=limits, timeout=timeout)}
+
+def get_openai_client(api_key: Optional[str], base_url: Optional[str] = None, async_: bool = False,
+                      pool_size: Optional[int] = None):
+    """`pool_size` raises the connection pool above POOL_SIZE (e.g. a self-hosted server
+    that takes many concurrent requests); the first caller for a key fixes it."""
+    import openai
+    def factory():
+        cls = openai.AsyncOpenAI if async_ else openai.OpenAI
+        return cls(api_key=api_key, base_url=base_url, **_httpx_options(async_, pool_size))
+    key = ("openai", api_key, base_url, async_)
+    return _get_or_create_async(key, factory) if async_ else _get_or_create(key, factory)
+
+def get_anthropic_client(api_key: Optional[str], base_url: Optional[str] = None, async_: bool = False):
+    import anthropic
+    def factory():
+        cls = anthropic.AsyncAnthropic if async_ else anthropic.Anthropic
+        return cls(api_key=api_key, base_url=base_url, **_httpx_options(async_))
+    key = ("anthropic", api_key, base_url, async_)
+    return _get_or_create_async(key, factory) if async_ else _get_or_create(key, factory)
+
+def get_google_model(api_key: str, model: str):
+    """
+    genai keeps one global transport configured by genai.configure(); we configure
+    it once per key and share a GenerativeModel per model.
+    """
+    import google.generativeai as genai
+    def configure():
+        genai.configure(api_key=api_key)
+        return api_key
+    _get_or_create(("google-config", api_key), configure)
+    return _get_or_create(("google", api_key, model), lambda: genai.GenerativeModel(model))
+
+def get_http_session(base_url: str) -> requests.Session:
+    """Keep-alive requests.Session for plain HTTP providers (Ollama)."""
+    def factory():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    return _get_or_create(("http", base_url), factory)
+
+def get_async_http_client(base_url: str):
+    """
+    Keep-alive httpx.AsyncClient for plain HTTP providers (Ollama), one per event loop.
+    At most `pool_size` requests per server are in flight; the rest queue for a connection.
+    """
+    import httpx
+    def factory():
+        limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+        return httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT))
+    return _get_or_create_async(("http-async", base_url), factory)
+
+def http_timeout() -> Tuple[float, float]:
+    """(connect, read) timeout tuple for requests."""
+    return (CONNECT_TIMEOUT, TIMEOUT)
+
+class Endpoint:
+    """One server of an EndpointPool, with its own keep-alive session."""
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.session = get_http_session(self.url)
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.healthy = True
+
+class EndpointPool:
+    """
+    Spreads requests over several equivalent servers. acquire() returns the healthy
+    endpoint with the fewest outstanding requests; release(ok=False) marks it down
+    until a health check (GET `health_path`) succeeds again. With more than one URL
+    a daemon thread runs the checks every `health_interval` seconds. If every
+    endpoint is down, all of them are eligible again (better than failing outright).
+    """
+    def __init__(self, urls: Sequence[str], health_interval: Optional[float] = 30.0,
+                 health_path: str = "/api/version"):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one URL")
+        self.endpoints: List[Endpoint] = [Endpoint(u) for u in urls]
+        self.health_interval = health_interval
+        self.health_path = health_path
+        self.failovers = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker = None
+        if health_interval and len(self.endpoints) > 1:
+            self._checker = threading.Thread(target=self._check_loop, daemon=True,
+                                             name="endpoint-health")
+            self._checker.start()
+
+    def acquire(self, exclude: Sequence[str] = ()) -> Optional[Endpoint]:
+        """Least-outstanding healthy endpoint not in `exclude`; None if all were excluded."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.url not in exclude]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy] or candidates
+            endpoint = min(healthy, key=lambda e: e.outstanding)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, ok: bool = True) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.served += 1
+            else:
+                endpoint.failures += 1
+                endpoint.healthy = False
+
+    def count_failover(self) -> None:
+        with self._lock:
+            self.failovers += 1
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        try:
+            r = endpoint.session.get(endpoint.url + self.health_path,
+                                     timeout=(CONNECT_TIMEOUT, CONNECT_TIMEOUT))
+            return r.ok
+        except requests.RequestException:
+            return False
+
+    def check(self) -> None:
+        """Probe every endpoint and update its health."""
+        for endpoint in self.endpoints:
+            healthy = self.probe(endpoint)
+            with self._lock:
+                endpoint.healthy = healthy
+
+    def _check_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.check()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        out = {"failovers": self.failovers,
+               "healthy": sum(e.healthy for e in self.endpoints)}
+        for e in self.endpoints:
+            out[f"{e.url}:served"] = e.served
+            out[f"{e.url}:failures"] = e.failures
+        return out
+
+def get_endpoint_pool(urls: Sequence[str], health_interval: Optional[float] = 30.0) -> EndpointPool:
+    """Process-wide pool per URL list, so outstanding counts cover every agent."""
+    urls = tuple(u.rstrip("/") for u in urls)
+    return _get_or_create(("pool", urls), lambda: EndpointPool(urls, health_interval))
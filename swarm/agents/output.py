@@ -0,0 +1,69 @@
+"""
+Control del largo de las respuestas: tope de tokens y stop sequences por agente,
+traducidos al parámetro nativo de cada proveedor (AIRepository.limit_output), y un
+reporte de cuántas respuestas se cortaron por el tope y cuántas siguieron siendo
+turnos usables, para ajustar el tope más bajo que no rompe las ofertas.
+"""
+import threading
+from typing import Dict
+from .base import current_agent, current_negotiation
+from .repositories import AIRepository, RepositoryWrapper, current_completion
+from .router import validate_reply
+
+class OutputReportRepository(RepositoryWrapper):
+    """
+    Counts, per agent, the replies the provider cut at the output cap (as reported
+    through current_completion) and the replies that were still usable turns
+    (validate_reply). Replies served from a cache or a coalesced call carry no
+    provider report and count as not truncated.
+    """
+    stats_name = "output"
+
+    def __init__(self, inner: AIRepository):
+        super().__init__(inner)
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _record(self, completion: Dict, out: str) -> None:
+        label = f"{current_agent.get() or self.inner.provider}/{getattr(self.inner, 'model', None)}"
+        usable = validate_reply(out, current_negotiation.get()) is None
+        with self._lock:
+            counts = self.counts.setdefault(label, {"calls": 0, "truncated": 0, "truncated_usable": 0,
+                                                    "usable": 0, "chars": 0})
+            counts["calls"] += 1
+            counts["usable"] += usable
+            counts["chars"] += len(out)
+            if completion.get("truncated"):
+                counts["truncated"] += 1
+                counts["truncated_usable"] += usable
+
+    def run(self, prompt: str, **kwargs) -> str:
+        completion = {}
+        token = current_completion.set(completion)
+        try:
+            out = self.inner.run(prompt, **kwargs)
+        finally:
+            current_completion.reset(token)
+        self._record(completion, out)
+        return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        completion = {}
+        token = current_completion.set(completion)
+        try:
+            out = await self.inner.arun(prompt, **kwargs)
+        finally:
+            current_completion.reset(token)
+        self._record(completion, out)
+        return out
+
+    def stats(self) -> Dict[str, float]:
+        out = {}
+        with self._lock:
+            for label, c in self.counts.items():
+                out[f"{label}:calls"] = c["calls"]
+                out[f"{label}:truncated_rate"] = round(c["truncated"] / c["calls"], 3)
+                out[f"{label}:truncated_usable"] = c["truncated_usable"]
+                out[f"{label}:usable_rate"] = round(c["usable"] / c["calls"], 3)
+                out[f"{label}:avg_chars"] = round(c["chars"] / c["calls"], 1)
+        return out
@@ -1,34 +1,430 @@
 from abc import ABC, abstractmethod
-import requests, openai, os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import asyncio, json, threading, time
+import httpx, requests, openai, os
+from .clients import (get_openai_client, get_anthropic_client, get_google_model,
+                      get_async_http_client, get_endpoint_pool, http_timeout)
+from .base import current_agent, current_negotiation
+from ..core.scheduler import IncrementalTermExtractor
+from ..core.structured import response_format
+
+# Lo que el proveedor sabe de la respuesta además del texto (p.ej. si se cortó por
+# max tokens). La capa interesada fija un dict vacío antes de llamar y el proveedor
+# lo completa; al ser mutable también llega desde hilos y tareas con contexto copiado.
+current_completion: ContextVar[Optional[Dict]] = ContextVar("current_completion", default=None)
+
+def report_completion(**info) -> None:
+    """Record details of the current completion for the layer that asked for them."""
+    completion = current_completion.get()
+    if completion is not None:
+        completion.update(info)
 
 class AIRepository(ABC):
+    provider: str = "custom"
+    # Parámetros de generación fijos del repositorio (forman parte de la clave de caché)
+    generation_params: Dict = {}
+
     @abstractmethod
-    def run(self, prompt: str) -> str: ...
+    def run(self, prompt: str, system: Optional[str] = None) -> str:
+        """Complete `prompt`. `system` is an optional stable prefix (instructions,
+        constraints) that providers with prompt caching can reuse across calls.
+        Providers with structured output also take `schema`, a JSON schema dict; the
+        reply is then a JSON document that follows it."""
+
+    @property
+    def stats_source(self):
+        """Object whose identity tells runtime_stats() that two layers share counters."""
+        return self
+
+    def cache_context(self) -> Dict:
+        """Inputs outside the request that the reply depends on; they join the cache
+        and coalescing keys. Providers answering from the request alone return {}."""
+        return {}
+
+    def limit_output(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> None:
+        """Cap the completion length and set stop sequences with the provider's native
+        parameters (part of generation_params). Providers without them ignore it."""
+
+    def warm_up(self) -> None:
+        """Pay cold-start costs (handshakes, model load, client setup) before a run.
+        The default sends a tiny completion; providers with a cheaper preload override it."""
+        self.run("Reply with OK.")
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        """Async variant of run(). Providers with native async clients override it;
+        the default runs the blocking call in a worker thread."""
+        return await asyncio.to_thread(self.run, prompt, **kwargs)
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Yield the completion in chunks. Closing the generator early stops the
+        request; providers without streaming yield the whole answer at once."""
+        yield self.run(prompt, **kwargs)
+
+    async def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        """Async variant of stream(); by default pulls the sync stream from a thread."""
+        chunks = self.stream(prompt, **kwargs)
+        done = object()
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, chunks, done)
+                if chunk is done:
+                    break
+                yield chunk
+        finally:
+            chunks.close()
 
 class OpenAIRepository(AIRepository):
-    def __init__(self, model: str, api_key: str):
+    provider = "openai"
+
+    def __init__(self, model: str, api_key: str, base_url: Optional[str] = None,
+                 pool_size: Optional[int] = None):
         self.model = model
-        self.client = openai.OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.generation_params = {"temperature": 0}
+        self.client = get_openai_client(api_key, base_url, pool_size=pool_size)
+
+    @property
+    def aclient(self):
+        return get_openai_client(self.api_key, self.base_url, async_=True, pool_size=self.pool_size)
+
+    def limit_output(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> None:
+        if max_tokens:
+            self.generation_params["max_tokens"] = max_tokens
+        if stop:
+            self.generation_params["stop"] = list(stop)[:4]         # la API acepta hasta 4
+
+    def _params(self, schema: Optional[Dict]) -> Dict:
+        if not schema:
+            return self.generation_params
+        return {**self.generation_params, "response_format": response_format(schema)}
 
-    def run(self, prompt: str) -> str:
+    @staticmethod
+    def _messages(prompt: str, system: Optional[str]):
+        # OpenAI cachea automáticamente prefijos idénticos: el system va primero
+        messages = [{"role": "system", "content": system}] if system else []
+        return messages + [{"role": "user", "content": prompt}]
+
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
         resp = self.client.chat.completions.create(
             model=self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0)
+            messages=self._messages(prompt, system),
+            **self._params(schema))
+        report_completion(truncated=resp.choices[0].finish_reason == "length")
+        return resp.choices[0].message.content.strip()
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        resp = await self.aclient.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, system),
+            **self._params(schema))
+        report_completion(truncated=resp.choices[0].finish_reason == "length")
         return resp.choices[0].message.content.strip()
 
+    def stream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> Iterator[str]:
+        chunks = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, system),
+            stream=True,
+            **self._params(schema))
+        try:
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    report_completion(truncated=chunk.choices[0].finish_reason == "length")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            chunks.close()
+
+    async def astream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> AsyncIterator[str]:
+        chunks = await self.aclient.chat.completions.create(
+            model=self.model,
+            messages=self._messages(prompt, system),
+            stream=True,
+            **self._params(schema))
+        try:
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    report_completion(truncated=chunk.choices[0].finish_reason == "length")
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await chunks.close()
+
+class OpenAICompatibleRepository(OpenAIRepository):
+    """
+    Any server that speaks the OpenAI chat API (vLLM, TGI, llama.cpp server, LM Studio...).
+    The key is optional. `max_concurrency` caps the requests in flight to `base_url`
+    across every agent that uses it, so a continuous-batching server is kept busy
+    without being flooded; the connection pool is sized to match.
+    """
+    provider = "openai_compatible"
+
+    def __init__(self, model: str, base_url: str, api_key: Optional[str] = None,
+                 max_concurrency: Optional[int] = None):
+        # El cliente de openai exige una key aunque el servidor no la use
+        super().__init__(model, api_key or "not-needed", base_url.rstrip("/"), pool_size=max_concurrency)
+        self.limiter = (get_concurrency_limiter(self.provider, self.base_url, max_concurrency)
+                        if max_concurrency else None)
+
+    def _slot(self):
+        return self.limiter.slot() if self.limiter else nullcontext()
+
+    def _aslot(self):
+        return self.limiter.aslot() if self.limiter else nullcontext()
+
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        with self._slot():
+            return super().run(prompt, system, schema)
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        async with self._aslot():
+            return await super().arun(prompt, system, schema)
+
+    def stream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> Iterator[str]:
+        with self._slot():
+            yield from super().stream(prompt, system, schema)
+
+    async def astream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> AsyncIterator[str]:
+        async with self._aslot():
+            async for chunk in super().astream(prompt, system, schema):
+                yield chunk
+
+class OllamaSession:
+    """
+    Chat transcript of one agent in one negotiation. The first prompt is sent whole;
+    after that each turn only appends the new messages (the agent's own replies as
+    assistant, the counterpart's as user), so the transcript is an append-only prefix
+    and Ollama reuses its KV cache instead of re-reading the whole conversation.
+    It is rebuilt from negotiation.turns on every call, so turns answered by other
+    layers (cache, coalescing, another tier) are not lost.
+    """
+    def __init__(self, agent_id: str, first_prompt: str, start: int):
+        self.agent_id = agent_id
+        self.first_prompt = first_prompt
+        self.start = start          # turnos ya incluidos en first_prompt
+
+    def messages(self, system: Optional[str], negotiation) -> List[Dict]:
+        messages = [{"role": "system", "content": system}] if system else []
+        messages.append({"role": "user", "content": self.first_prompt})
+        pending: List[str] = []
+        for turn in negotiation.turns[self.start:]:
+            if turn.sender_id != self.agent_id:
+                pending.append(f"{turn.sender_id}: {turn.message}")
+                continue
+            if pending:
+                messages.append({"role": "user", "content": "\n".join(pending)})
+                pending = []
+            messages.append({"role": "assistant", "content": turn.message})
+        if len(messages) > 1 + bool(system):
+            # Sólo el último mensaje lleva el estado del turno: el resto no cambia
+            rounds_left = negotiation.max_turns - len(negotiation.turns) // 2
+            pending.append(f"\nRounds left: {rounds_left}")
+            messages.append({"role": "user", "content": "\n".join(pending)})
+        return messages
+
 class OllamaRepository(AIRepository):
-    def __init__(self, model: str = "llama3"):
+    """
+    Ollama /api/generate. With several `endpoints` (equivalent servers) each call goes
+    to the least busy healthy one and fails over to the next on connection errors,
+    timeouts or 5xx. arun/astream use a native httpx.AsyncClient, so async swarms are
+    not capped by the default thread pool (only by http.pool_size per server).
+
+    `keep_alive` keeps the model loaded between turns and `options` (num_ctx,
+    num_predict...) go with every request. With `sessions`, agent turns use /api/chat
+    with one OllamaSession per (agent, negotiation), so prompt evaluation covers only
+    the messages added since the previous turn. At most `max_sessions` are kept, least
+    recently used first out: closed negotiations are never touched again, so they go
+    before any open one.
+    """
+    provider = "ollama"
+    stats_name = "endpoints"
+
+    def __init__(self, model: str = "llama3", base_url: str = "http://localhost:11434",
+                 endpoints: Optional[Sequence[str]] = None, health_interval: Optional[float] = 30.0,
+                 keep_alive: Optional[Union[str, float]] = None, options: Optional[Dict] = None,
+                 sessions: bool = False, max_sessions: int = 1024):
         self.model = model
-    def run(self, prompt: str) -> str:
-        r = requests.post("http://localhost:11434/api/generate",
-                          json={"model": self.model,
-                                "prompt": prompt,
-                                "stream": False})
-        r.raise_for_status()
-        return r.json()["response"].strip()
+        self.pool = get_endpoint_pool(endpoints or [base_url], health_interval)
+        self.base_url = self.pool.endpoints[0].url
+        self.session = self.pool.endpoints[0].session
+        self.keep_alive = keep_alive
+        self.generation_params = {"options": dict(options)} if options else {}
+        self.sessions_enabled = sessions
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[Tuple[str, str], OllamaSession]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def _chat_session(self, prompt: str) -> Optional[Tuple[OllamaSession, object]]:
+        """(session, negotiation) for the agent turn being generated, if sessions apply."""
+        negotiation, agent_id = current_negotiation.get(), current_agent.get()
+        if not self.sessions_enabled or negotiation is None or agent_id is None:
+            return None
+        with self._sessions_lock:
+            key = (agent_id, negotiation.id)
+            session = self.sessions.get(key)
+            if session is None:
+                session = self.sessions[key] = OllamaSession(agent_id, prompt, len(negotiation.turns))
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+            self.sessions.move_to_end(key)
+            return session, negotiation
+
+    def _request(self, prompt: str, system: Optional[str], schema: Optional[Dict],
+                 stream: bool) -> Tuple[str, Dict]:
+        """(API path, payload) for one call."""
+        chat = self._chat_session(prompt)
+        if chat:
+            session, negotiation = chat
+            path, payload = "/api/chat", {"model": self.model, "stream": stream,
+                                          "messages": session.messages(system, negotiation)}
+        else:
+            path, payload = "/api/generate", {"model": self.model, "prompt": prompt, "stream": stream}
+            if system:
+                payload["system"] = system
+        payload.update(self.generation_params)
+        if schema:
+            payload["format"] = schema          # salida estructurada nativa de Ollama
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return path, payload
+
+    def limit_output(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> None:
+        options = dict(self.generation_params.get("options") or {})
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        if stop:
+            options["stop"] = list(stop)
+        if options:
+            self.generation_params = {**self.generation_params, "options": options}
+
+    def warm_up(self) -> None:
+        # Un /api/generate sin prompt sólo carga el modelo; se hace en cada servidor
+        payload = {"model": self.model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        for endpoint in self.pool.endpoints:
+            r = endpoint.session.post(f"{endpoint.url}/api/generate", json=payload, timeout=http_timeout())
+            r.raise_for_status()
+
+    @staticmethod
+    def _text(data: Dict) -> str:
+        # /api/generate responde en `response`, /api/chat en `message.content`
+        if data.get("done"):
+            report_completion(truncated=data.get("done_reason") == "length")
+        return data.get("response") or (data.get("message") or {}).get("content") or ""
+
+    def _failed(self, endpoint, tried: List[str], error: Exception) -> None:
+        """Release `endpoint` after a failed request; re-raise unless another endpoint can take it."""
+        # Conexión, timeout o 5xx: culpa del servidor → failover; 4xx: culpa de la request
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        server_fault = status is None or status >= 500
+        self.pool.release(endpoint, ok=not server_fault)
+        tried.append(endpoint.url)
+        if not server_fault or len(tried) == len(self.pool.endpoints):
+            raise error
+        self.pool.count_failover()
+
+    def _post(self, path: str, payload: Dict, stream: bool = False):
+        """(endpoint, response) of a successful POST; the caller releases the endpoint."""
+        tried = []
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            r = None
+            try:
+                r = endpoint.session.post(f"{endpoint.url}{path}", json=payload,
+                                          timeout=http_timeout(), stream=stream)
+                r.raise_for_status()
+                return endpoint, r
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                if r is not None:
+                    r.close()
+                self._failed(endpoint, tried, e)
+            except BaseException:
+                self.pool.release(endpoint)
+                raise
+
+    async def _apost(self, path: str, payload: Dict, stream: bool = False):
+        """Async _post over the per-loop httpx client of each endpoint."""
+        tried = []
+        while True:
+            endpoint = self.pool.acquire(exclude=tried)
+            client = get_async_http_client(endpoint.url)
+            r = None
+            try:
+                request = client.build_request("POST", f"{endpoint.url}{path}", json=payload)
+                r = await client.send(request, stream=stream)
+                r.raise_for_status()
+                return endpoint, r
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if r is not None:
+                    await r.aclose()
+                self._failed(endpoint, tried, e)
+            except BaseException:
+                self.pool.release(endpoint)
+                raise
+
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        endpoint, r = self._post(*self._request(prompt, system, schema, stream=False))
+        try:
+            return self._text(r.json()).strip()
+        finally:
+            self.pool.release(endpoint)
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        endpoint, r = await self._apost(*self._request(prompt, system, schema, stream=False))
+        try:
+            return self._text(r.json()).strip()
+        finally:
+            self.pool.release(endpoint)
+
+    def stream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> Iterator[str]:
+        endpoint, r = self._post(*self._request(prompt, system, schema, stream=True), stream=True)
+        try:
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                text = self._text(data)
+                if text:
+                    yield text
+                if data.get("done"):
+                    break
+        finally:
+            # Cerrar la conexión corta la generación en el servidor
+            r.close()
+            self.pool.release(endpoint)
+
+    async def astream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> AsyncIterator[str]:
+        endpoint, r = await self._apost(*self._request(prompt, system, schema, stream=True), stream=True)
+        try:
+            async for line in r.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                text = self._text(data)
+                if text:
+                    yield text
+                if data.get("done"):
+                    break
+        finally:
+            await r.aclose()
+            self.pool.release(endpoint)
+
+    @property
+    def stats_source(self):
+        return self.pool
+
+    def stats(self) -> Dict[str, int]:
+        return self.pool.stats()
 
 class AnthropicRepository(AIRepository):
+    provider = "anthropic"
+
     def __init__(self, model: str, api_key: str):
         try:
             import anthropic
@@ -36,18 +432,81 @@ class AnthropicRepository(AIRepository):
             raise ImportError("anthropic library is required. Install with: pip install anthropic")
         
         self.model = model
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.api_key = api_key
+        self.generation_params = {"max_tokens": 1000, "temperature": 0}
+        self.client = get_anthropic_client(api_key)
 
-    def run(self, prompt: str) -> str:
-        response = self.client.messages.create(
-            model=self.model,
-            max_tokens=1000,
-            temperature=0,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return response.content[0].text.strip()
+    @property
+    def aclient(self):
+        return get_anthropic_client(self.api_key, async_=True)
+
+    def limit_output(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> None:
+        if max_tokens:
+            self.generation_params["max_tokens"] = max_tokens
+        if stop:
+            self.generation_params["stop_sequences"] = list(stop)
+
+    def _request(self, prompt: str, system: Optional[str], schema: Optional[Dict]) -> Dict:
+        request = {"model": self.model,
+                   "messages": [{"role": "user", "content": prompt}],
+                   **self.generation_params}
+        if system:
+            # Marca el prefijo estable como cacheable (prompt caching de Anthropic)
+            request["system"] = [{"type": "text", "text": system,
+                                  "cache_control": {"type": "ephemeral"}}]
+        if schema:
+            # Salida estructurada: una única tool obligatoria cuyo input es la respuesta
+            request["tools"] = [{"name": "reply", "description": "Your reply in this negotiation.",
+                                 "input_schema": schema}]
+            request["tool_choice"] = {"type": "tool", "name": "reply"}
+        return request
+
+    @staticmethod
+    def _text(response) -> str:
+        block = response.content[0]
+        if block.type == "tool_use":
+            return json.dumps(block.input)
+        return block.text.strip()
+
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        response = self.client.messages.create(**self._request(prompt, system, schema))
+        report_completion(truncated=response.stop_reason == "max_tokens")
+        return self._text(response)
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        response = await self.aclient.messages.create(**self._request(prompt, system, schema))
+        report_completion(truncated=response.stop_reason == "max_tokens")
+        return self._text(response)
+
+    def stream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> Iterator[str]:
+        events = self.client.messages.create(stream=True, **self._request(prompt, system, schema))
+        try:
+            for event in events:
+                if event.type == "message_delta":
+                    report_completion(truncated=event.delta.stop_reason == "max_tokens")
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    yield event.delta.text
+                elif event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                    yield event.delta.partial_json
+        finally:
+            events.close()
+
+    async def astream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> AsyncIterator[str]:
+        events = await self.aclient.messages.create(stream=True, **self._request(prompt, system, schema))
+        try:
+            async for event in events:
+                if event.type == "message_delta":
+                    report_completion(truncated=event.delta.stop_reason == "max_tokens")
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    yield event.delta.text
+                elif event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                    yield event.delta.partial_json
+        finally:
+            await events.close()
 
 class GoogleRepository(AIRepository):
+    provider = "google"
+
     def __init__(self, model: str, api_key: str):
         try:
             import google.generativeai as genai
@@ -55,14 +514,342 @@ class GoogleRepository(AIRepository):
             raise ImportError("google-generativeai library is required. Install with: pip install google-generativeai")
         
         self.model = model
-        genai.configure(api_key=api_key)
-        self.client = genai.GenerativeModel(model)
+        self.generation_params = {"temperature": 0}
+        self.client = get_google_model(api_key, model)
+
+    def limit_output(self, max_tokens: Optional[int] = None, stop: Optional[List[str]] = None) -> None:
+        if max_tokens:
+            self.generation_params["max_output_tokens"] = max_tokens
+        if stop:
+            self.generation_params["stop_sequences"] = list(stop)
+
+    def _config(self, schema: Optional[Dict]) -> Dict:
+        # Gemini sólo acepta un subconjunto de JSON schema: se pide JSON y el formato
+        # va en las instrucciones del prompt
+        if not schema:
+            return self.generation_params
+        return {**self.generation_params, "response_mime_type": "application/json"}
 
-    def run(self, prompt: str) -> str:
+    @staticmethod
+    def _report(response) -> None:
+        candidates = getattr(response, "candidates", None) or []
+        if candidates:
+            reason = getattr(candidates[0].finish_reason, "name", candidates[0].finish_reason)
+            report_completion(truncated=reason == "MAX_TOKENS")
+
+    @staticmethod
+    def _contents(prompt: str, system: Optional[str]) -> str:
+        # Gemini fija system_instruction al crear el modelo; aquí va como prefijo
+        return f"{system}\n\n{prompt}" if system else prompt
+
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
         response = self.client.generate_content(
-            prompt,
-            generation_config={"temperature": 0}
+            self._contents(prompt, system),
+            generation_config=self._config(schema)
+        )
+        self._report(response)
+        return response.text.strip()
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        response = await self.client.generate_content_async(
+            self._contents(prompt, system),
+            generation_config=self._config(schema)
         )
+        self._report(response)
         return response.text.strip()
 
-    ... 
\ No newline at end of file
+    def stream(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> Iterator[str]:
+        response = self.client.generate_content(
+            self._contents(prompt, system),
+            generation_config=self._config(schema),
+            stream=True
+        )
+        for chunk in response:
+            self._report(chunk)
+            if chunk.text:
+                yield chunk.text
+
+# --------------------------------------------------------------------------- #
+#  Wrappers: capas que se apilan sobre un repositorio concreto
+# --------------------------------------------------------------------------- #
+class RepositoryWrapper(AIRepository):
+    """Base for layers that decorate another repository; unknown attributes
+    (model, provider, client...) are read from the wrapped one."""
+    def __init__(self, inner: AIRepository):
+        self.inner = inner
+
+    def __getattr__(self, name):
+        # Sólo se llama si el atributo no existe en el wrapper
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    # AIRepository los define como atributos de clase, así que __getattr__ no los
+    # alcanza: se delegan explícitamente para que la clave de caché vea el proveedor real
+    @property
+    def provider(self) -> str:
+        return self.inner.provider
+
+    @property
+    def generation_params(self) -> Dict:
+        return self.inner.generation_params
+
+    def cache_context(self) -> Dict:
+        return self.inner.cache_context()
+
+    def run(self, prompt: str, **kwargs) -> str:
+        return self.inner.run(prompt, **kwargs)
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        return await self.inner.arun(prompt, **kwargs)
+
+    def stream(self, prompt: str, **kwargs) -> Iterator[str]:
+        return self.inner.stream(prompt, **kwargs)
+
+    def astream(self, prompt: str, **kwargs) -> AsyncIterator[str]:
+        return self.inner.astream(prompt, **kwargs)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token), good enough for client-side pacing."""
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """
+    Bucket that refills `per_minute` units per minute up to `capacity`.
+
+    take() never blocks: it withdraws the units right away (the level may go
+    negative) and returns how long the caller must wait before using them, so the
+    same bucket serves threads (time.sleep) and coroutines (asyncio.sleep).
+    """
+    def __init__(self, per_minute: float, capacity: Optional[float] = None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: float) -> float:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one (provider, model)."""
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request plus `tokens`; returns the seconds to wait before sending."""
+        with self._lock:
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.take(1))
+            if self.tokens and tokens:
+                wait = max(wait, self.tokens.take(tokens))
+            return wait
+
+    def consume(self, tokens: int) -> None:
+        """Charge tokens only known after the call (the completion)."""
+        if self.tokens and tokens:
+            with self._lock:
+                self.tokens.take(tokens)
+
+    def acquire(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+_rate_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider: str, model: str,
+                     rpm: Optional[float] = None, tpm: Optional[float] = None) -> RateLimiter:
+    """Process-wide limiter for (provider, model); the first caller fixes its quotas."""
+    with _rate_limiters_lock:
+        key = (provider, model)
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(rpm=rpm, tpm=tpm)
+        return _rate_limiters[key]
+
+class ConcurrencyLimiter:
+    """
+    Caps calls in flight. Threads block in slot(), coroutines await aslot(); both
+    share the same count, so one limiter can be used from any thread or event loop.
+    """
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._cond:
+                    if future.done() and not future.cancelled():
+                        self._wake()        # nos despertaron: pasar el turno a otro
+                    elif (loop, future) in self._waiters:
+                        self._waiters.remove((loop, future))
+                raise
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._wake()
+
+    def set_limit(self, limit: int) -> None:
+        with self._cond:
+            self.limit = limit
+            self._wake()
+
+    def _wake(self) -> None:
+        """Wake as many waiters as there are free slots (lock held)."""
+        free = self.limit - self.in_flight
+        if free <= 0:
+            return
+        self._cond.notify(free)
+        for _ in range(min(free, len(self._waiters))):
+            loop, future = self._waiters.popleft()
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+_concurrency_limiters: Dict[Tuple[str, str], ConcurrencyLimiter] = {}
+
+def get_concurrency_limiter(provider: str, key: str, limit: int) -> ConcurrencyLimiter:
+    """Process-wide limiter for (provider, endpoint or model); the first caller fixes the limit."""
+    with _rate_limiters_lock:
+        return _concurrency_limiters.setdefault((provider, key), ConcurrencyLimiter(limit))
+
+class RateLimitedRepository(RepositoryWrapper):
+    """Paces calls through a (usually shared) RateLimiter before hitting the provider."""
+    def __init__(self, inner: AIRepository, limiter: RateLimiter):
+        super().__init__(inner)
+        self.limiter = limiter
+
+    def run(self, prompt: str, **kwargs) -> str:
+        self.limiter.acquire(estimate_tokens(prompt + (kwargs.get("system") or "")))
+        out = self.inner.run(prompt, **kwargs)
+        self.limiter.consume(estimate_tokens(out))
+        return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        await self.limiter.aacquire(estimate_tokens(prompt + (kwargs.get("system") or "")))
+        out = await self.inner.arun(prompt, **kwargs)
+        self.limiter.consume(estimate_tokens(out))
+        return out
+
+class StreamingRepository(RepositoryWrapper):
+    """
+    Streams the completion and stops it as soon as the reply is settled: a complete
+    offer is visible (same patterns as extract_terms_from_message) or `max_chars`
+    have arrived. Closing the stream stops generation on the provider side.
+    """
+    stats_name = "streaming"
+
+    def __init__(self, inner: AIRepository, max_chars: Optional[int] = None, stop_on_terms: bool = True):
+        super().__init__(inner)
+        self.max_chars = max_chars
+        self.stop_on_terms = stop_on_terms
+        self.calls = 0
+        self.early_stops = 0
+        self.length_stops = 0
+        self.chars = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation_params(self) -> Dict:
+        # Cortar la respuesta cambia el resultado: forma parte de la clave de caché
+        return {**self.inner.generation_params,
+                "max_chars": self.max_chars, "stop_on_terms": self.stop_on_terms}
+
+    def _consume(self, extractor: IncrementalTermExtractor, chunk: str) -> bool:
+        """Feed one chunk; True when the rest of the completion is not needed."""
+        terms = extractor.feed(chunk)
+        if self.stop_on_terms and terms:
+            self._count("early_stops")
+            return True
+        if self.max_chars and len(extractor.text) >= self.max_chars:
+            extractor.text = extractor.text[:self.max_chars]
+            self._count("length_stops")
+            return True
+        return False
+
+    def _finish(self, extractor: IncrementalTermExtractor) -> str:
+        with self._lock:
+            self.calls += 1
+            self.chars += len(extractor.text)
+        return extractor.text.strip()
+
+    def _count(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def run(self, prompt: str, **kwargs) -> str:
+        extractor = IncrementalTermExtractor(current_negotiation.get())
+        chunks = self.inner.stream(prompt, **kwargs)
+        try:
+            for chunk in chunks:
+                if self._consume(extractor, chunk):
+                    break
+        finally:
+            chunks.close()
+        return self._finish(extractor)
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        extractor = IncrementalTermExtractor(current_negotiation.get())
+        chunks = self.inner.astream(prompt, **kwargs)
+        try:
+            async for chunk in chunks:
+                if self._consume(extractor, chunk):
+                    break
+        finally:
+            await chunks.aclose()
+        return self._finish(extractor)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "early_stops": self.early_stops,
+                "length_stops": self.length_stops, "chars": self.chars}
@@ -0,0 +1,586 @@
+"""
+Resiliencia de las llamadas al proveedor: reintentos con backoff exponencial y
+jitter, requests "hedged" (un duplicado tras un retardo basado en el p95 observado,
+gana el primero que responde), deadline por llamada, circuit breaker por
+(provider, model) que corta el tráfico a un proveedor degradado y control de
+concurrencia adaptativo (AIMD) por proveedor.
+"""
+import asyncio, contextvars, random, threading, time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+import httpx, requests
+from .repositories import AIRepository, ConcurrencyLimiter, RepositoryWrapper
+
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+class DeadlineExceeded(TimeoutError):
+    """The call did not finish within its configured deadline."""
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    # openai/anthropic: .status_code; requests.HTTPError: .response.status_code; google: .code
+    code = getattr(exc, "status_code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    if code is None and isinstance(getattr(exc, "code", None), int):
+        code = exc.code
+    return code
+
+def is_transient(exc: BaseException) -> bool:
+    """Errors worth retrying: throttling, server errors, timeouts and dropped connections."""
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS or code >= 500
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, httpx.TransportError,
+                        ConnectionError, TimeoutError)):
+        return True
+    # openai.APIConnectionError / APITimeoutError y sus equivalentes en anthropic
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+class LatencyTracker:
+    """Sliding window of recent call latencies (seconds)."""
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+_trackers: Dict[Tuple[str, str], LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+
+def get_latency_tracker(provider: str, model: str) -> LatencyTracker:
+    """Process-wide tracker for (provider, model), so hedging learns from every agent."""
+    with _trackers_lock:
+        return _trackers.setdefault((provider, model), LatencyTracker())
+
+def _parse_hedge(hedge_after: Union[None, float, str]) -> Tuple[Optional[float], Optional[float]]:
+    """`2.5` → fixed delay; `"p95"` → quantile 0.95 of observed latency."""
+    if hedge_after is None or hedge_after is False:
+        return None, None
+    if isinstance(hedge_after, str) and hedge_after.lower().startswith("p"):
+        return None, float(hedge_after[1:]) / 100.0
+    return float(hedge_after), None
+
+class ResilientRepository(RepositoryWrapper):
+    """
+    Retries transient errors (429, 5xx, timeouts, dropped connections) up to
+    `retries` times, sleeping a full-jitter exponential backoff (or the
+    Retry-After the provider asked for). With `hedge_after`, a duplicate request
+    is sent if the first has not answered after that delay (seconds, or a latency
+    quantile like "p95" once `hedge_min_samples` calls have been seen); the first
+    reply wins and the other is cancelled. `deadline` bounds the whole call,
+    retries included, and raises DeadlineExceeded.
+
+    Sync calls that hedge or have a deadline run in a daemon thread; a request
+    abandoned there cannot be interrupted and finishes in the background.
+    """
+    stats_name = "resilience"
+
+    def __init__(self, inner: AIRepository, retries: int = 2, backoff_base: float = 0.5,
+                 backoff_max: float = 8.0, deadline: Optional[float] = None,
+                 hedge_after: Union[None, float, str] = None, hedge_min_samples: int = 20,
+                 tracker: Optional[LatencyTracker] = None, clock=time.monotonic,
+                 rng: Optional[random.Random] = None):
+        super().__init__(inner)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.hedge_delay_s, self.hedge_quantile = _parse_hedge(hedge_after)
+        self.hedge_min_samples = hedge_min_samples
+        self.tracker = tracker if tracker is not None else LatencyTracker()
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.calls = 0
+        self.retried = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadlines = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, inner: AIRepository, cfg: Dict,
+                    tracker: Optional[LatencyTracker] = None) -> "ResilientRepository":
+        return cls(inner,
+                   retries           = cfg.get("retries", 2),
+                   backoff_base      = cfg.get("backoff_base", 0.5),
+                   backoff_max       = cfg.get("backoff_max", 8.0),
+                   deadline          = cfg.get("deadline"),
+                   hedge_after       = cfg.get("hedge_after"),
+                   hedge_min_samples = cfg.get("hedge_min_samples", 20),
+                   tracker           = tracker)
+
+    # ---------------------------------------------------------------- #
+    def hedge_delay(self) -> Optional[float]:
+        if self.hedge_quantile is not None:
+            return self.tracker.quantile(self.hedge_quantile, self.hedge_min_samples)
+        return self.hedge_delay_s
+
+    def backoff(self, attempt: int, exc: BaseException) -> float:
+        delay = self.rng.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after(exc) or 0.0)
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - self.clock()
+
+    def _count(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _next_delay(self, attempt: int, exc: Exception, deadline: Optional[float]) -> float:
+        """Backoff before the next attempt, or re-raise when giving up."""
+        if attempt >= self.retries or not is_transient(exc):
+            self._count("failures")
+            raise exc
+        delay = self.backoff(attempt, exc)
+        remaining = self._remaining(deadline)
+        if remaining is not None and delay >= remaining:
+            self._count("deadlines")
+            raise DeadlineExceeded(f"deadline of {self.deadline}s exceeded") from exc
+        self._count("retried")
+        return delay
+
+    def _timeout(self, deadline: Optional[float], hedge_at: Optional[float]) -> Optional[float]:
+        """How long to wait for the running attempts before checking again."""
+        times = [t - self.clock() for t in (deadline, hedge_at) if t is not None]
+        return max(0.0, min(times)) if times else None
+
+    # ---------------------------------------------------------------- #
+    def run(self, prompt: str, **kwargs) -> str:
+        self._count("calls")
+        deadline = self.clock() + self.deadline if self.deadline else None
+        for attempt in range(self.retries + 1):
+            try:
+                return self._attempt(prompt, kwargs, deadline)
+            except DeadlineExceeded:
+                self._count("deadlines")
+                raise
+            except Exception as e:
+                time.sleep(self._next_delay(attempt, e, deadline))
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        self._count("calls")
+        deadline = self.clock() + self.deadline if self.deadline else None
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._aattempt(prompt, kwargs, deadline)
+            except DeadlineExceeded:
+                self._count("deadlines")
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._next_delay(attempt, e, deadline))
+
+    def _attempt(self, prompt: str, kwargs: Dict, deadline: Optional[float]) -> str:
+        start = self.clock()
+        delay = self.hedge_delay()
+        if deadline is None and delay is None:
+            out = self.inner.run(prompt, **kwargs)
+            self.tracker.record(self.clock() - start)
+            return out
+
+        hedge_at = start + delay if delay is not None else None
+        futures: List[Future] = [self._spawn(prompt, kwargs)]
+        while True:
+            done, _ = wait(futures, timeout=self._timeout(deadline, hedge_at),
+                           return_when=FIRST_COMPLETED)
+            for f in done:
+                futures.remove(f)
+                if f.exception() is None:
+                    self._won(f.hedge, start)
+                    return f.result()
+                if not futures:
+                    raise f.exception()
+            if done:
+                continue
+            if hedge_at is not None and self.clock() >= hedge_at:
+                self._count("hedges")
+                futures.append(self._spawn(prompt, kwargs, hedge=True))
+                hedge_at = None
+            elif deadline is not None and self.clock() >= deadline:
+                raise DeadlineExceeded(f"deadline of {self.deadline}s exceeded")
+
+    def _spawn(self, prompt: str, kwargs: Dict, hedge: bool = False) -> Future:
+        future = Future()
+        future.hedge = hedge
+        ctx = contextvars.copy_context()        # current_negotiation y demás contextvars
+
+        def target():
+            try:
+                future.set_result(ctx.run(self.inner.run, prompt, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        threading.Thread(target=target, daemon=True).start()
+        return future
+
+    async def _aattempt(self, prompt: str, kwargs: Dict, deadline: Optional[float]) -> str:
+        start = self.clock()
+        delay = self.hedge_delay()
+        hedge_at = start + delay if delay is not None else None
+        primary = asyncio.ensure_future(self.inner.arun(prompt, **kwargs))
+        tasks = {primary: False}
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, timeout=self._timeout(deadline, hedge_at),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    hedge = tasks.pop(t)
+                    if t.exception() is None:
+                        self._won(hedge, start)
+                        return t.result()
+                    if not tasks:
+                        raise t.exception()
+                if done:
+                    continue
+                if hedge_at is not None and self.clock() >= hedge_at:
+                    self._count("hedges")
+                    tasks[asyncio.ensure_future(self.inner.arun(prompt, **kwargs))] = True
+                    hedge_at = None
+                elif deadline is not None and self.clock() >= deadline:
+                    raise DeadlineExceeded(f"deadline of {self.deadline}s exceeded")
+        finally:
+            # El perdedor se cancela: cierra la conexión y corta la generación
+            for t in tasks:
+                t.cancel()
+
+    def _won(self, hedge: bool, start: float) -> None:
+        if hedge:
+            self._count("hedge_wins")
+        self.tracker.record(self.clock() - start)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "retries": self.retried, "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins, "deadlines": self.deadlines,
+                "failures": self.failures}
+
+# --------------------------------------------------------------------------- #
+#  Circuit breaker
+# --------------------------------------------------------------------------- #
+class CircuitOpen(RuntimeError):
+    """The call was refused without reaching the provider because its circuit is open."""
+
+class CircuitBreaker:
+    """
+    Health of one (provider, model), shared by every agent that uses it.
+
+    closed: calls go through and their outcomes fill a window of the last `window`
+    calls. A call is bad if it raised a transient error (see is_transient) or a
+    DeadlineExceeded, or took longer than `slow_after` seconds. Once `min_calls` are
+    in the window and the bad fraction reaches `failure_rate`, the circuit opens.
+    open: calls are refused for `open_for` seconds, then it goes half-open.
+    half_open: up to `half_open_calls` trial calls go through; one good trial closes
+    the circuit with a fresh window, one bad trial opens it again.
+
+    Every state change is appended to `events` as (time, old, new) and passed to
+    each callback in `listeners` as listener(name, old, new).
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str = "", window: int = 20, min_calls: int = 5,
+                 failure_rate: float = 0.5, slow_after: Optional[float] = None,
+                 open_for: float = 30.0, half_open_calls: int = 1, clock=time.monotonic):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_after = slow_after
+        self.open_for = open_for
+        self.half_open_calls = half_open_calls
+        self.clock = clock
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.trials = 0
+        self.outcomes: Deque[bool] = deque(maxlen=window)      # True = llamada mala
+        self.events: List[Tuple[float, str, str]] = []
+        self.listeners: List[Callable[[str, str, str], None]] = []
+        self.opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name: str, cfg: Dict) -> "CircuitBreaker":
+        return cls(name,
+                   window          = cfg.get("window", 20),
+                   min_calls       = cfg.get("min_calls", 5),
+                   failure_rate    = cfg.get("failure_rate", 0.5),
+                   slow_after      = cfg.get("slow_after"),
+                   open_for        = cfg.get("open_for", 30.0),
+                   half_open_calls = cfg.get("half_open_calls", 1))
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; a True in half-open takes one trial slot."""
+        with self._lock:
+            changed = None
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.open_for:
+                changed = self._set(self.HALF_OPEN)
+                self.trials = 0
+            if self.state == self.HALF_OPEN and self.trials < self.half_open_calls:
+                self.trials += 1
+                allowed = True
+            else:
+                allowed = self.state == self.CLOSED
+            if not allowed:
+                self.rejected += 1
+        self._notify(changed)
+        return allowed
+
+    def record(self, seconds: float, error: Optional[BaseException] = None) -> None:
+        """Outcome of a call that allow() let through."""
+        bad = ((error is not None and (isinstance(error, DeadlineExceeded) or is_transient(error)))
+               or (self.slow_after is not None and seconds > self.slow_after))
+        with self._lock:
+            changed = None
+            if self.state == self.HALF_OPEN:
+                if bad:
+                    changed = self._open()
+                else:
+                    self.outcomes.clear()
+                    changed = self._set(self.CLOSED)
+            elif self.state == self.CLOSED:
+                self.outcomes.append(bad)
+                if (len(self.outcomes) >= self.min_calls
+                        and sum(self.outcomes) / len(self.outcomes) >= self.failure_rate):
+                    changed = self._open()
+        self._notify(changed)
+
+    def cancel(self) -> None:
+        """A call that allow() let through was cancelled: give its trial slot back."""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.trials > 0:
+                self.trials -= 1
+
+    def _open(self) -> Tuple[str, str]:
+        self.opened += 1
+        self.opened_at = self.clock()
+        return self._set(self.OPEN)
+
+    def _set(self, state: str) -> Optional[Tuple[str, str]]:
+        """Change state (lock held); returns (old, new) for _notify()."""
+        old, self.state = self.state, state
+        if old == state:
+            return None
+        self.events.append((self.clock(), old, state))
+        return old, state
+
+    def _notify(self, changed: Optional[Tuple[str, str]]) -> None:
+        # Fuera del lock: un listener puede consultar el breaker
+        if changed:
+            for listener in list(self.listeners):
+                listener(self.name, *changed)
+
+    def stats(self) -> Dict[str, int]:
+        return {f"{self.name}:open": int(self.state == self.OPEN),
+                f"{self.name}:opened": self.opened,
+                f"{self.name}:rejected": self.rejected}
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+def get_circuit_breaker(provider: str, model: str, cfg: Optional[Dict] = None) -> CircuitBreaker:
+    """Process-wide breaker for (provider, model); the first caller fixes its settings."""
+    with _trackers_lock:
+        key = (provider, model)
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker.from_config(f"{provider}/{model}", cfg or {})
+        return _breakers[key]
+
+class FallbackReply(str):
+    """A reply that a circuit breaker's fallback gave in place of the primary model."""
+    served_by: str
+
+    def __new__(cls, text: str, served_by: str):
+        reply = super().__new__(cls, text)
+        reply.served_by = served_by
+        return reply
+
+class CircuitBreakerRepository(RepositoryWrapper):
+    """
+    Sends calls through a (shared) CircuitBreaker. While the circuit is open the call
+    goes to `fallback` if one is configured, otherwise it fails fast with CircuitOpen,
+    so agents stop queueing behind a provider that is timing out. Fallback replies come
+    back as FallbackReply, which the response cache does not store under the primary's key.
+    """
+    stats_name = "circuit"
+
+    def __init__(self, inner: AIRepository, breaker: CircuitBreaker,
+                 fallback: Optional[AIRepository] = None, clock=time.monotonic):
+        super().__init__(inner)
+        self.breaker = breaker
+        self.fallback = fallback
+        self.clock = clock
+
+    @property
+    def stats_source(self):
+        return self.breaker
+
+    def _refused(self) -> Optional[AIRepository]:
+        """Fallback to use when the breaker refuses the call; raises CircuitOpen without one."""
+        if self.fallback is None:
+            raise CircuitOpen(f"circuit for {self.breaker.name} is open")
+        return self.fallback
+
+    def _served_by_fallback(self, out: str) -> FallbackReply:
+        return FallbackReply(out, f"{self.fallback.provider}/{getattr(self.fallback, 'model', None)}")
+
+    def run(self, prompt: str, **kwargs) -> str:
+        if not self.breaker.allow():
+            return self._served_by_fallback(self._refused().run(prompt, **kwargs))
+        start = self.clock()
+        try:
+            out = self.inner.run(prompt, **kwargs)
+        except Exception as e:
+            self.breaker.record(self.clock() - start, e)
+            raise
+        except BaseException:
+            self.breaker.cancel()
+            raise
+        self.breaker.record(self.clock() - start)
+        return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        if not self.breaker.allow():
+            return self._served_by_fallback(await self._refused().arun(prompt, **kwargs))
+        start = self.clock()
+        try:
+            out = await self.inner.arun(prompt, **kwargs)
+        except Exception as e:
+            self.breaker.record(self.clock() - start, e)
+            raise
+        except BaseException:
+            self.breaker.cancel()
+            raise
+        self.breaker.record(self.clock() - start)
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return self.breaker.stats()
+
+# --------------------------------------------------------------------------- #
+#  Concurrencia adaptativa (AIMD)
+# --------------------------------------------------------------------------- #
+class AIMDLimiter(ConcurrencyLimiter):
+    """
+    ConcurrencyLimiter whose limit follows additive-increase / multiplicative-decrease.
+
+    Each healthy call adds `increase / limit`, so the limit grows by about `increase`
+    per round of `limit` calls. A throttled or failed call (429, 5xx, timeout) or a
+    latency spike (above `latency_factor` times the median of recent healthy calls)
+    multiplies it by `decrease`. Only calls started after the last cut can cut again,
+    so one burst of errors from calls that were already in flight cuts once.
+    """
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 increase: float = 1.0, decrease: float = 0.5, latency_factor: float = 2.0,
+                 min_samples: int = 10, clock=time.monotonic):
+        super().__init__(initial)
+        self.estimate = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_samples = min_samples
+        self.tracker = LatencyTracker(window=100)
+        self.clock = clock
+        self.last_cut = float("-inf")
+        self.cuts = 0
+        self.peak = initial
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "AIMDLimiter":
+        return cls(initial        = cfg.get("initial", 4),
+                   min_limit      = cfg.get("min", 1),
+                   max_limit      = cfg.get("max", 64),
+                   increase       = cfg.get("increase", 1.0),
+                   decrease       = cfg.get("decrease", 0.5),
+                   latency_factor = cfg.get("latency_factor", 2.0),
+                   min_samples    = cfg.get("min_samples", 10))
+
+    def observe(self, started: float, seconds: float, error: Optional[BaseException] = None) -> None:
+        """Feed the outcome of a call that started at `started` (clock time)."""
+        median = self.tracker.quantile(0.5, self.min_samples)
+        overloaded = (error is not None and is_transient(error)) or \
+                     (error is None and median is not None and seconds > self.latency_factor * median)
+        if error is None and not overloaded:
+            self.tracker.record(seconds)
+        with self._cond:
+            if overloaded:
+                if started < self.last_cut:
+                    return
+                self.last_cut = self.clock()
+                self.cuts += 1
+                self.estimate = max(float(self.min_limit), self.estimate * self.decrease)
+            elif error is None:
+                self.estimate = min(float(self.max_limit), self.estimate + self.increase / self.limit)
+            else:
+                return                  # error de la request (4xx): no dice nada de la carga
+            self.set_limit(int(self.estimate))          # _cond usa un RLock
+            self.peak = max(self.peak, self.limit)
+
+_aimd_limiters: Dict[str, AIMDLimiter] = {}
+
+def get_aimd_limiter(provider: str, cfg: Optional[Dict] = None) -> AIMDLimiter:
+    """Process-wide adaptive limiter per provider; the first caller fixes its settings."""
+    with _trackers_lock:
+        if provider not in _aimd_limiters:
+            _aimd_limiters[provider] = AIMDLimiter.from_config(cfg or {})
+        return _aimd_limiters[provider]
+
+class AdaptiveConcurrencyRepository(RepositoryWrapper):
+    """Holds a slot of a (shared) AIMDLimiter for each call and reports how it went."""
+    stats_name = "concurrency"
+
+    def __init__(self, inner: AIRepository, limiter: AIMDLimiter):
+        super().__init__(inner)
+        self.limiter = limiter
+
+    @property
+    def stats_source(self):
+        return self.limiter
+
+    def run(self, prompt: str, **kwargs) -> str:
+        with self.limiter.slot():
+            start = self.limiter.clock()
+            try:
+                out = self.inner.run(prompt, **kwargs)
+            except Exception as e:
+                self.limiter.observe(start, self.limiter.clock() - start, e)
+                raise
+            self.limiter.observe(start, self.limiter.clock() - start)
+            return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        async with self.limiter.aslot():
+            start = self.limiter.clock()
+            try:
+                out = await self.inner.arun(prompt, **kwargs)
+            except Exception as e:
+                self.limiter.observe(start, self.limiter.clock() - start, e)
+                raise
+            self.limiter.observe(start, self.limiter.clock() - start)
+            return out
+
+    def stats(self) -> Dict[str, int]:
+        name = self.inner.provider
+        return {f"{name}:limit": self.limiter.limit, f"{name}:peak": self.limiter.peak,
+                f"{name}:cuts": self.limiter.cuts}
@@ -0,0 +1,156 @@
+"""
+Router en cascada: cada turno va primero al modelo más barato/rápido y sólo escala
+al siguiente tier cuando la respuesta no sirve (vacía, sin oferta legible o fuera
+de los límites `Range` de la negociación).
+"""
+import re, threading
+from typing import Callable, Dict, List, Optional, Sequence
+from .base import current_negotiation
+from .repositories import AIRepository, RepositoryWrapper
+from ..core.negotiation import Negotiation
+from ..core.scheduler import extract_terms_from_message
+from ..core.structured import parse_reply
+from ..core.terms import MultiItemTerms, Range
+
+# "$1,100", "1100 USD", "price: 1100", "price of 1100"
+OFFER_PATTERN = re.compile(
+    r"\$\s*([\d,]+(?:\.\d+)?)|([\d,]+(?:\.\d+)?)\s*(?:usd|dollars)\b"
+    r"|(?:price|total|offer)\w*\s*(?:[:=]|of|is|at)?\s*\$?\s*([\d,]+(?:\.\d+)?)", re.I)
+
+def _within(value: float, bounds: Optional[Range]) -> bool:
+    return bounds is None or bounds.minimum <= value <= bounds.maximum
+
+def _price_bounds(negotiation: Negotiation) -> Range:
+    terms = negotiation.terms
+    if isinstance(terms, MultiItemTerms):
+        # Un mensaje multi-ítem puede citar precios unitarios o el total
+        unit_min = min(t.price.minimum for t in terms.items.values())
+        return Range(unit_min, terms.get_total_price_range().maximum)
+    return terms.price
+
+def validate_reply(msg: str, negotiation: Optional[Negotiation] = None) -> Optional[str]:
+    """
+    Why `msg` is unusable as a negotiation turn, or None if it is fine:
+      "empty"    → blank reply
+      "no_offer" → no agreement terms and no price-like amount
+      "bounds"   → agreed terms or quoted prices outside the negotiation's Range bounds
+    Without a negotiation only emptiness is checked. A structured (JSON) reply is
+    checked through its rendered text, i.e. its own offer and acceptance.
+    """
+    if not msg or not msg.strip():
+        return "empty"
+    if negotiation is None:
+        return None
+    if msg.lstrip().startswith("{"):
+        msg = parse_reply(msg, negotiation) or msg
+
+    terms = negotiation.terms
+    agreed = extract_terms_from_message(msg, negotiation)
+    if agreed:
+        if isinstance(terms, MultiItemTerms):
+            first = next(iter(terms.items.values()))
+            checks = [("total_price", terms.get_total_price_range()),
+                      ("delivery_days", terms.global_delivery_days or first.delivery_days),
+                      ("upfront_pct", terms.global_upfront_pct or first.upfront_pct)]
+        else:
+            checks = [("price", terms.price), ("delivery_days", terms.delivery_days),
+                      ("upfront_pct", terms.upfront_pct)]
+        ok = all(_within(agreed[k], bounds) for k, bounds in checks if agreed.get(k) is not None)
+        return None if ok else "bounds"
+
+    prices = [float(next(g for g in m.groups() if g).replace(",", ""))
+              for m in OFFER_PATTERN.finditer(msg)]
+    prices = [p for p in prices if p > 0]
+    if not prices:
+        return "no_offer"
+    bounds = _price_bounds(negotiation)
+    return None if any(_within(p, bounds) for p in prices) else "bounds"
+
+class RouteStats:
+    """Per-tier counters, shared by every RoutedRepository of a run."""
+    REASONS = ("empty", "no_offer", "bounds", "error")
+
+    def __init__(self):
+        self.calls = 0
+        self.escalations = 0
+        self.tiers: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, label: str, outcome: str) -> None:
+        """`outcome` is "served" or one of REASONS."""
+        with self._lock:
+            tier = self.tiers.setdefault(label, {"tried": 0, "served": 0})
+            tier["tried"] += 1
+            tier[outcome] = tier.get(outcome, 0) + 1
+
+    def count(self, attr: str) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def stats(self) -> Dict[str, float]:
+        out = {"calls": self.calls, "escalations": self.escalations}
+        for label, tier in self.tiers.items():
+            out[f"{label}:served"] = tier["served"]
+            out[f"{label}:hit_rate"] = round(tier["served"] / tier["tried"], 3) if tier["tried"] else 0.0
+        return out
+
+class RoutedRepository(RepositoryWrapper):
+    """
+    Tries `tiers` in order (cheapest/fastest first) and returns the first reply that
+    passes `validate(msg, negotiation)`. A tier that raises also escalates. The last
+    tier's reply is returned even if it fails validation; its error is re-raised.
+    Attributes not defined here (model, provider...) are read from the first tier.
+    """
+    stats_name = "router"
+
+    def __init__(self, tiers: Sequence[AIRepository], labels: Optional[Sequence[str]] = None,
+                 validate: Callable[[str, Optional[Negotiation]], Optional[str]] = validate_reply,
+                 route_stats: Optional[RouteStats] = None):
+        if not tiers:
+            raise ValueError("RoutedRepository needs at least one tier")
+        super().__init__(tiers[0])
+        self.tiers: List[AIRepository] = list(tiers)
+        self.labels = list(labels) if labels else [
+            f"{t.provider}/{getattr(t, 'model', i)}" for i, t in enumerate(self.tiers)]
+        self.validate = validate
+        self.route_stats = route_stats if route_stats is not None else RouteStats()
+
+    def _check(self, i: int, out: Optional[str], error: Optional[Exception]) -> bool:
+        """Record tier `i`'s outcome; True when the reply can be used."""
+        last = i == len(self.tiers) - 1
+        reason = "error" if error is not None else self.validate(out, current_negotiation.get())
+        self.route_stats.record(self.labels[i], reason or "served")
+        if reason and not last:
+            self.route_stats.count("escalations")
+        if error is not None and last:
+            raise error
+        return reason is None or last
+
+    def run(self, prompt: str, **kwargs) -> str:
+        self.route_stats.count("calls")
+        for i, tier in enumerate(self.tiers):
+            out, error = None, None
+            try:
+                out = tier.run(prompt, **kwargs)
+            except Exception as e:
+                error = e
+            if self._check(i, out, error):
+                return out
+
+    async def arun(self, prompt: str, **kwargs) -> str:
+        self.route_stats.count("calls")
+        for i, tier in enumerate(self.tiers):
+            out, error = None, None
+            try:
+                out = await tier.arun(prompt, **kwargs)
+            except Exception as e:
+                error = e
+            if self._check(i, out, error):
+                return out
+
+    @property
+    def stats_source(self):
+        return self.route_stats
+
+    def stats(self) -> Dict[str, float]:
+        return self.route_stats.stats()
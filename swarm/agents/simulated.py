@@ -0,0 +1,187 @@
+"""
+Repositorio simulado (sin LLM) para medir el motor de negociación.
+
+Genera mensajes con los formatos que entiende extract_terms_from_message (contraofertas
+en texto libre y "Done deal! ..." con términos completos), o el JSON del modo
+estructurado cuando se le pasa un `schema`, e inyecta latencia desde una distribución
+configurable. Todo es determinista dado el `seed`.
+"""
+import asyncio, hashlib, json, math, random, threading, time
+from itertools import cycle
+from typing import Dict, List, Optional, Sequence, Tuple
+from .base import current_agent, current_negotiation
+from .repositories import AIRepository
+from ..core.terms import MultiItemTerms
+
+class LatencyModel:
+    """
+    Per-call latency in seconds.
+      fixed     → {dist: fixed, ms: 200}
+      lognormal → {dist: lognormal, median_ms: 800, sigma: 0.5}
+      replay    → {dist: replay, values_ms: [...]} or {dist: replay, path: timings.txt}
+                  (recorded timings, one per line, cycled)
+    `scale` multiplies every sample (e.g. 0.01 to replay a run 100x faster).
+    """
+    def __init__(self, dist: str = "fixed", ms: float = 0.0, median_ms: float = 500.0,
+                 sigma: float = 0.5, values_ms: Optional[Sequence[float]] = None,
+                 path: Optional[str] = None, scale: float = 1.0, seed: int = 0):
+        if dist not in ("fixed", "lognormal", "replay"):
+            raise ValueError(f"Unsupported latency dist: {dist}. Supported: fixed, lognormal, replay")
+        self.dist = dist
+        self.ms = ms
+        self.mu = math.log(median_ms) if median_ms > 0 else 0.0
+        self.sigma = sigma
+        self.scale = scale
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if dist == "replay":
+            if values_ms is None:
+                if not path:
+                    raise ValueError("replay latency needs values_ms or path")
+                with open(path, "r", encoding="utf-8") as f:
+                    values_ms = [float(line) for line in f if line.strip()]
+            self._replay = cycle(list(values_ms))
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict], seed: int = 0) -> "LatencyModel":
+        return cls(seed=seed, **(cfg or {}))
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.dist == "fixed":
+                ms = self.ms
+            elif self.dist == "lognormal":
+                ms = self._rng.lognormvariate(self.mu, self.sigma)
+            else:
+                ms = next(self._replay)
+        return ms * self.scale / 1000.0
+
+class SimulatedRepository(AIRepository):
+    """
+    Offline stand-in for a provider.
+
+    With `script`, replies are taken from the list in order (cycled). Otherwise they
+    are rule-driven: each call accepts with probability `accept_prob` (never before
+    `min_turns` turns) and else makes a counter-offer, using values inside the
+    negotiation's Range bounds. The random draw is seeded by (seed, model, agent,
+    negotiation, prompt), so a rerun of the same scenario produces the same
+    conversation while agents with identical prompts still draw independently.
+    """
+    provider = "simulated"
+    stats_name = "simulated"
+
+    def __init__(self, model: str = "sim", seed: int = 0, accept_prob: float = 0.2,
+                 min_turns: int = 0, script: Optional[List[str]] = None,
+                 latency: Optional[Dict] = None):
+        self.model = model
+        self.seed = seed
+        self.accept_prob = accept_prob
+        self.min_turns = min_turns
+        self.script = list(script) if script else None
+        self.latency = LatencyModel.from_config(latency, seed=seed)
+        self.generation_params = {"seed": seed, "accept_prob": accept_prob, "min_turns": min_turns}
+        self.calls = 0
+        self.accepts = 0
+        self.latency_s = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, model: str, cfg: Optional[Dict]) -> "SimulatedRepository":
+        return cls(model=model, **(cfg or {}))
+
+    def warm_up(self) -> None:
+        # Sin arranque en frío que pagar; tampoco debe consumir el script ni las stats
+        pass
+
+    def cache_context(self) -> Dict:
+        # _reply siembra con el agente y la negociación, y mira cuántos turnos lleva:
+        # dos agentes con el mismo prompt no deben compartir respuesta en la caché
+        negotiation = current_negotiation.get()
+        return {"agent": current_agent.get(),
+                "negotiation": negotiation.id if negotiation is not None else None,
+                "turns": len(negotiation.turns) if negotiation is not None else None}
+
+    # ---------------------------------------------------------------- #
+    def run(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        delay, reply = self._next(prompt, system, schema)
+        if delay:
+            time.sleep(delay)
+        return reply
+
+    async def arun(self, prompt: str, system: Optional[str] = None, schema: Optional[Dict] = None) -> str:
+        delay, reply = self._next(prompt, system, schema)
+        if delay:
+            await asyncio.sleep(delay)
+        return reply
+
+    def _next(self, prompt: str, system: Optional[str], schema: Optional[Dict] = None) -> Tuple[float, str]:
+        delay = self.latency.sample()
+        with self._lock:
+            call = self.calls
+            self.calls += 1
+            self.latency_s += delay
+        if self.script:
+            return delay, self.script[call % len(self.script)]
+        reply, accepted = self._reply(prompt, system, schema)
+        if accepted:
+            with self._lock:
+                self.accepts += 1
+        return delay, reply
+
+    def _reply(self, prompt: str, system: Optional[str], schema: Optional[Dict] = None) -> Tuple[str, bool]:
+        negotiation = current_negotiation.get()
+        # Sin agente ni negociación en la semilla, todos los compradores con el mismo
+        # prompt de apertura sacarían el mismo número y aceptarían (o no) todos juntos
+        key = "|".join([str(self.seed), self.model, current_agent.get() or "",
+                        negotiation.id if negotiation is not None else "", system or "", prompt])
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        turns = len(negotiation.turns) if negotiation is not None else self.min_turns
+        price, delivery, upfront, multi = self._offer(rng, negotiation)
+        accept = turns >= self.min_turns and rng.random() < self.accept_prob
+
+        if schema and negotiation is not None:
+            return self._structured(rng, negotiation, price, delivery, upfront, accept), accept
+        if accept:
+            if multi:
+                return f"Done deal! total={price:.0f}, delivery={delivery:.0f}, upfront={upfront:.0f}", True
+            return f"Done deal! price={price:.0f}, delivery={delivery:.0f}, upfront={upfront:.0f}", True
+        what = "the whole package" if multi else "the item"
+        return (f"I can offer ${price:.0f} for {what}, delivery in {delivery:.0f} days "
+                f"and {upfront:.0f}% upfront. What do you think?"), False
+
+    @staticmethod
+    def _structured(rng: random.Random, negotiation, price: float, delivery: float,
+                    upfront: float, accept: bool) -> str:
+        """Reply in the structured-output format ({message, offer, accept})."""
+        terms = negotiation.terms
+        if isinstance(terms, MultiItemTerms):
+            items = {req.item_id: {"quantity": req.quantity,
+                                   "price": round(rng.uniform(terms.items[req.item_id].price.minimum,
+                                                              terms.items[req.item_id].price.maximum))}
+                     for req in terms.requests}
+            offer = {"items": items}
+        else:
+            offer = {"price": round(price)}
+        offer.update(delivery_days=round(delivery), upfront_pct=round(upfront))
+        message = "We have a deal." if accept else "Here is my offer. What do you think?"
+        return json.dumps({"message": message, "offer": offer, "accept": accept})
+
+    @staticmethod
+    def _offer(rng: random.Random, negotiation) -> Tuple[float, float, float, bool]:
+        """Random (price, delivery, upfront, is_multi) within the negotiation bounds."""
+        def pick(r):
+            return rng.uniform(r.minimum, r.maximum)
+        if negotiation is None:
+            return rng.uniform(800, 1500), rng.uniform(3, 14), rng.uniform(0, 100), False
+        terms = negotiation.terms
+        if isinstance(terms, MultiItemTerms):
+            first = next(iter(terms.items.values()))
+            delivery = terms.global_delivery_days or first.delivery_days
+            upfront = terms.global_upfront_pct or first.upfront_pct
+            return pick(terms.get_total_price_range()), pick(delivery), pick(upfront), True
+        return pick(terms.price), pick(terms.delivery_days), pick(terms.upfront_pct), False
+
+    def stats(self) -> Dict[str, float]:
+        return {"calls": self.calls, "accepts": self.accepts,
+                "latency_s": round(self.latency_s, 3)}
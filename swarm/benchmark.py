@@ -0,0 +1,116 @@
+"""
+Benchmark del motor swarm con SimulatedRepository: mide scheduler, extracción,
+plantillas y logs sin llamadas reales a un LLM.
+
+Opciones:
+  • python -m swarm.benchmark --sellers 20 --buyers 100 --buyers-per-seller 5
+  • python -m swarm.benchmark --mode async --latency lognormal --median-ms 800 --scale 0.01
+  • python -m swarm.benchmark --sellers 2000 --buyers 10000 --accept-prob 0.3   (10k negociaciones)
+"""
+import argparse, os, tempfile, time
+from typing import Dict, List, Optional, Tuple
+
+from swarm.agents.base import SellerAgent, BuyerAgent
+from swarm.agents.simulated import SimulatedRepository
+from swarm.core.negotiation import Negotiation, NegotiationStatus
+from swarm.core.scheduler import SwarmManager, AsyncSwarmManager
+from swarm.core.ready_queue import SCHEDULING_POLICIES
+from swarm.core.terms import Range, ItemTerms
+
+WEIGHTS = {"price": 0.6, "delivery_days": 0.2, "upfront_pct": 0.2}
+ITEM = ItemTerms(price=Range(800, 1500, 1200),
+                 delivery_days=Range(3, 14, 7),
+                 upfront_pct=Range(0, 100, 50))
+
+def build_market(sellers: int, buyers: int, buyers_per_seller: int,
+                 max_turns: int = 10, sim_cfg: Optional[Dict] = None
+                 ) -> Tuple[Dict[str, SellerAgent], Dict[str, BuyerAgent], List[Negotiation]]:
+    """Synthetic market: seller i negotiates with `buyers_per_seller` consecutive buyers."""
+    sim_cfg = sim_cfg or {}
+    seller_agents = {
+        f"seller{i}": SellerAgent(agent_id=f"seller{i}", prompt_path="seller_prompt.j2",
+                                  repo=SimulatedRepository(f"sim-seller{i}", **sim_cfg),
+                                  urgency=0.7, term_weights=WEIGHTS)
+        for i in range(sellers)
+    }
+    buyer_agents = {
+        f"buyer{j}": BuyerAgent(agent_id=f"buyer{j}", prompt_path="buyer_prompt.j2",
+                                repo=SimulatedRepository(f"sim-buyer{j}", **sim_cfg),
+                                urgency=0.7, term_weights=WEIGHTS)
+        for j in range(buyers)
+    }
+    negotiations = []
+    for i in range(sellers):
+        for k in range(buyers_per_seller):
+            j = (i * buyers_per_seller + k) % buyers
+            negotiations.append(Negotiation(id=f"B{i}_buyer{j}", seller_id=f"seller{i}",
+                                            buyer_id=f"buyer{j}", item_id="item1",
+                                            terms=ITEM, max_turns=max_turns))
+    return seller_agents, buyer_agents, negotiations
+
+def run_benchmark(sellers: int = 10, buyers: int = 50, buyers_per_seller: int = 5,
+                  max_turns: int = 10, mode: str = "sync", sim_cfg: Optional[Dict] = None,
+                  max_concurrency: Optional[int] = None, policy: str = "fifo") -> Dict[str, float]:
+    s, b, negotiations = build_market(sellers, buyers, buyers_per_seller, max_turns, sim_cfg)
+    if mode == "async":
+        swarm = AsyncSwarmManager(s, b, negotiations, policy=policy, max_concurrency=max_concurrency)
+    else:
+        swarm = SwarmManager(s, b, negotiations, policy=policy)
+
+    t0 = time.perf_counter()
+    swarm.run()
+    wall = time.perf_counter() - t0
+
+    repos = [a.repo for a in (*s.values(), *b.values())]
+    calls = sum(r.calls for r in repos)
+    # Cerradas porque su vendedor o comprador cerró trato en otra negociación
+    cascaded = sum(n.status == NegotiationStatus.FAILED and n.id not in swarm.errors
+                   and len(n.turns) < n.max_turns * 2 for n in negotiations)
+    return {
+        "negotiations": len(negotiations),
+        "agreements":   sum(n.status == NegotiationStatus.AGREEMENT for n in negotiations),
+        "cascaded":     cascaded,
+        "turns":        sum(len(n.turns) for n in negotiations),
+        "calls":        calls,
+        "wall_s":       round(wall, 3),
+        "calls_per_s":  round(calls / wall, 1) if wall else 0.0,
+        "sim_latency_s": round(sum(r.latency_s for r in repos), 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the swarm engine with simulated agents")
+    ap.add_argument("--sellers", type=int, default=10)
+    ap.add_argument("--buyers", type=int, default=50)
+    ap.add_argument("--buyers-per-seller", type=int, default=5)
+    ap.add_argument("--max-turns", type=int, default=10)
+    ap.add_argument("--mode", choices=["sync", "async"], default="sync")
+    ap.add_argument("--max-concurrency", type=int, default=None)
+    ap.add_argument("--schedule", choices=list(SCHEDULING_POLICIES), default="fifo")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--accept-prob", type=float, default=0.2)
+    ap.add_argument("--latency", choices=["fixed", "lognormal", "replay"], default="fixed")
+    ap.add_argument("--ms", type=float, default=0.0, help="fixed latency per call")
+    ap.add_argument("--median-ms", type=float, default=500.0, help="lognormal median")
+    ap.add_argument("--sigma", type=float, default=0.5, help="lognormal sigma")
+    ap.add_argument("--replay", default=None, help="file with recorded latencies (ms, one per line)")
+    ap.add_argument("--scale", type=float, default=1.0, help="multiplier applied to every latency")
+    ap.add_argument("--workdir", default=None, help="where logs/ is written (default: temp dir)")
+    args = ap.parse_args()
+
+    latency = {"dist": args.latency, "ms": args.ms, "median_ms": args.median_ms,
+               "sigma": args.sigma, "path": args.replay, "scale": args.scale}
+    sim_cfg = {"seed": args.seed, "accept_prob": args.accept_prob, "latency": latency}
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="swarm-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)                       # save_log escribe en ./logs
+
+    res = run_benchmark(args.sellers, args.buyers, args.buyers_per_seller, args.max_turns,
+                        args.mode, sim_cfg, args.max_concurrency, args.schedule)
+    print("\n==== BENCHMARK ====")
+    for k, v in res.items():
+        print(f"{k:>14}: {v}")
+    print(f"{'logs':>14}: {os.path.join(workdir, 'logs')}")
+
+if __name__ == "__main__":
+    main()
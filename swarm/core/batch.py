@@ -0,0 +1,223 @@
+"""
+Modo batch: todas las negociaciones avanzan un turno a la vez y los prompts de ese
+turno se envían juntos como un único job (archivo JSONL con el formato de OpenAI
+Batch) a un backend intercambiable. Sirve para corridas de datos sintéticos donde
+importan el costo y la cuota, no la latencia.
+"""
+import json, os, threading, time, uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from .negotiation import Negotiation, NegotiationStatus
+from .scheduler import SwarmManager
+from .structured import reply_schema, response_format
+from ..utils.file_io import save_log
+
+DEFAULT_BATCH_DIR = os.path.join("data", "batches")
+# Campos de /v1/chat/completions que se copian de generation_params; el resto
+# (max_chars de streaming, options/keep_alive de Ollama, stop_sequences de Anthropic...)
+# hace que el proveedor rechace la línea
+CHAT_COMPLETION_PARAMS = ("temperature", "max_tokens", "top_p", "stop", "seed", "response_format")
+
+class BatchError(RuntimeError):
+    """A batch job, or one of its requests, failed."""
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    model: str
+    prompt: str
+    system: Optional[str] = None
+    params: Dict = field(default_factory=dict)
+
+    def to_line(self) -> Dict:
+        """One line of an OpenAI Batch input file (/v1/chat/completions)."""
+        messages = [{"role": "system", "content": self.system}] if self.system else []
+        messages.append({"role": "user", "content": self.prompt})
+        return {"custom_id": self.custom_id, "method": "POST", "url": "/v1/chat/completions",
+                "body": {"model": self.model, "messages": messages, **self.params}}
+
+@dataclass
+class BatchResults:
+    replies: Dict[str, str] = field(default_factory=dict)     # custom_id → texto
+    errors: Dict[str, str] = field(default_factory=dict)      # custom_id → error
+    # Job vencido, cancelado o fallido: error de las requests que no llegaron a correr
+    job_error: Optional[str] = None
+
+def chat_completion_params(generation_params: Dict) -> Dict:
+    """The subset of a repository's generation_params a chat-completions body accepts."""
+    return {k: v for k, v in generation_params.items() if k in CHAT_COMPLETION_PARAMS}
+
+def write_batch_file(path: str, requests: List[BatchRequest]) -> str:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for r in requests:
+            f.write(json.dumps(r.to_line()) + "\n")
+    return path
+
+def parse_batch_output(lines) -> BatchResults:
+    """Parse OpenAI Batch output lines ({custom_id, response: {status_code, body}, error})."""
+    results = BatchResults()
+    for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        response = row.get("response") or {}
+        if row.get("error") or response.get("status_code", 200) >= 400:
+            results.errors[row["custom_id"]] = json.dumps(row.get("error") or response.get("body"))
+        else:
+            content = response["body"]["choices"][0]["message"]["content"] or ""
+            results.replies[row["custom_id"]] = content.strip()
+    return results
+
+class BatchBackend(ABC):
+    """Where batch jobs are executed. submit() returns a job id, poll() the results once done."""
+
+    @abstractmethod
+    def submit(self, requests: List[BatchRequest]) -> str:
+        ...
+
+    @abstractmethod
+    def poll(self, job_id: str) -> Optional[BatchResults]:
+        """
+        Results when the job has finished, None while it is still running. A job that
+        ended early (expired, cancelled) returns what did finish, with `job_error` set.
+        """
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based backend for tests and offline runs. Each job is written to
+    `<workdir>/<job>.input.jsonl`, executed line by line by `execute(custom_id, body)`
+    in a background thread, and its results are written to `<job>.output.jsonl`
+    in the OpenAI Batch output format. poll() waits for that thread, so a local job
+    never costs a poll_interval sleep.
+    """
+    def __init__(self, execute: Optional[Callable[[str, Dict], str]] = None,
+                 workdir: str = DEFAULT_BATCH_DIR):
+        self.execute = execute
+        self.workdir = workdir
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def _path(self, job_id: str, kind: str) -> str:
+        return os.path.join(self.workdir, f"{job_id}.{kind}.jsonl")
+
+    def submit(self, requests: List[BatchRequest]) -> str:
+        if self.execute is None:
+            raise BatchError("LocalBatchBackend needs an execute callable")
+        job_id = f"batch_{uuid.uuid4().hex[:12]}"
+        write_batch_file(self._path(job_id, "input"), requests)
+        thread = threading.Thread(target=self._process, args=(job_id,), daemon=True)
+        self._threads[job_id] = thread
+        thread.start()
+        return job_id
+
+    def _process(self, job_id: str) -> None:
+        rows = []
+        with open(self._path(job_id, "input"), encoding="utf-8") as f:
+            for line in f:
+                req = json.loads(line)
+                try:
+                    content = self.execute(req["custom_id"], req["body"])
+                    rows.append({"custom_id": req["custom_id"], "error": None, "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": content}}]}}})
+                except Exception as e:
+                    rows.append({"custom_id": req["custom_id"], "response": None,
+                                 "error": {"message": f"{type(e).__name__}: {e}"}})
+        # Escritura atómica: poll() nunca ve un archivo a medias
+        tmp = self._path(job_id, "output") + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+        os.replace(tmp, self._path(job_id, "output"))
+
+    def poll(self, job_id: str) -> Optional[BatchResults]:
+        # El job corre en este proceso: esperar su hilo en lugar de dormir entre consultas
+        thread = self._threads.pop(job_id, None)
+        if thread is not None:
+            thread.join()
+        path = self._path(job_id, "output")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return parse_batch_output(f)
+
+class BatchSwarmManager(SwarmManager):
+    """
+    Advances every open negotiation one turn per phase: all buyer turns go out as one
+    batch job, then the seller turns of the negotiations still open. Replies are applied
+    in negotiation order, with the same cascade rules as the round-robin loop. A reply
+    whose negotiation was closed by an earlier one is dropped, and a failed request, or
+    one an expired or cancelled job never ran, closes its negotiation (see
+    SwarmManager.errors).
+
+    Prompts go straight to the backend, so repository layers (cache, streaming,
+    rate limits...) do not apply. With LocalBatchBackend and no `execute`, each request
+    runs through its agent's repository.
+    """
+    def __init__(self, *args, backend: Optional[BatchBackend] = None,
+                 poll_interval: float = 30.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backend = backend or LocalBatchBackend()
+        if isinstance(self.backend, LocalBatchBackend) and self.backend.execute is None:
+            self.backend.execute = self._execute_locally
+        self.poll_interval = poll_interval
+        self.jobs: List[str] = []
+        self._pending: Dict[str, Tuple[object, Negotiation, Optional[str], str]] = {}
+
+    def run(self) -> None:
+        while True:
+            open_ = [n for n in self.negotiations if not self._close_if_taken(n)]
+            if not open_:
+                return
+            # Una ronda a medias (corrida retomada) sólo espera al vendedor
+            self._batch_turn([n for n in open_ if len(n.turns) % 2 == 0],
+                             lambda n: self.buyers[n.buyer_id])
+            # Si el comprador aceptó (o se cerró en cascada) el vendedor no responde
+            self._batch_turn([n for n in open_ if not self._close_if_taken(n) and len(n.turns) % 2 == 1],
+                             lambda n: self.sellers[n.seller_id])
+            for n in open_:
+                if n.status == NegotiationStatus.ONGOING:
+                    save_log(n)
+
+    def _batch_turn(self, negotiations: List[Negotiation], agent_of) -> None:
+        if not negotiations:
+            return
+        requests, owners = [], {}
+        for n in negotiations:
+            agent = agent_of(n)
+            system, prompt = agent.build_prompt(n)
+            custom_id = f"{n.id}:{len(n.turns)}:{agent.id}"
+            params = chat_completion_params(agent.repo.generation_params)
+            if agent.structured:
+                params["response_format"] = response_format(reply_schema(n.terms))
+            requests.append(BatchRequest(custom_id, getattr(agent.repo, "model", None), prompt,
+                                         system or None, params))
+            owners[custom_id] = (agent, n)
+            self._pending[custom_id] = (agent, n, system, prompt)
+
+        job_id = self.backend.submit(requests)
+        self.jobs.append(job_id)
+        results = self._wait(job_id)
+        for custom_id, (agent, n) in owners.items():
+            self._pending.pop(custom_id, None)
+            if self._close_if_taken(n):
+                continue
+            if custom_id in results.replies:
+                self._apply_message(n, agent.id, agent.read_reply(n, results.replies[custom_id]))
+            else:
+                error = results.errors.get(custom_id) or results.job_error or "missing from batch output"
+                self._fail(n, agent.id, BatchError(error))
+
+    def _wait(self, job_id: str) -> BatchResults:
+        while True:
+            results = self.backend.poll(job_id)
+            if results is not None:
+                return results
+            time.sleep(self.poll_interval)
+
+    def _execute_locally(self, custom_id: str, body: Dict) -> str:
+        agent, n, system, prompt = self._pending[custom_id]
+        return agent.complete(n, system, prompt)
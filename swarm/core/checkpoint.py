@@ -0,0 +1,163 @@
+"""
+Checkpoints de una corrida del swarm, para retomarla tras una caída sin repetir las
+llamadas ya hechas.
+
+En el directorio del checkpoint hay dos archivos:
+  snapshot.json  → estado completo (turnos, estado, final_terms, sold/bought, errores),
+                   reescrito de forma atómica cada `snapshot_every` registros
+  journal.jsonl  → un registro por turno o cambio de estado desde el último snapshot,
+                   agregado (y flusheado) en cuanto ocurre
+
+Al retomar se carga el snapshot y se re-aplica el journal; cada turno lleva su índice,
+así que re-aplicar un registro que el snapshot ya incluye no lo duplica. Una caída
+pierde como mucho el turno que estaba en vuelo.
+"""
+import json, os, time
+from typing import Dict, List, Optional
+from .negotiation import Negotiation, NegotiationStatus, Turn
+
+DEFAULT_CHECKPOINT_DIR = os.path.join("data", "checkpoints")
+
+class Checkpoint:
+    """
+    Records every change SwarmManager makes to a negotiation (see SwarmManager._changed)
+    and restores a set of negotiations from disk. `fsync` also survives a power loss,
+    at the cost of one disk sync per turn.
+    """
+    def __init__(self, folder: str = DEFAULT_CHECKPOINT_DIR, snapshot_every: int = 1000,
+                 fsync: bool = False):
+        self.folder = folder
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.snapshots = 0
+        self._journal = None
+        self._since_snapshot = 0
+        self._recorded: Dict[str, int] = {}         # negociación → turnos ya escritos
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.folder, "snapshot.json")
+
+    @property
+    def journal_path(self) -> str:
+        return os.path.join(self.folder, "journal.jsonl")
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    # --- escritura ---------------------------------------------------
+
+    def start(self, manager) -> None:
+        """Begin checkpointing `manager`: snapshot of the current state, empty journal."""
+        self.snapshot(manager)
+
+    def record(self, manager, n: Negotiation, error: Optional[str] = None) -> None:
+        """Append the turns of `n` not yet written, and its status, to the journal."""
+        done = self._recorded.get(n.id, 0)
+        rows = [{"n": n.id, "i": i, "turn": _turn_row(t)} for i, t in enumerate(n.turns[done:], done)]
+        rows.append({"n": n.id, "status": n.status.name, "final_terms": n.final_terms,
+                     **({"error": error} if error else {})})
+        self._recorded[n.id] = len(n.turns)
+        if self._journal is None:
+            os.makedirs(self.folder, exist_ok=True)
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        self._journal.write("".join(json.dumps(row) + "\n" for row in rows))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot(manager)
+
+    def snapshot(self, manager) -> None:
+        """Atomically write the full state of `manager` and start a new journal."""
+        os.makedirs(self.folder, exist_ok=True)
+        state = {
+            "saved_at": time.time(),
+            "negotiations": {n.id: dump_negotiation(n) for n in manager.negotiations},
+            "sold_sellers": sorted(manager.sold_sellers),
+            "bought_buyers": sorted(manager.bought_buyers),
+            "errors": manager.errors,
+        }
+        # Escritura atómica: una caída a mitad deja el snapshot anterior intacto
+        tmp = self.snapshot_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        # Recién ahora se puede vaciar el journal: todo lo que tenía está en el snapshot
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._recorded = {n.id: len(n.turns) for n in manager.negotiations}
+        self._since_snapshot = 0
+        self.snapshots += 1
+
+    def close(self, manager) -> None:
+        """Final snapshot; the journal is left empty."""
+        self.snapshot(manager)
+        self._journal.close()
+        self._journal = None
+
+    # --- lectura -----------------------------------------------------
+
+    def restore(self, negotiations: List[Negotiation]) -> Dict[str, str]:
+        """
+        Bring `negotiations` (freshly built from the same config) to the checkpointed
+        state; returns the repository errors recorded so far. Raises ValueError if the
+        checkpoint has negotiations the config does not.
+        """
+        by_id = {n.id: n for n in negotiations}
+        errors: Dict[str, str] = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+            unknown = set(state["negotiations"]) - set(by_id)
+            if unknown:
+                raise ValueError(f"Checkpoint {self.folder} does not match the config: "
+                                 f"unknown negotiations {sorted(unknown)[:5]}")
+            for nid, saved in state["negotiations"].items():
+                load_negotiation(by_id[nid], saved)
+            errors.update(state.get("errors") or {})
+        for row in self._journal_rows():
+            n = by_id.get(row["n"])
+            if n is None:
+                raise ValueError(f"Checkpoint {self.folder} does not match the config: "
+                                 f"unknown negotiation {row['n']}")
+            if "turn" in row:
+                if row["i"] == len(n.turns):
+                    n.turns.append(Turn(*row["turn"]))
+            else:
+                _set_status(n, row["status"], row["final_terms"])
+                if "error" in row:
+                    errors[n.id] = row["error"]
+        self._recorded = {n.id: len(n.turns) for n in negotiations}
+        return errors
+
+    def _journal_rows(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return              # última línea a medio escribir al caerse
+
+def dump_negotiation(n: Negotiation) -> Dict:
+    """JSON-serializable state of `n` (turns, status, final_terms)."""
+    return {"turns": [_turn_row(t) for t in n.turns], "status": n.status.name,
+            "final_terms": n.final_terms}
+
+def load_negotiation(n: Negotiation, saved: Dict) -> None:
+    """Bring `n` to a state produced by dump_negotiation."""
+    n.turns = [Turn(*row) for row in saved["turns"]]
+    _set_status(n, saved["status"], saved["final_terms"])
+
+def _turn_row(t: Turn) -> list:
+    return [t.sender_id, str(t.message), t.timestamp]
+
+def _set_status(n: Negotiation, status: str, final_terms: Optional[Dict]) -> None:
+    n.status = NegotiationStatus[status]
+    n.final_terms = final_terms
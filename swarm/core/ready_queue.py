@@ -0,0 +1,106 @@
+"""
+Cola de prioridad de negociaciones listas para su próximo turno, con política de
+orden intercambiable. SwarmManager saca de acá la próxima negociación en lugar de
+recorrer la lista completa en cada ciclo, y AsyncSwarmManager usa la misma política
+para decidir qué turno en espera entra primero cuando hay tope de concurrencia.
+
+Políticas (menor clave = antes):
+  fifo        → orden de llegada (equivale al round-robin anterior)
+  rounds_left → primero las que tienen menos rondas restantes (más cerca de cerrar)
+  urgency     → primero las de mayor urgencia entre comprador y vendedor
+  oldest      → primero las que llevan más tiempo sin recibir un turno
+"""
+import asyncio, heapq, itertools
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+from .negotiation import Negotiation
+
+# (negociación, (comprador, vendedor)) → clave ordenable
+PolicyKey = Callable[[Negotiation, Sequence], Tuple]
+
+def rounds_left(n: Negotiation) -> int:
+    """Buyer+seller rounds `n` can still play before hitting max_turns."""
+    return n.max_turns - len(n.turns) // 2
+
+def _fifo(n: Negotiation, agents: Sequence) -> Tuple:
+    return ()
+
+def _rounds_left(n: Negotiation, agents: Sequence) -> Tuple:
+    return (rounds_left(n),)
+
+def _urgency(n: Negotiation, agents: Sequence) -> Tuple:
+    return (-max(a.urgency for a in agents),)
+
+def _oldest(n: Negotiation, agents: Sequence) -> Tuple:
+    return (n.turns[-1].timestamp if n.turns else 0.0,)
+
+SCHEDULING_POLICIES: Dict[str, PolicyKey] = {
+    "fifo": _fifo,
+    "rounds_left": _rounds_left,
+    "urgency": _urgency,
+    "oldest": _oldest,
+}
+
+def get_policy(policy: Union[str, PolicyKey, None]) -> PolicyKey:
+    """Key function for a policy name, or `policy` itself if it is already a callable."""
+    if callable(policy):
+        return policy
+    name = policy or "fifo"
+    if name not in SCHEDULING_POLICIES:
+        raise ValueError(f"Unsupported scheduling policy: {name}. "
+                         f"Supported: {', '.join(SCHEDULING_POLICIES)}")
+    return SCHEDULING_POLICIES[name]
+
+class ReadyQueue:
+    """
+    Min-heap of negotiations ready for a turn, ordered by the policy key and then by
+    insertion order (so ties, and the whole "fifo" policy, are first come first served).
+    The key is computed on push: a negotiation is pushed back after each of its rounds.
+    """
+    def __init__(self, key: PolicyKey, agents_of: Callable[[Negotiation], Sequence]):
+        self.key = key
+        self.agents_of = agents_of
+        self._heap: List[Tuple[Tuple, int, Negotiation]] = []
+        self._seq = itertools.count()
+
+    def push(self, n: Negotiation) -> None:
+        heapq.heappush(self._heap, (self.key(n, self.agents_of(n)), next(self._seq), n))
+
+    def pop(self) -> Negotiation:
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+class PriorityGate:
+    """
+    asyncio counterpart of a semaphore that admits waiters by priority (lowest first,
+    then arrival order) instead of plain arrival order.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._waiters: List[Tuple[Tuple, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: Tuple = ()) -> None:
+        if self.in_use < self.capacity and not self._waiters:
+            self.in_use += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            # Si el lugar ya nos había sido cedido, devolverlo
+            if fut.done() and not fut.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        # El lugar pasa directo al próximo en espera; in_use no cambia
+        while self._waiters:
+            fut = heapq.heappop(self._waiters)[2]
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_use -= 1
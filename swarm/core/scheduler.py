@@ -1,11 +1,15 @@
 """
-SwarmManager: ejecuta en round-robin todas las negociaciones activas.
+SwarmManager: ejecuta las negociaciones activas sacándolas de una cola de prioridad
+(ver ready_queue), en orden de llegada por defecto.
 """
-import itertools, time, os, re, json
-from typing import List, Dict, Union
+import asyncio, itertools, time, os, re, json
+from typing import List, Dict, Optional, Union
 from .negotiation import Negotiation, NegotiationStatus, Turn
 from .terms import MultiItemTerms
 from .scoring import calculate_multi_item_totals
+from .structured import AgentReply
+from .ready_queue import PolicyKey, PriorityGate, ReadyQueue, get_policy
+from .checkpoint import Checkpoint
 from ..utils.file_io import save_log
 
 def extract_terms_from_message(msg: str, negotiation: Negotiation = None):
@@ -81,85 +85,181 @@ def extract_multi_item_terms(msg: str, negotiation: Negotiation):
     
     return None
 
+class IncrementalTermExtractor:
+    """
+    Streaming counterpart of extract_terms_from_message: feed() text chunks as they
+    arrive and it returns the terms as soon as a complete offer is visible.
+
+    A match only counts once some character follows the last number, so a partial
+    "upfront=5" is not taken for "upfront=50". Open-ended item lists
+    ("item1=5x100, ...") never terminate early; finish() parses the full text.
+    """
+    _SINGLE = re.compile(r"price\s*=\s*([\d.]+)[, ]+delivery\s*=\s*([\d.]+)[, ]+upfront\s*=\s*([\d.]+)", re.I)
+    _TOTAL = re.compile(r"total\s*=\s*([\d.]+)[, ]+delivery\s*=\s*([\d.]+)[, ]+upfront\s*=\s*([\d.]+)", re.I)
+
+    def __init__(self, negotiation: Negotiation = None):
+        self.negotiation = negotiation
+        self.text = ""
+        self.terms = None
+        self._scanned = 0
+
+    def feed(self, chunk: str) -> Optional[Dict]:
+        if self.terms is not None:
+            return self.terms
+        self.text += chunk
+        # Sólo re-escanear la cola: un patrón completo ocupa menos de 200 caracteres
+        start = max(0, self._scanned - 200)
+        patterns = [self._SINGLE]
+        if self.negotiation is not None and self.negotiation.is_multi_item():
+            patterns.append(self._TOTAL)
+        for pattern in patterns:
+            m = pattern.search(self.text, start)
+            if m and m.end() < len(self.text):
+                self.terms = extract_terms_from_message(self.text[:m.end()], self.negotiation)
+                break
+        self._scanned = len(self.text)
+        return self.terms
+
+    def finish(self) -> Optional[Dict]:
+        """Terms of the complete message (same result as extract_terms_from_message)."""
+        return extract_terms_from_message(self.text, self.negotiation)
+
 class SwarmManager:
     def __init__(self,
                  sellers: Dict[str, 'SellerAgent'],
                  buyers: Dict[str, 'BuyerAgent'],
-                 negotiations: List[Negotiation]):
+                 negotiations: List[Negotiation],
+                 policy: Union[str, PolicyKey, None] = "fifo",
+                 checkpoint: Optional[Checkpoint] = None):
         self.sellers = sellers
         self.buyers = buyers
         self.negotiations = negotiations
+        self.policy = get_policy(policy)
+        self.checkpoint = checkpoint
+        # Derivados de los estados, así una corrida retomada arranca con los cierres previos
+        agreed = [n for n in negotiations if n.status == NegotiationStatus.AGREEMENT]
+        self.sold_sellers = {n.seller_id for n in agreed}
+        self.bought_buyers = {n.buyer_id for n in agreed}
+        # vendedor / comprador → sus negociaciones abiertas, por id
+        self.open_by_seller: Dict[str, Dict[str, Negotiation]] = {}
+        self.open_by_buyer: Dict[str, Dict[str, Negotiation]] = {}
+        for n in negotiations:
+            if n.status == NegotiationStatus.ONGOING:
+                self.open_by_seller.setdefault(n.seller_id, {})[n.id] = n
+                self.open_by_buyer.setdefault(n.buyer_id, {})[n.id] = n
+        # negociación → error del repositorio que la hizo fallar
+        self.errors: Dict[str, str] = {}
 
     def run(self) -> None:
-        """Round-robin: en cada ciclo, cada negociación activa recibe un turno (buyer, luego seller)."""
-        sold_sellers = set()
-        bought_buyers = set()
-        while any(n.status == NegotiationStatus.ONGOING for n in self.negotiations):
-            for n in self.negotiations:
-                if n.status != NegotiationStatus.ONGOING:
-                    continue
-
-                # Si el vendedor ya vendió, cerrar la negociación
-                if n.seller_id in sold_sellers:
-                    n.status = NegotiationStatus.FAILED
-                    save_log(n)
-                    continue
-
-                # Si el comprador ya compró, cerrar la negociación
-                if n.buyer_id in bought_buyers:
-                    n.status = NegotiationStatus.FAILED
-                    save_log(n)
-                    continue
-
-                buyer = self.buyers[n.buyer_id]
-                seller = self.sellers[n.seller_id]
-
-                # --- Turno del comprador ---
-                b_msg = buyer.decide(n)
-                n.add_turn(Turn(buyer.id, b_msg, time.time()))
-                terms = extract_terms_from_message(b_msg, n)
-                if terms:
-                    # Process multi-item terms if necessary
-                    if n.is_multi_item() and isinstance(n.terms, MultiItemTerms):
-                        terms = self._process_multi_item_agreement(terms, n.terms)
-                    
-                    n.register_agreement(terms)
-                    save_log(n)
-                    sold_sellers.add(n.seller_id)
-                    bought_buyers.add(n.buyer_id)
-                    # Cerrar otras negociaciones activas de este vendedor y comprador
-                    for other in self.negotiations:
-                        if other is not n and other.status == NegotiationStatus.ONGOING:
-                            if other.seller_id == n.seller_id or other.buyer_id == n.buyer_id:
-                                other.status = NegotiationStatus.FAILED
-                                save_log(other)
-                    # Si el comprador acepta, el vendedor NO responde en esta ronda
-                    continue
-
-                # --- Turno del vendedor ---
-                s_msg = seller.decide(n)
-                n.add_turn(Turn(seller.id, s_msg, time.time()))
-                terms = extract_terms_from_message(s_msg, n)
-                if terms:
-                    # Process multi-item terms if necessary
-                    if n.is_multi_item() and isinstance(n.terms, MultiItemTerms):
-                        terms = self._process_multi_item_agreement(terms, n.terms)
-                    
-                    n.register_agreement(terms)
-                    save_log(n)
-                    sold_sellers.add(n.seller_id)
-                    bought_buyers.add(n.buyer_id)
-                    # Cerrar otras negociaciones activas de este vendedor y comprador
-                    for other in self.negotiations:
-                        if other is not n and other.status == NegotiationStatus.ONGOING:
-                            if other.seller_id == n.seller_id or other.buyer_id == n.buyer_id:
-                                other.status = NegotiationStatus.FAILED
-                                save_log(other)
-                    continue
+        """
+        Take the next ready negotiation from the priority queue and give it a round
+        (buyer, then seller); it goes back to the queue while it stays open. Closed
+        negotiations are never re-queued, and the ones closed in cascade are dropped
+        when they come out of the queue.
+        """
+        ready = self._ready_queue()
+        while ready:
+            n = ready.pop()
+            if self._close_if_taken(n):
+                continue
 
+            # Comprador y luego vendedor; si el comprador acepta, el vendedor NO responde.
+            # Una ronda a medias (corrida retomada) sigue con el vendedor.
+            for agent in self._round_agents(n):
+                msg = self._turn(agent, n)
+                if msg is None or self._apply_message(n, agent.id, msg):
+                    break
+            else:
                 save_log(n)
+                if n.status == NegotiationStatus.ONGOING:
+                    ready.push(n)
+
+    def _round_agents(self, n: Negotiation):
+        buyer, seller = self._agents_of(n)
+        return (buyer, seller) if len(n.turns) % 2 == 0 else (seller,)
+
+    def _agents_of(self, n: Negotiation):
+        return self.buyers[n.buyer_id], self.sellers[n.seller_id]
+
+    def _ready_queue(self) -> ReadyQueue:
+        ready = ReadyQueue(self.policy, self._agents_of)
+        for n in self.negotiations:
+            if n.status == NegotiationStatus.ONGOING:
+                ready.push(n)
+        return ready
+
+    def _turn(self, agent, n: Negotiation) -> Optional[str]:
+        """agent.decide(n); None if the repository failed (the negotiation is then closed)."""
+        try:
+            return agent.decide(n)
+        except Exception as e:
+            self._fail(n, agent.id, e)
+            return None
+
+    def _fail(self, n: Negotiation, agent_id: str, error: Exception) -> None:
+        """Close `n` after an unrecoverable repository error, without stopping the swarm."""
+        n.status = NegotiationStatus.FAILED
+        self._unindex(n)
+        self.errors[n.id] = f"{agent_id}: {type(error).__name__}: {error}"
+        self._changed(n, self.errors[n.id])
+        save_log(n)
+
+    def _changed(self, n: Negotiation, error: Optional[str] = None) -> None:
+        """Persist a new turn or status of `n` when checkpointing is on."""
+        if self.checkpoint is not None:
+            self.checkpoint.record(self, n, error)
+
+    def _unindex(self, n: Negotiation) -> None:
+        """Drop `n` from the open-negotiation indexes once it is no longer ongoing."""
+        self.open_by_seller.get(n.seller_id, {}).pop(n.id, None)
+        self.open_by_buyer.get(n.buyer_id, {}).pop(n.id, None)
+
+    def _close_if_taken(self, n: Negotiation) -> bool:
+        """True if `n` must not get another turn (already finished, or its seller/buyer closed elsewhere)."""
+        if n.status != NegotiationStatus.ONGOING:
+            return True
 
-                # (opcional)  break si todas cerradas para evitar ciclo innecesario
+        # Si el vendedor ya vendió, o el comprador ya compró, cerrar la negociación
+        if n.seller_id in self.sold_sellers or n.buyer_id in self.bought_buyers:
+            n.status = NegotiationStatus.FAILED
+            self._unindex(n)
+            self._changed(n)
+            save_log(n)
+            return True
+        return False
+
+    def _apply_message(self, n: Negotiation, sender_id: str, msg: str) -> bool:
+        """Record `msg` as a turn of `n`; returns True if it closed a deal."""
+        n.add_turn(Turn(sender_id, msg, time.time()))
+        # Una respuesta estructurada ya trae sus términos: no hace falta la regex
+        terms = msg.terms if isinstance(msg, AgentReply) else extract_terms_from_message(msg, n)
+        if not terms:
+            if n.status != NegotiationStatus.ONGOING:       # max_turns alcanzado
+                self._unindex(n)
+            self._changed(n)
+            return False
+
+        # Process multi-item terms if necessary
+        if n.is_multi_item() and isinstance(n.terms, MultiItemTerms):
+            terms = self._process_multi_item_agreement(terms, n.terms)
+
+        n.register_agreement(terms)
+        self._changed(n)
+        save_log(n)
+        self.sold_sellers.add(n.seller_id)
+        self.bought_buyers.add(n.buyer_id)
+        self._close_competitors(n)
+        return True
+
+    def _close_competitors(self, n: Negotiation) -> None:
+        """Close the other open negotiations of n's seller and buyer (O(their degree))."""
+        affected = {**self.open_by_seller.pop(n.seller_id, {}), **self.open_by_buyer.pop(n.buyer_id, {})}
+        for other in affected.values():
+            self._unindex(other)
+            if other is not n and other.status == NegotiationStatus.ONGOING:
+                other.status = NegotiationStatus.FAILED
+                self._changed(other)
+                save_log(other)
     
     def _process_multi_item_agreement(self, terms: Dict, multi_terms: MultiItemTerms) -> Dict:
         """Process multi-item agreement terms and calculate totals"""
@@ -168,4 +268,53 @@ class SwarmManager:
             totals = calculate_multi_item_totals(terms["items"], multi_terms)
             terms.update(totals)
         
-        return terms 
\ No newline at end of file
+        return terms
+
+class AsyncSwarmManager(SwarmManager):
+    """
+    Variante asyncio de SwarmManager: cada negociación avanza en su propia tarea,
+    así que el próximo turno de todas las negociaciones activas está en vuelo a la vez.
+
+    Dentro de una negociación se mantiene el orden buyer → seller, y el cierre en
+    cascada (sold_sellers / bought_buyers) se aplica en cuanto llega cada mensaje.
+    Una respuesta que llega cuando su negociación ya fue cerrada se descarta, y un
+    error del repositorio cierra sólo su negociación (ver SwarmManager.errors).
+
+    Con max_concurrency, los turnos en espera entran según la política de orden.
+    """
+    def __init__(self, *args, max_concurrency: Optional[int] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+
+    def run(self) -> None:
+        asyncio.run(self.arun())
+
+    async def arun(self) -> None:
+        gate = PriorityGate(self.max_concurrency) if self.max_concurrency else None
+        await asyncio.gather(*(self._run_negotiation(n, gate) for n in self.negotiations))
+
+    async def _run_negotiation(self, n: Negotiation, gate: Optional[PriorityGate]) -> None:
+        while not self._close_if_taken(n):
+            for agent in self._round_agents(n):
+                try:
+                    msg = await self._decide(agent, n, gate)
+                except Exception as e:
+                    # Si se cerró en cascada durante la espera, el error ya no es de ella
+                    if not self._close_if_taken(n):
+                        self._fail(n, agent.id, e)
+                    return
+                # La negociación pudo cerrarse en cascada mientras esperábamos
+                if self._close_if_taken(n) or self._apply_message(n, agent.id, msg):
+                    return
+                if n.is_finished():         # max_turns alcanzado
+                    break
+            save_log(n)
+
+    async def _decide(self, agent, n: Negotiation, gate: Optional[PriorityGate]) -> str:
+        if gate is None:
+            return await agent.adecide(n)
+        await gate.acquire(self.policy(n, self._agents_of(n)))
+        try:
+            return await agent.adecide(n)
+        finally:
+            gate.release()
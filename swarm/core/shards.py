@@ -0,0 +1,46 @@
+"""
+Partición de un mercado en sub-mercados independientes: dos negociaciones sólo se
+afectan si comparten vendedor o comprador (cierre en cascada), así que cada
+componente conexa del grafo vendedor–comprador puede correr en su propio proceso.
+"""
+from typing import Dict, List
+from .negotiation import Negotiation
+
+def split_components(negotiations: List[Negotiation]) -> List[List[Negotiation]]:
+    """
+    Connected components of the seller–buyer graph (union-find over agent ids),
+    each in its original negotiation order, ordered by their first negotiation.
+    """
+    parent: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]           # compresión de caminos
+            x = parent[x]
+        return x
+
+    for n in negotiations:
+        # Prefijos: un vendedor y un comprador podrían compartir id
+        a, b = find(f"s:{n.seller_id}"), find(f"b:{n.buyer_id}")
+        if a != b:
+            parent[b] = a
+
+    components: Dict[str, List[Negotiation]] = {}
+    for n in negotiations:
+        components.setdefault(find(f"s:{n.seller_id}"), []).append(n)
+    return list(components.values())
+
+def pack_shards(components: List[List[Negotiation]], shards: int) -> List[List[Negotiation]]:
+    """
+    Group components into at most `shards` shards of similar size (largest component
+    first into the lightest shard). Deterministic for a given config, so a resumed run
+    gets the same shards.
+    """
+    bins: List[List[Negotiation]] = [[] for _ in range(min(shards, len(components)))]
+    sizes = [0] * len(bins)
+    for comp in sorted(components, key=len, reverse=True):     # sorted() es estable
+        k = sizes.index(min(sizes))
+        bins[k].extend(comp)
+        sizes[k] += len(comp)
+    return bins
@@ -0,0 +1,130 @@
+"""
+Modo de salida estructurada: el agente responde un JSON validado contra un schema
+generado a partir de los términos de la negociación,
+
+    {"message": str, "offer": {price, delivery_days, upfront_pct | items...}, "accept": bool}
+
+y la respuesta llega al scheduler como AgentReply, con los términos ya resueltos,
+sin pasar por las regex de extract_terms_from_message.
+"""
+import json
+import math
+from typing import Dict, Optional, Union
+from .negotiation import Negotiation
+from .terms import ItemTerms, MultiItemTerms
+
+STRUCTURED_INSTRUCTIONS = (
+    "\n\nReply ONLY with a JSON object with these fields:\n"
+    '- "message": what you say to the other party.\n'
+    '- "offer": the complete terms you propose now, or the terms you accept.\n'
+    '- "accept": true only if you accept the other party\'s latest offer exactly as it '
+    "stands (this closes the deal), false otherwise."
+)
+
+class AgentReply(str):
+    """
+    Text of a turn (what is logged and shown to the counterpart) carrying the parsed
+    reply: `offer` as proposed and `terms`, the agreement terms when `accept` is true
+    (same shape as extract_terms_from_message), otherwise None.
+    """
+    offer: Dict
+    accept: bool
+    terms: Optional[Dict]
+
+    def __new__(cls, text: str, offer: Dict, accept: bool, terms: Optional[Dict]):
+        reply = super().__new__(cls, text)
+        reply.offer, reply.accept, reply.terms = offer, accept, terms
+        return reply
+
+def _number(description: str) -> Dict:
+    return {"type": "number", "description": description}
+
+def _object(properties: Dict) -> Dict:
+    # Formato "strict" de OpenAI: todo requerido y sin propiedades extra
+    return {"type": "object", "properties": properties,
+            "required": list(properties), "additionalProperties": False}
+
+def offer_schema(terms: Union[ItemTerms, MultiItemTerms]) -> Dict:
+    """JSON schema of an offer for `terms`; multi-item offers list one entry per requested item."""
+    global_terms = {"delivery_days": _number("Delivery time in days"),
+                    "upfront_pct": _number("Up-front payment, percent of the total")}
+    if isinstance(terms, MultiItemTerms):
+        items = {req.item_id: _object({"quantity": {"type": "integer"},
+                                       "price": _number(f"Unit price of {req.item_id}")})
+                 for req in terms.requests}
+        return _object({"items": _object(items), **global_terms})
+    return _object({"price": _number("Price of the item"), **global_terms})
+
+def reply_schema(terms: Union[ItemTerms, MultiItemTerms]) -> Dict:
+    """JSON schema of a whole structured reply."""
+    return _object({"message": {"type": "string"},
+                    "offer": offer_schema(terms),
+                    "accept": {"type": "boolean"}})
+
+def response_format(schema: Dict, name: str = "negotiation_reply") -> Dict:
+    """OpenAI `response_format` (chat completions and Batch) that enforces `schema`."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+def _format_deal(offer: Dict, multi: bool) -> str:
+    """Canonical "Done deal!" terms, as the free-text prompts ask for them."""
+    if multi:
+        items = ", ".join(f"{item_id}={o['quantity']}x{o['price']:g}"
+                          for item_id, o in offer["items"].items())
+        return f"{items}, delivery={offer['delivery_days']:g}, upfront={offer['upfront_pct']:g}"
+    return f"price={offer['price']:g}, delivery={offer['delivery_days']:g}, upfront={offer['upfront_pct']:g}"
+
+def _format_offer(offer: Dict, multi: bool) -> str:
+    # Sin "=" ni "NxP": una contraoferta no debe parecer un acuerdo a las regex
+    if multi:
+        head = ", ".join(f"{o['quantity']} x {item_id} at ${o['price']:g} each"
+                         for item_id, o in offer["items"].items())
+    else:
+        head = f"${offer['price']:g}"
+    return f"{head}, delivery in {offer['delivery_days']:g} days, {offer['upfront_pct']:g}% upfront"
+
+def _agreement_terms(offer: Dict, multi: bool) -> Dict:
+    """Offer in the shape extract_terms_from_message returns for an agreement."""
+    if multi:
+        items = {k: {"quantity": int(v["quantity"]), "price": float(v["price"])}
+                 for k, v in offer["items"].items()}
+        return {"items": items,
+                "total_price": sum(v["quantity"] * v["price"] for v in items.values()),
+                "delivery_days": float(offer["delivery_days"]),
+                "upfront_pct": float(offer["upfront_pct"])}
+    return {"price": float(offer["price"]),
+            "delivery_days": float(offer["delivery_days"]),
+            "upfront_pct": float(offer["upfront_pct"])}
+
+def _matches_schema(value, schema: Dict) -> bool:
+    """Whether `value` fits `schema`, for the subset of JSON schema built above."""
+    kind = schema["type"]
+    if kind == "object":
+        # Las mismas claves que pide el schema: ni faltantes ni extra (ids de ítems incluidos)
+        return (isinstance(value, dict) and set(value) == set(schema["properties"])
+                and all(_matches_schema(value[k], sub) for k, sub in schema["properties"].items()))
+    if kind == "string":
+        return isinstance(value, str)
+    if kind == "boolean":
+        return isinstance(value, bool)
+    # bool es subclase de int: true no es un número válido
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return False
+    return kind == "number" or float(value).is_integer()
+
+def parse_reply(text: str, negotiation: Negotiation) -> Optional[AgentReply]:
+    """
+    Parse a structured reply; None if `text` is not JSON matching the negotiation's
+    schema (the caller then treats it as free text). The turn text is the message
+    followed by the offer, with the canonical "Done deal! ..." line on acceptance.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not _matches_schema(data, reply_schema(negotiation.terms)):
+        return None
+    message, offer, accept = data["message"].strip(), data["offer"], data["accept"]
+    multi = negotiation.is_multi_item()
+    text = (f"{message}\nDone deal! {_format_deal(offer, multi)}" if accept
+            else f"{message}\n(Offer: {_format_offer(offer, multi)})")
+    return AgentReply(text, offer, accept, _agreement_terms(offer, multi) if accept else None)
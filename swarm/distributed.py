@@ -0,0 +1,321 @@
+"""
+Corrida distribuida: un coordinador reparte shards de negociaciones (sub-mercados
+independientes, ver core/shards) a workers en otras máquinas sobre HTTP+JSON, y los
+workers los corren con sus propios proveedores.
+
+Protocolo (POST, cuerpo y respuesta JSON):
+  /lease    {worker}                                  → {shard, lease, negotiation_ids, state, lease_s}
+                                                        o {shard: null, done}
+  /progress {worker, shard, lease, negotiations, errors} → {ok}    (también renueva el lease)
+  /complete {worker, shard, lease, negotiations, errors, stats, jobs} → {ok}
+  GET /status → conteo de shards por estado
+
+Un lease vence si el worker no reporta en `lease_s` segundos; el shard vuelve a la
+cola con los turnos que ya se habían reportado, así el próximo worker sigue desde ahí
+y no repite esas llamadas. Un reporte con un lease vencido se rechaza ({ok: false}) y
+el worker abandona el shard.
+
+Con un Checkpoint, el coordinador registra cada turno reportado en su journal; al
+retomar, los shards arrancan desde las negociaciones restauradas.
+"""
+import json, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+import requests
+from .core.checkpoint import Checkpoint, dump_negotiation, load_negotiation
+from .core.negotiation import Negotiation, NegotiationStatus
+
+class LeaseLost(RuntimeError):
+    """The coordinator gave this worker's shard to another worker."""
+
+class Coordinator:
+    """
+    Hands out `shards` (lists of negotiations) to workers and collects their results,
+    merged into the negotiation objects as they are reported. run() serves until every
+    shard is complete and returns the per-shard results.
+
+    Negotiations that already have turns or are closed (a resumed run), and their
+    `errors`, are sent to workers as the shard's starting state. With `checkpoint`,
+    every reported change is journaled like SwarmManager does, so --resume can
+    continue a served run.
+    """
+    def __init__(self, shards: List[List[Negotiation]], host: str = "127.0.0.1", port: int = 0,
+                 lease_s: float = 60.0, clock: Callable[[], float] = time.monotonic,
+                 checkpoint: Optional[Checkpoint] = None, errors: Optional[Dict[str, str]] = None):
+        self.shards = shards
+        self.lease_s = lease_s
+        self.clock = clock
+        self.checkpoint = checkpoint
+        self.negotiations = [n for shard in shards for n in shard]
+        self.by_id = {n.id: n for n in self.negotiations}
+        self.errors: Dict[str, str] = dict(errors or {})
+        # shard → {status: pending|leased|done, worker, lease, expires, state, result}
+        self.slots: List[Dict] = [{"status": "pending", "worker": None, "lease": None, "expires": 0.0,
+                                   "state": self._initial_state(shard), "result": None}
+                                  for shard in shards]
+        self.reassigned = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not shards:
+            self._done.set()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # --- ciclo de vida -----------------------------------------------
+
+    def start(self) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.start(self)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait(self, timeout: Optional[float] = None) -> List[Dict]:
+        """Block until every shard is complete and return the results."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"{self.status()} after {timeout}s")
+        self.server.shutdown()
+        self.server.server_close()
+        if self.checkpoint is not None:
+            self.checkpoint.close(self)
+        return [slot["result"] for slot in self.slots]
+
+    def run(self) -> List[Dict]:
+        self.start()
+        return self.wait()
+
+    # Lo que Checkpoint.snapshot lee de un manager
+    @property
+    def sold_sellers(self):
+        return {n.seller_id for n in self.negotiations if n.status == NegotiationStatus.AGREEMENT}
+
+    @property
+    def bought_buyers(self):
+        return {n.buyer_id for n in self.negotiations if n.status == NegotiationStatus.AGREEMENT}
+
+    def status(self) -> Dict[str, int]:
+        with self._lock:
+            self._expire()
+            counts = {"pending": 0, "leased": 0, "done": 0}
+            for slot in self.slots:
+                counts[slot["status"]] += 1
+            return {**counts, "reassigned": self.reassigned}
+
+    # --- protocolo ---------------------------------------------------
+
+    def lease(self, worker: str) -> Dict:
+        with self._lock:
+            self._expire()
+            for k, slot in enumerate(self.slots):
+                if slot["status"] == "pending":
+                    slot.update(status="leased", worker=worker, lease=uuid.uuid4().hex,
+                                expires=self.clock() + self.lease_s)
+                    return {"shard": k, "lease": slot["lease"], "lease_s": self.lease_s,
+                            "negotiation_ids": [n.id for n in self.shards[k]],
+                            "state": {key: dict(value) for key, value in slot["state"].items()}}
+            return {"shard": None, "done": self._done.is_set()}
+
+    def progress(self, body: Dict) -> Dict:
+        with self._lock:
+            slot = self._owned(body)
+            if slot is None:
+                return {"ok": False}
+            self._apply(slot, body)
+            slot["expires"] = self.clock() + self.lease_s
+            return {"ok": True}
+
+    def complete(self, body: Dict) -> Dict:
+        with self._lock:
+            slot = self._owned(body)
+            if slot is None:
+                return {"ok": False}
+            self._apply(slot, body)
+            slot.update(status="done", result={k: body.get(k) for k in ("negotiations", "errors", "stats", "jobs")})
+            if all(s["status"] == "done" for s in self.slots):
+                self._done.set()
+            return {"ok": True}
+
+    def _initial_state(self, shard: List[Negotiation]) -> Dict:
+        """Starting state of a shard: its negotiations already under way, and their errors."""
+        return {"negotiations": {n.id: dump_negotiation(n) for n in shard
+                                 if n.turns or n.status != NegotiationStatus.ONGOING},
+                "errors": {n.id: self.errors[n.id] for n in shard if n.id in self.errors}}
+
+    def _apply(self, slot: Dict, body: Dict) -> None:
+        """Merge a report into the shard's state and the negotiations (lock held)."""
+        states = {nid: saved for nid, saved in (body.get("negotiations") or {}).items()
+                  if nid in self.by_id}
+        errors = body.get("errors") or {}
+        slot["state"]["negotiations"].update(states)
+        slot["state"]["errors"].update(errors)
+        self.errors.update(errors)
+        for nid, saved in states.items():
+            n = self.by_id[nid]
+            load_negotiation(n, saved)
+            if self.checkpoint is not None:
+                self.checkpoint.record(self, n, errors.get(nid))
+
+    def _owned(self, body: Dict) -> Optional[Dict]:
+        """Slot of the report's shard if its lease is still the current one."""
+        self._expire()
+        k = body.get("shard")
+        if not isinstance(k, int) or not 0 <= k < len(self.slots):
+            return None
+        slot = self.slots[k]
+        if slot["status"] != "leased" or slot["lease"] != body.get("lease"):
+            return None
+        return slot
+
+    def _expire(self) -> None:
+        now = self.clock()
+        for slot in self.slots:
+            if slot["status"] == "leased" and slot["expires"] <= now:
+                slot.update(status="pending", worker=None, lease=None)
+                self.reassigned += 1
+
+    def _handler(self):
+        coordinator = self
+        routes = {"/lease": lambda body: coordinator.lease(str(body.get("worker"))),
+                  "/progress": coordinator.progress,
+                  "/complete": coordinator.complete}
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, payload: Dict) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/status":
+                    self._reply(200, coordinator.status())
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                route = routes.get(self.path)
+                if route is None:
+                    return self._reply(404, {"error": "not found"})
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._reply(400, {"error": "invalid JSON"})
+                self._reply(200, route(body))
+
+            def log_message(self, *args):      # sin una línea por request en stderr
+                pass
+
+        return Handler
+
+class ProgressReporter:
+    """
+    Streams a shard's turns and outcomes to the coordinator. Plugs into SwarmManager
+    where a Checkpoint would (start / record / close): record() only queues the changed
+    negotiation, and a heartbeat thread sends the queued states every `interval`
+    seconds, which also renews the lease. Once the coordinator rejects a report,
+    the next record() raises LeaseLost so the manager stops.
+    """
+    def __init__(self, session: requests.Session, url: str, worker: str, shard: int, lease: str,
+                 interval: float):
+        self.session = session
+        self.url = url
+        self.base = {"worker": worker, "shard": shard, "lease": lease}
+        self.interval = interval
+        self.lost = False
+        self.sent = 0
+        self._changed: Dict[str, Negotiation] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, manager) -> None:
+        self._thread = threading.Thread(target=self._heartbeat, daemon=True)
+        self._thread.start()
+
+    def record(self, manager, n: Negotiation, error: Optional[str] = None) -> None:
+        if self.lost:
+            raise LeaseLost(f"shard {self.base['shard']} was reassigned")
+        with self._lock:
+            self._changed[n.id] = n
+            if error:
+                self._errors[n.id] = error
+
+    def close(self, manager) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            changed, errors = self._changed, self._errors
+            self._changed, self._errors = {}, {}
+            # Copia bajo el lock: el manager sigue agregando turnos en otro hilo
+            states = {nid: dump_negotiation(n) for nid, n in changed.items()}
+        try:
+            reply = self.session.post(f"{self.url}/progress", timeout=self.interval * 2 + 5,
+                                      json={**self.base, "negotiations": states, "errors": errors}).json()
+        except requests.RequestException:
+            # Coordinador inalcanzable: reintentar en el próximo latido
+            with self._lock:
+                self._changed = {**changed, **self._changed}
+                self._errors = {**errors, **self._errors}
+            return
+        self.sent += len(states)
+        if not reply.get("ok"):
+            self.lost = True
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+            if self.lost:
+                return
+
+# (negotiation_ids, state, reporter) → resultado de run_shard
+ShardRunner = Callable[[List[str], Dict, ProgressReporter], Dict]
+
+def run_worker(url: str, execute: ShardRunner, worker: Optional[str] = None,
+               poll_interval: float = 1.0, max_shards: Optional[int] = None, retries: int = 3) -> int:
+    """
+    Lease shards from the coordinator at `url` and run them with `execute` until the
+    coordinator reports that every shard is done, stops answering (`retries` attempts
+    `poll_interval` apart) or `max_shards` are completed. Returns the number of shards
+    completed by this worker.
+    """
+    worker = worker or uuid.uuid4().hex[:8]
+    session = requests.Session()
+    completed, unreachable = 0, 0
+    while max_shards is None or completed < max_shards:
+        try:
+            job = session.post(f"{url}/lease", json={"worker": worker}, timeout=30).json()
+        except requests.ConnectionError:
+            # El coordinador se apaga apenas termina el último shard
+            unreachable += 1
+            if unreachable > retries:
+                break
+            time.sleep(poll_interval)
+            continue
+        unreachable = 0
+        if job.get("shard") is None:
+            if job.get("done"):
+                break
+            time.sleep(poll_interval)           # quedan shards, pero todos tomados
+            continue
+        reporter = ProgressReporter(session, url, worker, job["shard"], job["lease"],
+                                    interval=job["lease_s"] / 3)
+        try:
+            result = execute(job["negotiation_ids"], job["state"], reporter)
+        except LeaseLost:
+            continue
+        reply = session.post(f"{url}/complete", timeout=30,
+                             json={"worker": worker, "shard": job["shard"], "lease": job["lease"],
+                                   **result}).json()
+        completed += bool(reply.get("ok"))
+    return completed
@@ -13,27 +13,66 @@ if str(root_path) not in sys.path:
     sys.path.insert(0, str(root_path))
 
 # ---------------------------------------------------------------------------
-import argparse, yaml, os, time
-from typing import Dict, List, Union
+import argparse, multiprocessing, yaml, os, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 
 #  IMPORTS ABSOLUTOS (funcionan en ambos modos)
 from swarm.core.terms        import Range, ItemTerms, MultiItemTerms, ItemRequest
 from swarm.core.negotiation  import Negotiation
-from swarm.core.scheduler    import SwarmManager
+from swarm.core.scheduler    import SwarmManager, AsyncSwarmManager
+from swarm.core.ready_queue  import SCHEDULING_POLICIES
+from swarm.core.checkpoint   import Checkpoint, DEFAULT_CHECKPOINT_DIR, dump_negotiation, load_negotiation
+from swarm.core.shards       import split_components, pack_shards
+from swarm.distributed       import Coordinator, run_worker
+from swarm.core.batch        import BatchSwarmManager, LocalBatchBackend, DEFAULT_BATCH_DIR
 from swarm.utils.evaluator   import evaluate_swarm
 from swarm.agents.base       import SellerAgent, BuyerAgent
 from swarm.agents.repositories import OpenAIRepository, OllamaRepository, AnthropicRepository, GoogleRepository
+from swarm.agents.repositories import OpenAICompatibleRepository
+from swarm.agents.repositories import RateLimitedRepository, StreamingRepository, get_rate_limiter
+from swarm.agents.cache        import CachedRepository, CoalescingRepository, ResponseCache, SingleFlight
+from swarm.agents.clients      import configure_clients
+from swarm.agents.resilience   import (ResilientRepository, CircuitBreakerRepository,
+                                       AdaptiveConcurrencyRepository, get_aimd_limiter,
+                                       get_circuit_breaker, get_latency_tracker)
+from swarm.agents.router       import RoutedRepository, RouteStats
+from swarm.agents.output       import OutputReportRepository
+from swarm.agents.simulated    import SimulatedRepository
+from swarm.agents.batch        import OpenAIBatchBackend
 from pathlib import Path
 
 # ------------------------------------------------------------------ #
-def mk_repo(repo_type: str, model: str):
+def mk_repo(repo_type: str, model: str, agent_cfg: Dict = None, cfg: Dict = None):
+    agent_cfg, cfg = agent_cfg or {}, cfg or {}
     if repo_type == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise EnvironmentError("OPENAI_API_KEY not set")
         return OpenAIRepository(model, api_key)
+    elif repo_type == "openai_compatible":
+        # base_url / api_key_env / max_concurrency: en el agente o en la sección `endpoints`
+        ep_cfg = _provider_section(cfg.get("endpoints"), repo_type, model)
+        setting = lambda k: agent_cfg.get(k, ep_cfg.get(k))
+        if not setting("base_url"):
+            raise ValueError(f"openai_compatible model {model} needs a base_url")
+        key_env = setting("api_key_env")
+        return OpenAICompatibleRepository(model, setting("base_url"),
+                                          api_key         = os.getenv(key_env) if key_env else None,
+                                          max_concurrency = setting("max_concurrency"))
     elif repo_type == "ollama":
-        return OllamaRepository(model)
+        # Varios servidores equivalentes: sección `endpoints` (o `endpoints:` en el agente)
+        ep_cfg = _provider_section(cfg.get("endpoints"), repo_type, model)
+        # keep_alive / num_ctx / num_predict / session: sección `ollama`, sobreescribible por agente
+        ol_cfg = {**(cfg.get("ollama") or {}), **(agent_cfg.get("ollama") or {})}
+        options = {k: ol_cfg[k] for k in ("num_ctx", "num_predict") if ol_cfg.get(k) is not None}
+        return OllamaRepository(model,
+                                endpoints       = agent_cfg.get("endpoints") or ep_cfg.get("urls"),
+                                health_interval = ep_cfg.get("health_interval", 30.0),
+                                keep_alive      = ol_cfg.get("keep_alive"),
+                                options         = {**options, **(ol_cfg.get("options") or {})},
+                                sessions        = ol_cfg.get("session", False),
+                                max_sessions    = ol_cfg.get("max_sessions", 1024))
     elif repo_type == "anthropic":
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
@@ -44,8 +83,153 @@ def mk_repo(repo_type: str, model: str):
         if not api_key:
             raise EnvironmentError("GOOGLE_API_KEY not set")
         return GoogleRepository(model, api_key)
+    elif repo_type == "simulated":
+        # Defaults en la sección `simulated` del YAML; cada agente puede sobreescribirlos
+        sim_cfg = {**(cfg.get("simulated") or {}), **(agent_cfg.get("simulated") or {})}
+        return SimulatedRepository.from_config(model, sim_cfg)
     else:
-        raise ValueError(f"Unsupported repo: {repo_type}. Supported: openai, ollama, anthropic, google")
+        raise ValueError(f"Unsupported repo: {repo_type}. Supported: openai, openai_compatible, ollama, anthropic, google, simulated")
+
+def _provider_section(section: Dict, repo_type: str, model: str) -> Dict:
+    """
+    Resolve a per-provider YAML section. Keys may be `provider` (defaults for all its
+    models) or `provider/model` (overrides for one model).
+    """
+    section = section or {}
+    merged = dict(section.get(repo_type) or {})
+    merged.update(section.get(f"{repo_type}/{model}") or {})
+    return merged
+
+def wrap_repo(repo, agent_cfg: Dict, cfg: Dict, cache: ResponseCache = None,
+              flight: SingleFlight = None):
+    """
+    Apply the optional runtime layers configured in the YAML, per agent (`agent_cfg`)
+    and at the top level (`cfg`).
+    Outermost first: cache → coalesce → circuit breaker → resilience → rate limit →
+    adaptive concurrency → output report → streaming → provider.
+    """
+    repo_type, model = agent_cfg["repo"], agent_cfg["model"]
+
+    # Tope de salida: parámetro nativo del proveedor; el agente pisa el default global
+    max_tokens = agent_cfg.get("max_output_tokens", cfg.get("max_output_tokens"))
+    stop = agent_cfg.get("stop", cfg.get("stop"))
+    if max_tokens or stop:
+        repo.limit_output(max_tokens=max_tokens, stop=stop)
+
+    stream = agent_cfg.get("stream")
+    if stream:
+        stream = stream if isinstance(stream, dict) else {}
+        repo = StreamingRepository(repo,
+                                   max_chars     = stream.get("max_chars"),
+                                   stop_on_terms = stream.get("stop_on_terms", True))
+
+    if max_tokens or stop:
+        repo = OutputReportRepository(repo)
+
+    # Un limitador por proveedor: mide cada intento, sin contar la espera del rate limit
+    aimd_cfg = (cfg.get("adaptive_concurrency") or {}).get(repo_type)
+    if aimd_cfg is not None and aimd_cfg is not False:
+        aimd_cfg = aimd_cfg if isinstance(aimd_cfg, dict) else {}
+        repo = AdaptiveConcurrencyRepository(repo, get_aimd_limiter(repo_type, aimd_cfg))
+
+    limits = _provider_section(cfg.get("rate_limits"), repo_type, model)
+    if limits:
+        limiter = get_rate_limiter(repo_type, model, rpm=limits.get("rpm"), tpm=limits.get("tpm"))
+        repo = RateLimitedRepository(repo, limiter)
+
+    # Cada reintento/hedge vuelve a pasar por el rate limiter
+    resilience = {**_provider_section(cfg.get("resilience"), repo_type, model),
+                  **(agent_cfg.get("resilience") or {})}
+    if resilience:
+        repo = ResilientRepository.from_config(repo, resilience,
+                                               tracker=get_latency_tracker(repo_type, model))
+    # Fuera de los reintentos: con el circuito abierto no se reintenta nada
+    breaker_cfg = {**_provider_section(cfg.get("circuit_breaker"), repo_type, model),
+                   **(agent_cfg.get("circuit_breaker") or {})}
+    if breaker_cfg:
+        fallback = None
+        if breaker_cfg.get("fallback"):
+            # El fallback se arma como un tier más, pero sin breaker propio
+            fb_cfg = {**agent_cfg, **breaker_cfg["fallback"], "circuit_breaker": None}
+            fallback = wrap_repo(mk_repo(fb_cfg["repo"], fb_cfg["model"], fb_cfg, cfg),
+                                 fb_cfg, {**cfg, "circuit_breaker": None})
+        breaker = get_circuit_breaker(repo_type, model, breaker_cfg)
+        repo = CircuitBreakerRepository(repo, breaker, fallback=fallback)
+    if flight is not None:
+        repo = CoalescingRepository(repo, flight)
+    if cache is not None:
+        repo = CachedRepository(repo, cache)
+    return repo
+
+def build_agent_repo(agent_cfg: Dict, cfg: Dict, cache: ResponseCache = None,
+                     flight: SingleFlight = None, route_stats: RouteStats = None):
+    """
+    The agent's wrapped repository. With `escalate`, the agent's own repo/model is the
+    first tier of a RoutedRepository and each entry (which may override any agent key,
+    e.g. stream or resilience) adds a tier, tried in order when a reply is unusable.
+    """
+    tiers, labels = [], []
+    for tier in [{}] + list(agent_cfg.get("escalate") or []):
+        t_cfg = {**agent_cfg, **tier}
+        tiers.append(wrap_repo(mk_repo(t_cfg["repo"], t_cfg["model"], t_cfg, cfg),
+                               t_cfg, cfg, cache, flight))
+        labels.append(f"{t_cfg['repo']}/{t_cfg['model']}")
+    if len(tiers) == 1:
+        return tiers[0]
+    return RoutedRepository(tiers, labels=labels, route_stats=route_stats)
+
+def _layers(repo):
+    """Every layer of an agent repository, outermost first."""
+    layers = [repo]
+    while layers:
+        layer = layers.pop(0)
+        yield layer
+        layers.extend(_children(layer))
+
+def _children(layer) -> List:
+    # Un router tiene varios tiers; el resto de capas, un único `inner` (y quizá un fallback)
+    children = vars(layer).get("tiers") or [vars(layer).get("inner"), vars(layer).get("fallback")]
+    return [c for c in children if c is not None]
+
+def runtime_stats(agents) -> Dict[str, Dict]:
+    """
+    Stats of every repository layer that exposes them, summed per layer name.
+    Layers sharing a stats_source (e.g. one cache) are counted once.
+    """
+    stats, seen = {}, set()
+    for agent in agents:
+        for layer in _layers(agent.repo):
+            if hasattr(type(layer), "stats_name") and id(layer.stats_source) not in seen:
+                seen.add(id(layer.stats_source))
+                merged = stats.setdefault(layer.stats_name, {})
+                for k, v in layer.stats().items():
+                    merged[k] = merged.get(k, 0) + v
+    return stats
+
+def warm_up(agents) -> Dict[str, Tuple[float, Optional[str]]]:
+    """
+    Ping each distinct provider/model once, all in parallel, so the run starts with
+    open connections and loaded models. The provider repository itself is called,
+    below cache, rate limits and retries. Returns label → (seconds, error or None).
+    """
+    targets = {}
+    for agent in agents:
+        for layer in _layers(agent.repo):
+            if not _children(layer):
+                targets.setdefault(f"{layer.provider}/{getattr(layer, 'model', None)}", layer)
+
+    def ping(repo) -> Tuple[float, Optional[str]]:
+        t0 = time.perf_counter()
+        try:
+            repo.warm_up()
+            return time.perf_counter() - t0, None
+        except Exception as e:
+            return time.perf_counter() - t0, f"{type(e).__name__}: {e}"
+
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        return dict(zip(targets, pool.map(ping, targets.values())))
 
 # ------------------------------------------------------------------ #
 def _mk_range(mapping: Dict) -> Range:
@@ -104,27 +288,39 @@ def build_from_config(cfg_path: str):
     # Items ----------------------------------------------------------
     items = {k: parse_item(v) for k, v in cfg["items"].items()}
 
+    # Runtime --------------------------------------------------------
+    http_cfg = cfg.get("http") or {}
+    configure_clients(pool_size       = http_cfg.get("pool_size"),
+                      timeout         = http_cfg.get("timeout"),
+                      connect_timeout = http_cfg.get("connect_timeout"))
+    cache_cfg = cfg.get("cache") or {}
+    cache = ResponseCache.from_config(cache_cfg) if cache_cfg.get("enabled", bool(cache_cfg)) else None
+    flight = SingleFlight() if cfg.get("coalesce") else None
+    route_stats = RouteStats()
+
     # Agents ---------------------------------------------------------
     sellers, buyers = {}, {}
     for sid, s_cfg in cfg["agents"]["sellers"].items():
-        repo = mk_repo(s_cfg["repo"], s_cfg["model"])
+        repo = build_agent_repo(s_cfg, cfg, cache, flight, route_stats)
         sellers[sid] = SellerAgent(
             agent_id     = sid,
             prompt_path  = s_cfg["prompt"],
             repo         = repo,
             urgency      = s_cfg["urgency"],
             term_weights = s_cfg["term_weights"],
-            custom_prompt = s_cfg.get("custom_prompt")  # Optional custom prompt
+            custom_prompt = s_cfg.get("custom_prompt"),  # Optional custom prompt
+            structured   = s_cfg.get("structured", cfg.get("structured", False)),
         )
     for bid, b_cfg in cfg["agents"]["buyers"].items():
-        repo = mk_repo(b_cfg["repo"], b_cfg["model"])
+        repo = build_agent_repo(b_cfg, cfg, cache, flight, route_stats)
         buyers[bid] = BuyerAgent(
             agent_id     = bid,
             prompt_path  = b_cfg["prompt"],
             repo         = repo,
             urgency      = b_cfg["urgency"],
             term_weights = b_cfg["term_weights"],
-            custom_prompt = b_cfg.get("custom_prompt")  # Optional custom prompt
+            custom_prompt = b_cfg.get("custom_prompt"),  # Optional custom prompt
+            structured   = b_cfg.get("structured", cfg.get("structured", False)),
         )
 
     # Negotiations ---------------------------------------------------
@@ -163,18 +359,198 @@ def build_from_config(cfg_path: str):
     
     return sellers, buyers, negotiations
 
+def mk_batch_backend(batch_cfg: Dict):
+    """Backend for --batch from the top-level `batch:` section (local by default)."""
+    backend = batch_cfg.get("backend", "local")
+    if backend == "local":
+        return LocalBatchBackend(workdir=batch_cfg.get("workdir", DEFAULT_BATCH_DIR))
+    if backend == "openai":
+        return OpenAIBatchBackend(completion_window=batch_cfg.get("completion_window", "24h"))
+    raise ValueError(f"Unsupported batch backend: {backend}")
+
+def mk_checkpoint(ckpt_cfg, folder: Optional[str], resume: bool) -> Optional[Checkpoint]:
+    """
+    Checkpoint from the top-level `checkpoint:` section ({dir, snapshot_every, fsync}),
+    with --checkpoint overriding the dir. None if neither is given and not resuming.
+    """
+    if ckpt_cfg is None and folder is None and not resume:
+        return None
+    ckpt_cfg = {"dir": ckpt_cfg} if isinstance(ckpt_cfg, str) else dict(ckpt_cfg or {})
+    return Checkpoint(folder or ckpt_cfg.get("dir", DEFAULT_CHECKPOINT_DIR),
+                      snapshot_every=ckpt_cfg.get("snapshot_every", 1000),
+                      fsync=ckpt_cfg.get("fsync", False))
+
+def run_swarm(sellers, buyers, negotiations, cfg: Dict, opts: Dict,
+              checkpoint: Optional[Checkpoint] = None, errors: Optional[Dict[str, str]] = None):
+    """
+    Build the manager for `opts` ({batch, use_async, max_concurrency, policy}) and run
+    it, checkpointing when `checkpoint` is given. Returns the manager.
+    """
+    if opts.get("batch"):
+        batch_cfg = cfg.get("batch") or {}
+        backend = mk_batch_backend(batch_cfg)
+        # Sólo la Batch API remota se consulta cada 30s; un job local se espera directamente
+        remote = isinstance(backend, OpenAIBatchBackend)
+        swarm = BatchSwarmManager(sellers, buyers, negotiations, checkpoint=checkpoint, backend=backend,
+                                  poll_interval=batch_cfg.get("poll_interval", 30.0 if remote else 0.0))
+    elif opts.get("use_async"):
+        swarm = AsyncSwarmManager(sellers, buyers, negotiations, policy=opts.get("policy"),
+                                  checkpoint=checkpoint, max_concurrency=opts.get("max_concurrency"))
+    else:
+        swarm = SwarmManager(sellers, buyers, negotiations, policy=opts.get("policy"), checkpoint=checkpoint)
+    swarm.errors.update(errors or {})
+    if checkpoint:
+        checkpoint.start(swarm)
+    swarm.run()
+    if checkpoint:
+        checkpoint.close(swarm)
+    return swarm
+
+def run_shard(cfg_path: str, negotiation_ids: List[str], opts: Dict,
+              ckpt: Optional[Dict] = None, state: Optional[Dict] = None, progress=None) -> Dict:
+    """
+    Worker-process entry point: build the config, keep only the negotiations of the
+    shard (and their agents, with their own clients and caches) and run them.
+    `ckpt` ({folder, snapshot_every, fsync, resume}) checkpoints the shard on its own.
+    `state` ({negotiations, errors}) resumes a shard a distributed worker left half
+    done, and `progress` (a ProgressReporter) streams its turns instead of checkpointing.
+    Returns the negotiation states (dump_negotiation), errors and runtime stats.
+    """
+    sellers, buyers, negotiations = build_from_config(cfg_path)
+    with open(cfg_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    wanted = set(negotiation_ids)
+    negotiations = [n for n in negotiations if n.id in wanted]
+    sellers = {sid: a for sid, a in sellers.items() if any(n.seller_id == sid for n in negotiations)}
+    buyers = {bid: a for bid, a in buyers.items() if any(n.buyer_id == bid for n in negotiations)}
+
+    checkpoint, errors = progress, {}
+    if state:
+        for n in negotiations:
+            if n.id in state["negotiations"]:
+                load_negotiation(n, state["negotiations"][n.id])
+        errors = dict(state.get("errors") or {})
+    if ckpt:
+        checkpoint = Checkpoint(ckpt["folder"], snapshot_every=ckpt["snapshot_every"], fsync=ckpt["fsync"])
+        if ckpt["resume"] and checkpoint.exists():
+            errors = checkpoint.restore(negotiations)
+    swarm = run_swarm(sellers, buyers, negotiations, cfg, opts, checkpoint, errors)
+    return {"negotiations": {n.id: dump_negotiation(n) for n in negotiations},
+            "errors": swarm.errors,
+            "stats": runtime_stats([*sellers.values(), *buyers.values()]),
+            "jobs": len(getattr(swarm, "jobs", []))}
+
+def run_sharded(cfg_path: str, negotiations: List[Negotiation], opts: Dict, shards: int,
+                checkpoint: Optional[Checkpoint] = None, resume: bool = False) -> List[Dict]:
+    """
+    Split `negotiations` into independent sub-markets, run up to `shards` of them in
+    worker processes and merge the final states back into `negotiations`. Each shard
+    checkpoints to `<checkpoint dir>/shard<k>`. Returns the per-shard results.
+    """
+    groups = pack_shards(split_components(negotiations), shards)
+    ckpts = [None] * len(groups)
+    if checkpoint:
+        ckpts = [{"folder": os.path.join(checkpoint.folder, f"shard{k}"), "resume": resume,
+                  "snapshot_every": checkpoint.snapshot_every, "fsync": checkpoint.fsync}
+                 for k in range(len(groups))]
+    # spawn: cada proceso arma sus propios clientes en vez de heredar sockets e hilos
+    with ProcessPoolExecutor(max_workers=len(groups) or 1,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(run_shard, cfg_path, [n.id for n in group], opts, ckpt)
+                   for group, ckpt in zip(groups, ckpts)]
+        results = [f.result() for f in futures]
+    by_id = {n.id: n for n in negotiations}
+    for result in results:
+        for nid, saved in result["negotiations"].items():
+            load_negotiation(by_id[nid], saved)
+    return results
+
 # ------------------------------------------------------------------ #
 def main():
     ap = argparse.ArgumentParser()
     default_cfg = Path(__file__).resolve().parent / "config.yaml"
     ap.add_argument("--config", "-c", default=str(default_cfg))
+    ap.add_argument("--async", dest="use_async", action="store_true",
+                    help="run every active negotiation's next turn concurrently (asyncio)")
+    ap.add_argument("--max-concurrency", type=int, default=None,
+                    help="cap on in-flight LLM calls when using --async")
+    ap.add_argument("--batch", action="store_true",
+                    help="submit each turn of every negotiation as one offline batch job")
+    ap.add_argument("--warm-up", dest="warm_up", action="store_true",
+                    help="ping every provider/model in parallel before the timed run")
+    ap.add_argument("--schedule", choices=list(SCHEDULING_POLICIES), default=None,
+                    help="order in which ready negotiations get their turn (default: config `scheduling`, else fifo)")
+    ap.add_argument("--checkpoint", default=None, metavar="DIR",
+                    help="journal every turn to DIR and snapshot it periodically (default: config `checkpoint`)")
+    ap.add_argument("--resume", action="store_true",
+                    help="continue the run checkpointed in --checkpoint DIR (default dir: data/checkpoints)")
+    ap.add_argument("--shards", type=int, default=None, metavar="N",
+                    help="run independent sub-markets in N worker processes (0: one per CPU)")
+    ap.add_argument("--serve", default=None, metavar="HOST:PORT",
+                    help="coordinate a distributed run: hand out shards to --worker processes")
+    ap.add_argument("--worker", default=None, metavar="URL",
+                    help="run shards leased from the coordinator at URL with this config's providers")
+    ap.add_argument("--lease", type=float, default=60.0,
+                    help="seconds without a report before a worker's shard is reassigned (--serve)")
     args = ap.parse_args()
 
     sellers, buyers, negotiations = build_from_config(args.config)
+    with open(args.config, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    policy = args.schedule or cfg.get("scheduling", "fifo")
+    opts = {"batch": args.batch, "use_async": args.use_async,
+            "max_concurrency": args.max_concurrency, "policy": policy}
+
+    if args.worker:
+        done = run_worker(args.worker.rstrip("/"), lambda ids, state, reporter:
+                          run_shard(args.config, ids, opts, state=state, progress=reporter))
+        print(f"Worker finished: {done} shards completed")
+        return
+
+    checkpoint, errors = mk_checkpoint(cfg.get("checkpoint"), args.checkpoint, args.resume), {}
+    # Con --shards (sin --serve) cada proceso retoma su propio checkpoint
+    if args.resume and (args.shards is None or args.serve):
+        if not checkpoint.exists():
+            raise SystemExit(f"No checkpoint to resume in {checkpoint.folder}")
+        errors = checkpoint.restore(negotiations)
+        done = sum(n.is_finished() for n in negotiations)
+        print(f"Resuming from {checkpoint.folder}: {done}/{len(negotiations)} negotiations already closed, "
+              f"{sum(len(n.turns) for n in negotiations)} turns restored")
+
+    agents = [*sellers.values(), *buyers.values()]
+    breakers = {id(layer.breaker): layer.breaker for agent in agents for layer in _layers(agent.repo)
+                if isinstance(layer, CircuitBreakerRepository)}
+    for breaker in breakers.values():
+        breaker.listeners.append(lambda name, old, new: print(f"circuit {name}: {old} -> {new}"))
+
+    if args.warm_up:
+        print("==== WARM-UP ====")
+        for label, (seconds, error) in warm_up(agents).items():
+            print(f"{label}: {seconds:.2f}s" + (f"  failed -> {error}" if error else ""))
 
-    swarm = SwarmManager(sellers, buyers, negotiations)
     t0 = time.time()
-    swarm.run()
+    if args.serve or args.shards is not None:
+        if args.serve:
+            host, _, port = args.serve.rpartition(":")
+            groups = split_components(negotiations)
+            if args.shards:
+                groups = pack_shards(groups, args.shards)
+            coordinator = Coordinator(groups, host or "0.0.0.0", int(port), lease_s=args.lease,
+                                      checkpoint=checkpoint, errors=errors)
+            print(f"Coordinator at {coordinator.url}: {len(groups)} shards, waiting for workers")
+            results = coordinator.run()
+            note = f" ({coordinator.reassigned} reassigned)"
+        else:
+            shards = args.shards or os.cpu_count() or 1
+            results = run_sharded(args.config, negotiations, opts, shards, checkpoint, args.resume)
+            note = ""
+        errors = {nid: e for r in results for nid, e in r["errors"].items()}
+        stats = {f"shard{k} {name}": st for k, r in enumerate(results) for name, st in r["stats"].items()}
+        jobs = sum(r["jobs"] for r in results)
+        print(f"Ran {len(negotiations)} negotiations in {len(results)} shards{note}")
+    else:
+        swarm = run_swarm(sellers, buyers, negotiations, cfg, opts, checkpoint, errors)
+        errors, stats, jobs = swarm.errors, runtime_stats(agents), len(getattr(swarm, "jobs", []))
     elapsed = time.time() - t0
 
     res, agg = evaluate_swarm(negotiations, buyers, sellers)
@@ -185,6 +561,13 @@ def main():
         print(f"{nid} ({nego.get_summary()}): seller={r['seller_score']:.3f}  buyer={r['buyer_score']:.3f}  gap={r['gap']:.3f}")
     if agg:
         print(f"\nAverages -> seller={agg['avg_seller']:.3f}  buyer={agg['avg_buyer']:.3f}")
+    if args.batch:
+        print(f"\nBatch jobs: {jobs}")
+    for nid, error in errors.items():
+        print(f"{nid} failed on a repository error -> {error}")
+    for name, st in stats.items():
+        print(f"{name}: " + "  ".join(f"{k}={round(v, 3) if isinstance(v, float) else v}"
+                                      for k, v in st.items()))
     print(f"\nCompleted in {elapsed:.1f}s")
 
 # ------------------------------------------------------------------ #
@@ -1,5 +1,12 @@
+import re
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, BaseLoader, DictLoader
+from typing import Dict, Optional, Tuple
+from jinja2 import Environment, FileSystemLoader, BaseLoader, DictLoader, Template, TemplateSyntaxError
+
+# Variables que cambian turno a turno; todo lo que las precede en la plantilla
+# es estable durante una negociación y puede ir en el prefijo (system).
+DYNAMIC_VARS = ("conversation_history", "rounds_left", "other_negotiations", "current_terms")
+_DYNAMIC_RE = re.compile(r"\b(" + "|".join(DYNAMIC_VARS) + r")\b")
 
 class TemplateManager:
     def __init__(self, root: str = None):
@@ -11,6 +18,8 @@ class TemplateManager:
             trim_blocks=True,
             lstrip_blocks=True
         )
+        self._splits: Dict[str, Tuple[Optional[str], str]] = {}
+        self._compiled: Dict[str, Tuple[Optional[Template], Template]] = {}
 
     def render(self, template_path: str, **ctx) -> str:
         template = self.env.get_template(template_path)
@@ -19,4 +28,49 @@ class TemplateManager:
     def render_custom(self, custom_prompt: str, **ctx) -> str:
         """Render a custom prompt string directly instead of loading from file."""
         template = self.env.from_string(custom_prompt)
-        return template.render(**ctx) 
\ No newline at end of file
+        return template.render(**ctx)
+
+    def render_split(self, template_path: str, **ctx) -> Tuple[str, str]:
+        """Render a template file as (static prefix, per-turn tail); see split_source()."""
+        source, _, _ = self.env.loader.get_source(self.env, template_path)
+        return self._render_parts(source, ctx)
+
+    def render_custom_split(self, custom_prompt: str, **ctx) -> Tuple[str, str]:
+        """Same as render_split() for a custom prompt string."""
+        return self._render_parts(custom_prompt, ctx)
+
+    def split_source(self, source: str) -> Tuple[Optional[str], str]:
+        """
+        Cut a template at the first line that references a per-turn variable.
+        Returns (prefix, tail); prefix is None when there is no static head or the
+        cut would leave an unclosed block, in which case the whole prompt is the tail.
+        """
+        if source not in self._splits:
+            self._splits[source] = self._split(source)
+        return self._splits[source]
+
+    def _split(self, source: str) -> Tuple[Optional[str], str]:
+        lines = source.splitlines(keepends=True)
+        for i, line in enumerate(lines):
+            if _DYNAMIC_RE.search(line):
+                break
+        else:
+            return None, source
+        prefix, tail = "".join(lines[:i]), "".join(lines[i:])
+        if not prefix.strip():
+            return None, source
+        try:
+            self.env.parse(prefix)
+            self.env.parse(tail)
+        except TemplateSyntaxError:
+            return None, source
+        return prefix, tail
+
+    def _render_parts(self, source: str, ctx: Dict) -> Tuple[str, str]:
+        if source not in self._compiled:
+            prefix, tail = self.split_source(source)
+            self._compiled[source] = (self.env.from_string(prefix) if prefix else None,
+                                      self.env.from_string(tail))
+        prefix, tail = self._compiled[source]
+        system = prefix.render(**ctx).strip() if prefix else ""
+        return system, tail.render(**ctx)
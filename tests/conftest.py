@@ -1,6 +1,13 @@
 # Add shared fixtures here
+import asyncio
+import time
 import pytest
+import yaml
 from unittest.mock import MagicMock
+from swarm.agents.base import SellerAgent, BuyerAgent
+from swarm.agents.repositories import AIRepository
+from swarm.core.negotiation import Negotiation
+from swarm.core.terms import Range, ItemTerms
 
 @pytest.fixture
 def seller_constraints():
@@ -36,4 +43,111 @@ def mock_buyer(buyer_constraints):
     buyer.ai_model = MagicMock()
     buyer.ai_model.repository = MagicMock()
     buyer.ai_model.repository.model_name = "test-model"
-    return buyer 
\ No newline at end of file
+    return buyer 
+
+def _sim_agent(repo_model):
+    return {"prompt": "seller_prompt.j2" if "seller" in repo_model else "buyer_prompt.j2",
+            "model": repo_model, "repo": "simulated", "urgency": 0.7,
+            "term_weights": {"price": 0.6, "delivery_days": 0.2, "upfront_pct": 0.2}}
+
+@pytest.fixture
+def market_config(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cfg = {
+        "simulated": {"seed": 7, "accept_prob": 0.3, "min_turns": 1},
+        "items": {"item1": {"price": {"reference": 1200, "min": 800, "max": 1500},
+                            "delivery_days": {"reference": 7, "min": 3, "max": 14},
+                            "upfront_pct": {"reference": 50, "min": 0, "max": 100}}},
+        "agents": {"sellers": {f"seller{i}": _sim_agent("sim-seller") for i in range(1, 5)},
+                   "buyers": {f"buyer{i}": _sim_agent("sim-buyer") for i in range(1, 8)}},
+        # Tres sub-mercados: {seller1, seller2}, {seller3}, {seller4}
+        "negotiations": [
+            {"id": "N1", "seller": "seller1", "item": "item1", "buyers": ["buyer1", "buyer2", "buyer3"]},
+            {"id": "N2", "seller": "seller2", "item": "item1", "buyers": ["buyer3", "buyer4"]},
+            {"id": "N3", "seller": "seller3", "item": "item1", "buyers": ["buyer5", "buyer6"]},
+            {"id": "N4", "seller": "seller4", "item": "item1", "buyers": ["buyer7"]},
+        ],
+    }
+    path = tmp_path / "market.yaml"
+    path.write_text(yaml.safe_dump(cfg))
+    return str(path), cfg
+
+# ---------------------------------------------------------------- #
+#  Helpers de los tests del swarm (scheduler, batch, checkpoint...)
+# ---------------------------------------------------------------- #
+TERMS = ItemTerms(price=Range(800, 1500, 1200), delivery_days=Range(3, 14, 7), upfront_pct=Range(0, 100, 50))
+WEIGHTS = {"price": 0.6, "delivery_days": 0.2, "upfront_pct": 0.2}
+DEAL = "Done deal! price=1100, delivery=7, upfront=40"
+
+class FakeClock:
+    """Manual clock for clock= parameters: tests move `now` by hand."""
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def fake_clock():
+    return FakeClock()
+
+@pytest.fixture
+def tmp_logs(tmp_path, monkeypatch):
+    """Run in a temp dir, so save_log (./logs) and data/ stay out of the repo."""
+    monkeypatch.chdir(tmp_path)
+
+class Crash(BaseException):
+    """Simulates the process dying (not caught as a repository error)."""
+
+class ScriptedRepository(AIRepository):
+    """
+    Answers with `deal` once the conversation has `accept_after` turns, else with a
+    counter-offer. Every prompt is appended to `log` (shared between repositories);
+    the call that would be number `crash_at` in that log raises Crash instead.
+    """
+    def __init__(self, accept_after=None, deal=DEAL, delay=0.0, log=None, crash_at=None):
+        self.accept_after = accept_after
+        self.deal = deal
+        self.delay = delay
+        self.log = log if log is not None else []
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def _answer(self, prompt):
+        if self.crash_at is not None and len(self.log) + 1 == self.crash_at:
+            raise Crash()
+        self.calls += 1
+        self.log.append(prompt)
+        turns = prompt.count("\n") if prompt else 0
+        if self.accept_after is not None and turns >= self.accept_after:
+            return self.deal
+        return f"How about ${1000 + turns}?"
+
+    def run(self, prompt):
+        time.sleep(self.delay)
+        return self._answer(prompt)
+
+    async def arun(self, prompt):
+        await asyncio.sleep(self.delay)
+        return self._answer(prompt)
+
+def make_agent(cls, aid, repo):
+    # El prompt sólo contiene el historial: una línea por turno previo
+    return cls(agent_id=aid, prompt_path="unused.j2", repo=repo, urgency=0.5,
+               term_weights=WEIGHTS, custom_prompt="{{ conversation_history }}")
+
+def make_negotiation(nid, seller, buyer, max_turns=5):
+    return Negotiation(id=nid, seller_id=seller, buyer_id=buyer,
+                       item_id="item1", terms=TERMS, max_turns=max_turns)
+
+def make_market(manager_cls, seller_repo, buyer_repos, **kwargs):
+    """One seller (s1) negotiating with every buyer in `buyer_repos` under `manager_cls`."""
+    sellers = {"s1": make_agent(SellerAgent, "s1", seller_repo)}
+    buyers = {bid: make_agent(BuyerAgent, bid, repo) for bid, repo in buyer_repos.items()}
+    negos = [make_negotiation(f"N1_{bid}", "s1", bid) for bid in buyers]
+    return manager_cls(sellers, buyers, negos, **kwargs), negos
+
+def outcome(negos):
+    """What a run decided for each negotiation: status, final terms and the turns."""
+    return {n.id: (n.status.name, n.final_terms, [(t.sender_id, str(t.message)) for t in n.turns])
+            for n in negos}
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+import pytest
+from swarm.agents.batch import OpenAIBatchBackend
+from swarm.core.batch import (BatchRequest, BatchSwarmManager, LocalBatchBackend,
+                              chat_completion_params, parse_batch_output)
+from swarm.core.negotiation import NegotiationStatus
+from swarm.core.scheduler import SwarmManager
+from tests.conftest import DEAL, ScriptedRepository, make_market
+
+class FailingRepository(ScriptedRepository):
+    def run(self, prompt):
+        raise RuntimeError("quota exhausted")
+
+pytestmark = pytest.mark.usefixtures("tmp_logs")
+
+def _wait(backend, job_id, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        results = backend.poll(job_id)
+        if results is not None:
+            return results
+        time.sleep(0.01)
+    raise AssertionError("batch job did not finish")
+
+def test_local_backend_writes_openai_batch_file_and_reads_results(tmp_path):
+    backend = LocalBatchBackend(lambda cid, body: body["messages"][-1]["content"].upper(),
+                                workdir=str(tmp_path / "jobs"))
+    job_id = backend.submit([BatchRequest("a", "gpt-4o-mini", "hi", "be brief", {"temperature": 0}),
+                             BatchRequest("b", "gpt-4o-mini", "bye")])
+    results = _wait(backend, job_id)
+    assert results.replies == {"a": "HI", "b": "BYE"} and results.errors == {}
+
+    with open(os.path.join(tmp_path, "jobs", f"{job_id}.input.jsonl")) as f:
+        first = json.loads(f.readline())
+    assert first == {"custom_id": "a", "method": "POST", "url": "/v1/chat/completions",
+                     "body": {"model": "gpt-4o-mini", "temperature": 0, "messages": [
+                         {"role": "system", "content": "be brief"},
+                         {"role": "user", "content": "hi"}]}}
+
+def test_parse_batch_output_separates_errors():
+    lines = [json.dumps({"custom_id": "ok", "error": None, "response": {
+                 "status_code": 200, "body": {"choices": [{"message": {"content": " yes "}}]}}}),
+             json.dumps({"custom_id": "bad", "error": None, "response": {
+                 "status_code": 429, "body": {"error": "rate limited"}}})]
+    results = parse_batch_output(lines)
+    assert results.replies == {"ok": "yes"} and "rate limited" in results.errors["bad"]
+
+def test_batch_run_matches_round_robin_for_a_single_negotiation():
+    outcomes = []
+    for cls, kwargs in ((SwarmManager, {}), (BatchSwarmManager, {"poll_interval": 0.01})):
+        swarm, negos = make_market(cls, ScriptedRepository(), {"b1": ScriptedRepository(accept_after=3)},
+                                   **kwargs)
+        swarm.run()
+        outcomes.append([(t.sender_id, t.message) for t in negos[0].turns] + [negos[0].status])
+    assert outcomes[0] == outcomes[1]
+    assert outcomes[1][-1] == NegotiationStatus.AGREEMENT
+
+def test_batch_deal_closes_competing_negotiations_and_sends_one_job_per_phase():
+    swarm, negos = make_market(BatchSwarmManager, ScriptedRepository(),
+                               {"b1": ScriptedRepository(accept_after=2), "b2": ScriptedRepository()},
+                               poll_interval=0.01)
+    swarm.run()
+    by_id = {n.id: n for n in negos}
+    assert by_id["N1_b1"].status == NegotiationStatus.AGREEMENT
+    assert by_id["N1_b1"].turns[-1].message == DEAL
+    assert by_id["N1_b2"].status == NegotiationStatus.FAILED
+    # Un job por fase: comprador, vendedor, comprador, vendedor y en la ronda 3 b1 acepta
+    assert len(swarm.jobs) == 5
+
+def test_failed_batch_request_only_fails_its_negotiation():
+    swarm, negos = make_market(BatchSwarmManager, ScriptedRepository(),
+                               {"b1": FailingRepository(), "b2": ScriptedRepository(accept_after=2)},
+                               poll_interval=0.01)
+    swarm.run()
+    by_id = {n.id: n for n in negos}
+    assert by_id["N1_b1"].status == NegotiationStatus.FAILED
+    assert "quota exhausted" in swarm.errors["N1_b1"]
+    assert by_id["N1_b2"].status == NegotiationStatus.AGREEMENT
+
+def test_batch_body_only_carries_chat_completion_params():
+    streaming = {"temperature": 0, "max_tokens": 200, "max_chars": 800, "stop_on_terms": True}
+    assert chat_completion_params(streaming) == {"temperature": 0, "max_tokens": 200}
+    ollama = {"options": {"num_ctx": 4096}, "keep_alive": "30m"}
+    assert chat_completion_params(ollama) == {}
+    claude = {"max_tokens": 300, "temperature": 0, "stop_sequences": ["Buyer:"]}
+    assert chat_completion_params(claude) == {"max_tokens": 300, "temperature": 0}
+
+    repo = ScriptedRepository()
+    repo.generation_params = {"temperature": 0, "seed": 3, "keep_alive": "5m"}
+    bodies = []
+    def execute(cid, body):
+        bodies.append(body)
+        return repo.run(body["messages"][-1]["content"])
+    swarm, _ = make_market(BatchSwarmManager, ScriptedRepository(accept_after=0), {"b1": repo},
+                           backend=LocalBatchBackend(execute), poll_interval=0.01)
+    swarm.run()
+    assert bodies and set(bodies[0]) == {"model", "messages", "temperature", "seed"}
+
+def test_expired_openai_job_keeps_finished_results_and_fails_only_the_rest():
+    # Job vencido: sólo la request de b1 alcanzó a terminar
+    output = json.dumps({"custom_id": "N1_b1:0:b1", "error": None, "response": {
+        "status_code": 200, "body": {"choices": [{"message": {"content": "How about $1000?"}}]}}})
+    job = SimpleNamespace(status="expired", output_file_id="out", error_file_id=None)
+    backend = OpenAIBatchBackend.__new__(OpenAIBatchBackend)
+    backend.client = SimpleNamespace(
+        files=SimpleNamespace(content=lambda file_id: SimpleNamespace(text=output)),
+        batches=SimpleNamespace(retrieve=lambda job_id: job))
+    backend.submit = lambda requests: "batch_1"
+
+    swarm, negos = make_market(BatchSwarmManager, ScriptedRepository(),
+                               {"b1": ScriptedRepository(), "b2": ScriptedRepository()},
+                               backend=backend, poll_interval=0.01)
+    swarm._batch_turn(negos, lambda n: swarm.buyers[n.buyer_id])
+
+    by_id = {n.id: n for n in negos}
+    assert by_id["N1_b1"].status == NegotiationStatus.ONGOING
+    assert [t.message for t in by_id["N1_b1"].turns] == ["How about $1000?"]
+    assert by_id["N1_b2"].status == NegotiationStatus.FAILED
+    assert swarm.errors == {"N1_b2": "b2: BatchError: batch batch_1 expired"}
+
+def test_local_batch_run_does_not_sleep_between_phases(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    # Con el poll_interval por defecto (30s) y varias fases
+    swarm, negos = make_market(BatchSwarmManager, ScriptedRepository(),
+                               {"b1": ScriptedRepository(accept_after=4), "b2": ScriptedRepository()})
+    swarm.run()
+    assert [s for s in sleeps if s > 0] == []
+    assert len(swarm.jobs) >= 5 and negos[0].status == NegotiationStatus.AGREEMENT
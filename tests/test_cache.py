@@ -0,0 +1,230 @@
+import asyncio
+from unittest.mock import MagicMock
+from swarm.agents.cache import (CachedRepository, CoalescingRepository, LRUCache, ResponseCache,
+                                SingleFlight, SQLiteCache, cache_key, request_key)
+from swarm.agents.repositories import AIRepository
+
+class CountingRepository(AIRepository):
+    provider = "fake"
+
+    def __init__(self, model="m1"):
+        self.model = model
+        self.generation_params = {"temperature": 0}
+        self.calls = 0
+
+    def run(self, prompt):
+        self.calls += 1
+        return f"reply to {prompt}"
+
+def test_cache_key_covers_every_input():
+    base = cache_key("openai", "gpt-4o", {"temperature": 0}, "hi")
+    assert base == cache_key("openai", "gpt-4o", {"temperature": 0}, "hi")
+    assert base != cache_key("openai", "gpt-4o-mini", {"temperature": 0}, "hi")
+    assert base != cache_key("openai", "gpt-4o", {"temperature": 1}, "hi")
+    assert base != cache_key("anthropic", "gpt-4o", {"temperature": 0}, "hi")
+    assert base != cache_key("openai", "gpt-4o", {"temperature": 0}, "hi!")
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", "1")
+    lru.set("b", "2")
+    lru.get("a")
+    lru.set("c", "3")
+    assert lru.get("b") is None
+    assert lru.get("a") == "1" and lru.get("c") == "3"
+
+def test_lru_ttl_expires_entries(fake_clock):
+    lru = LRUCache(maxsize=10, ttl=60, clock=fake_clock)
+    lru.set("a", "1")
+    fake_clock.now += 61
+    assert lru.get("a") is None
+
+def test_sqlite_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path).set("k", "v")
+    # Otra instancia (p.ej. otro proceso) ve la misma entrada
+    assert SQLiteCache(path).get("k")[1] == "v"
+
+def test_sqlite_prunes_expired_and_oldest(tmp_path, fake_clock):
+    disk = SQLiteCache(str(tmp_path / "c.sqlite"), ttl=100, max_entries=2, clock=fake_clock)
+    disk.set("old", "x")
+    fake_clock.now += 150
+    for key in ("a", "b", "c"):
+        fake_clock.now += 1
+        disk.set(key, key)
+    disk.prune()
+    assert len(disk) == 2
+    assert disk.get("old") is None and disk.get("a") is None
+    assert disk.get("c")[1] == "c"
+
+def test_cached_repository_counts_hits_and_misses(tmp_path):
+    inner = CountingRepository()
+    cache = ResponseCache(memory_size=8, path=str(tmp_path / "c.sqlite"))
+    repo = CachedRepository(inner, cache)
+
+    assert repo.run("p") == "reply to p"
+    assert repo.run("p") == "reply to p"
+    assert asyncio.run(repo.arun("p")) == "reply to p"
+    assert inner.calls == 1
+    assert repo.stats()["misses"] == 1 and repo.stats()["hits_memory"] == 2
+
+def test_rerun_is_served_from_disk(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    CachedRepository(CountingRepository(), ResponseCache(path=path)).run("p")
+
+    inner = CountingRepository()
+    cache = ResponseCache(path=path)
+    assert CachedRepository(inner, cache).run("p") == "reply to p"
+    assert inner.calls == 0
+    assert cache.stats()["hits_disk"] == 1
+
+def test_different_models_do_not_share_entries(tmp_path):
+    cache = ResponseCache(path=None)
+    a, b = CountingRepository("m1"), CountingRepository("m2")
+    CachedRepository(a, cache).run("p")
+    CachedRepository(b, cache).run("p")
+    assert a.calls == 1 and b.calls == 1
+
+def test_wrap_repo_adds_cache_layer():
+    from swarm.main import wrap_repo, runtime_stats
+    cache = ResponseCache(path=None)
+    repo = wrap_repo(CountingRepository(), {"repo": "fake", "model": "m1"}, {}, cache)
+    assert isinstance(repo, CachedRepository)
+
+    agent = MagicMock()
+    agent.repo = repo
+    assert runtime_stats([agent, agent]) == {"cache": cache.stats()}
+
+class SlowRepository(CountingRepository):
+    def __init__(self, delay=0.05, fail=False):
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+
+    def run(self, prompt):
+        import time
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("boom")
+        return f"reply to {prompt}"
+
+    async def arun(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("boom")
+        return f"reply to {prompt}"
+
+def test_single_flight_coalesces_concurrent_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    inner = SlowRepository()
+    repo = CoalescingRepository(inner, SingleFlight())
+    with ThreadPoolExecutor(8) as pool:
+        replies = list(pool.map(repo.run, ["p"] * 8))
+
+    assert replies == ["reply to p"] * 8
+    assert inner.calls == 1
+    assert repo.stats() == {"calls": 1, "coalesced": 7, "saved_rate": 0.875}
+
+def test_single_flight_coalesces_coroutines_but_not_distinct_prompts():
+    inner = SlowRepository()
+    repo = CoalescingRepository(inner, SingleFlight())
+    async def burst():
+        return await asyncio.gather(*(repo.arun(p) for p in ["a", "a", "b", "a"]))
+    assert asyncio.run(burst()) == ["reply to a", "reply to a", "reply to b", "reply to a"]
+    assert inner.calls == 2
+    # Terminada la llamada, la siguiente vuelve al proveedor
+    assert asyncio.run(repo.arun("a")) == "reply to a" and inner.calls == 3
+
+def test_single_flight_shares_errors_and_survives_cancelled_leader():
+    flight = SingleFlight()
+    failing = CoalescingRepository(SlowRepository(fail=True), flight)
+    async def both_fail():
+        return await asyncio.gather(failing.arun("p"), failing.arun("p"), return_exceptions=True)
+    assert [type(e) for e in asyncio.run(both_fail())] == [RuntimeError, RuntimeError]
+
+    inner = SlowRepository()
+    repo = CoalescingRepository(inner, SingleFlight())
+    async def cancel_leader():
+        leader = asyncio.ensure_future(repo.arun("p"))
+        follower = asyncio.ensure_future(repo.arun("p"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+    assert asyncio.run(cancel_leader()) == "reply to p"
+    assert inner.calls == 1
+
+def test_wrap_repo_places_coalescing_inside_cache():
+    from swarm.main import wrap_repo
+    repo = wrap_repo(CountingRepository(), {"repo": "fake", "model": "m1"}, {},
+                     ResponseCache(path=None), SingleFlight())
+    assert isinstance(repo, CachedRepository) and isinstance(repo.inner, CoalescingRepository)
+
+def test_cache_key_sees_through_every_layer():
+    from swarm.main import mk_repo, wrap_repo
+    cache = ResponseCache(path=None)
+    cfg = {"rate_limits": {"simulated": {"rpm": 100000}}}
+    capped_cfg = {"repo": "simulated", "model": "m", "stream": {"max_chars": 5}}
+    plain_cfg = {"repo": "simulated", "model": "m"}
+    capped = wrap_repo(mk_repo("simulated", "m", capped_cfg, cfg), capped_cfg, cfg, cache)
+    plain = wrap_repo(mk_repo("simulated", "m", plain_cfg, cfg), plain_cfg, cfg, cache)
+
+    # cache → rate limit → streaming → provider
+    assert capped.inner.provider == "simulated"
+    assert capped.inner.generation_params["max_chars"] == 5
+    assert request_key(capped.inner, "p", {}) != request_key(plain.inner, "p", {})
+    assert len(capped.run("p")) == 5
+    assert len(plain.run("p")) > 5
+
+def test_coalescing_keeps_wrapped_repositories_apart():
+    from swarm.agents.repositories import RateLimitedRepository, RateLimiter, StreamingRepository
+    flight = SingleFlight()
+    capped = CoalescingRepository(
+        RateLimitedRepository(StreamingRepository(SlowRepository(), max_chars=5), RateLimiter()), flight)
+    plain = CoalescingRepository(RateLimitedRepository(SlowRepository(), RateLimiter()), flight)
+    async def both():
+        return await asyncio.gather(capped.arun("p"), plain.arun("p"))
+    assert asyncio.run(both()) == ["reply", "reply to p"]
+    assert flight.stats()["coalesced"] == 0
+
+def _as(agent_id, nid, fn):
+    from swarm.agents.base import current_agent, current_negotiation
+    from swarm.core.negotiation import Negotiation
+    from swarm.core.terms import ItemTerms, Range
+    terms = ItemTerms(price=Range(800, 1500, 1200), delivery_days=Range(3, 14, 7),
+                      upfront_pct=Range(0, 100, 50))
+    n = Negotiation(id=nid, seller_id="s1", buyer_id=agent_id, item_id="item1", terms=terms)
+    tokens = current_negotiation.set(n), current_agent.set(agent_id)
+    try:
+        return fn()
+    finally:
+        current_agent.reset(tokens[1])
+        current_negotiation.reset(tokens[0])
+
+def test_cache_key_includes_the_repository_context():
+    from swarm.agents.simulated import SimulatedRepository
+    inner = SimulatedRepository(accept_prob=0.5)
+    repo = CachedRepository(inner, ResponseCache(path=None))
+    # Mismo prompt de apertura: el simulador responde distinto a cada comprador
+    replies = {_as(f"b{i}", f"N1_b{i}", lambda: repo.run("same opening")) for i in range(20)}
+    assert len(replies) > 1
+    assert repo.stats()["misses"] == 20 and inner.calls == 20
+    # El mismo agente en la misma negociación sí reutiliza su respuesta
+    _as("b0", "N1_b0", lambda: repo.run("same opening"))
+    assert repo.stats()["hits_memory"] == 1 and inner.calls == 20
+    assert CachedRepository(CountingRepository(), ResponseCache(path=None)).cache_context() == {}
+
+def test_coalescing_keeps_agents_apart_when_the_context_differs():
+    from swarm.agents.simulated import SimulatedRepository
+    flight = SingleFlight()
+    repo = CoalescingRepository(SimulatedRepository(latency={"dist": "fixed", "ms": 50}), flight)
+    async def all_at_once(agents):
+        # Cada tarea copia el contexto (agente, negociación) vigente al crearla
+        tasks = [_as(a, f"N1_{a}", lambda: asyncio.ensure_future(repo.arun("same opening")))
+                 for a in agents]
+        return await asyncio.gather(*tasks)
+    asyncio.run(all_at_once([f"b{i}" for i in range(5)]))
+    assert flight.stats()["calls"] == 5 and flight.stats()["coalesced"] == 0
+    asyncio.run(all_at_once(["b0", "b0"]))
+    assert flight.stats()["coalesced"] == 1
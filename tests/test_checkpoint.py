@@ -0,0 +1,88 @@
+import pytest
+from swarm.agents.base import SellerAgent, BuyerAgent
+from swarm.core.checkpoint import Checkpoint
+from swarm.core.negotiation import Negotiation, NegotiationStatus
+from swarm.core.scheduler import SwarmManager
+from swarm.main import mk_checkpoint
+from tests.conftest import TERMS, Crash, ScriptedRepository, make_agent, make_negotiation, outcome
+
+pytestmark = pytest.mark.usefixtures("tmp_logs")
+
+def _market(log, crash_at=None):
+    def agent(cls, aid, accept_after=None):
+        return make_agent(cls, aid, ScriptedRepository(accept_after, log=log, crash_at=crash_at))
+    sellers = {"s1": agent(SellerAgent, "s1", accept_after=3), "s2": agent(SellerAgent, "s2")}
+    buyers = {f"b{i}": agent(BuyerAgent, f"b{i}") for i in range(3)}
+    negos = [make_negotiation(f"N{i}", sid, bid, max_turns=4)
+             for i, (sid, bid) in enumerate([("s1", "b0"), ("s1", "b1"), ("s2", "b2")])]
+    return sellers, buyers, negos
+
+def test_resume_after_crash_matches_uninterrupted_run(tmp_path):
+    log = []
+    sellers, buyers, negos = _market(log)
+    SwarmManager(sellers, buyers, negos).run()
+    expected, calls = outcome(negos), len(log)
+
+    for crash_at in (2, 7, calls):
+        ckpt_dir = str(tmp_path / f"ckpt{crash_at}")
+        log = []
+        sellers, buyers, negos = _market(log, crash_at=crash_at)
+        checkpoint = Checkpoint(ckpt_dir, snapshot_every=3)
+        swarm = SwarmManager(sellers, buyers, negos, checkpoint=checkpoint)
+        checkpoint.start(swarm)
+        with pytest.raises(Crash):
+            swarm.run()
+        before_crash = len(log)
+
+        log = []
+        sellers, buyers, negos = _market(log)
+        checkpoint = Checkpoint(ckpt_dir, snapshot_every=3)
+        checkpoint.restore(negos)
+        swarm = SwarmManager(sellers, buyers, negos, checkpoint=checkpoint)
+        checkpoint.start(swarm)
+        swarm.run()
+        checkpoint.close(swarm)
+
+        assert outcome(negos) == expected
+        # Sólo la llamada que estaba en vuelo no había llegado al journal
+        assert before_crash + len(log) == calls
+
+def test_restore_is_idempotent_and_tolerates_a_torn_last_line(tmp_path):
+    log = []
+    sellers, buyers, negos = _market(log)
+    checkpoint = Checkpoint(str(tmp_path / "ckpt"), snapshot_every=1000)
+    swarm = SwarmManager(sellers, buyers, negos, checkpoint=checkpoint)
+    checkpoint.start(swarm)
+    swarm.run()
+    expected = outcome(negos)
+
+    # El snapshot ya incluye lo del journal (caída entre el snapshot y vaciar el journal)
+    with open(checkpoint.journal_path, encoding="utf-8") as f:
+        journal = f.read()
+    checkpoint.close(swarm)
+    with open(checkpoint.journal_path, "w", encoding="utf-8") as f:
+        f.write(journal + '{"n": "N0", "i": 9, "tu')
+
+    _, _, fresh = _market([])
+    Checkpoint(str(tmp_path / "ckpt")).restore(fresh)
+    assert outcome(fresh) == expected
+    assert {n.status for n in fresh} == {NegotiationStatus.AGREEMENT, NegotiationStatus.FAILED}
+
+    restored = SwarmManager(sellers, buyers, fresh)
+    assert restored.sold_sellers == {"s1"} and restored.open_by_seller == {}
+
+def test_restore_rejects_a_different_config(tmp_path):
+    sellers, buyers, negos = _market([])
+    checkpoint = Checkpoint(str(tmp_path / "ckpt"))
+    checkpoint.start(SwarmManager(sellers, buyers, negos))
+
+    other = [Negotiation(id="X", seller_id="s1", buyer_id="b0", item_id="item1", terms=TERMS)]
+    with pytest.raises(ValueError):
+        Checkpoint(str(tmp_path / "ckpt")).restore(other)
+
+def test_mk_checkpoint_settings():
+    assert mk_checkpoint(None, None, resume=False) is None
+    assert mk_checkpoint(None, None, resume=True).folder == "data/checkpoints"
+    ckpt = mk_checkpoint({"dir": "runs/a", "snapshot_every": 50, "fsync": True}, None, resume=False)
+    assert (ckpt.folder, ckpt.snapshot_every, ckpt.fsync) == ("runs/a", 50, True)
+    assert mk_checkpoint("runs/a", "runs/b", resume=True).folder == "runs/b"
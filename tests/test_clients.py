@@ -0,0 +1,171 @@
+import asyncio
+import pytest
+import requests
+from unittest.mock import MagicMock, patch
+from swarm.agents import clients
+from swarm.agents.clients import (EndpointPool, configure_clients, get_async_http_client,
+                                  get_http_session, get_openai_client, reset_clients)
+from swarm.agents.repositories import OllamaRepository, OpenAIRepository
+
+@pytest.fixture(autouse=True)
+def _fresh_registry():
+    defaults = (clients.POOL_SIZE, clients.TIMEOUT, clients.CONNECT_TIMEOUT)
+    reset_clients()
+    yield
+    reset_clients()
+    clients.POOL_SIZE, clients.TIMEOUT, clients.CONNECT_TIMEOUT = defaults
+
+def test_openai_client_shared_per_key_and_base_url():
+    a = get_openai_client("k1")
+    assert get_openai_client("k1") is a
+    assert get_openai_client("k2") is not a
+    assert get_openai_client("k1", base_url="http://localhost:8000/v1") is not a
+
+def test_repositories_share_one_client():
+    repos = [OpenAIRepository(f"model-{i}", "key") for i in range(50)]
+    assert len({id(r.client) for r in repos}) == 1
+
+def test_ollama_session_is_pooled_per_base_url():
+    configure_clients(pool_size=4)
+    a = OllamaRepository("llama3")
+    b = OllamaRepository("phi4")
+    c = OllamaRepository("llama3", base_url="http://other:11434")
+
+    assert a.session is b.session
+    assert a.session is not c.session
+    assert a.session.get_adapter("http://localhost:11434")._pool_maxsize == 4
+
+def test_configured_timeouts_reach_the_clients():
+    configure_clients(timeout=30, connect_timeout=2)
+    client = get_openai_client("k")
+    assert client.timeout.read == 30 and client.timeout.connect == 2
+    assert clients.http_timeout() == (2, 30)
+
+A, B, C = "http://a:11434", "http://b:11434", "http://c:11434"
+
+def _reply(text="ok", status=200):
+    response = MagicMock()
+    response.ok = status < 400
+    response.json.return_value = {"response": text}
+    if status >= 400:
+        error = requests.HTTPError(response=MagicMock(status_code=status))
+        response.raise_for_status.side_effect = error
+    return response
+
+def test_pool_picks_least_outstanding_endpoint():
+    pool = EndpointPool([A, B, C], health_interval=None)
+    first = [pool.acquire().url for _ in range(3)]
+    assert sorted(first) == [A, B, C]
+
+    busy = pool.endpoints[1]
+    for e in pool.endpoints:
+        if e is not busy:
+            pool.release(e)
+    assert pool.acquire().url != B          # B sigue con una request en curso
+
+def test_ollama_fails_over_and_skips_down_endpoint():
+    repo = OllamaRepository("llama3", endpoints=[A, B], health_interval=None)
+    a, b = repo.pool.endpoints
+    with patch.object(a.session, "post", side_effect=requests.ConnectionError()) as post_a, \
+         patch.object(b.session, "post", return_value=_reply("from b")):
+        assert repo.run("hi") == "from b"
+        assert repo.run("hi") == "from b"
+    assert post_a.call_count == 1           # A quedó marcado caído
+    assert not a.healthy and repo.stats()["failovers"] == 1
+    assert repo.stats()[f"{B}:served"] == 2 and a.outstanding == b.outstanding == 0
+
+def test_client_errors_do_not_fail_over():
+    repo = OllamaRepository("llama3", endpoints=[A, B], health_interval=None)
+    a, b = repo.pool.endpoints
+    with patch.object(a.session, "post", return_value=_reply(status=404)), \
+         patch.object(b.session, "post", return_value=_reply(status=404)):
+        with pytest.raises(requests.HTTPError):
+            repo.run("hi")
+    assert a.healthy and b.healthy and repo.stats()["failovers"] == 0
+
+def test_health_check_brings_endpoint_back():
+    pool = EndpointPool([A, B], health_interval=None)
+    a = pool.endpoints[0]
+    pool.release(pool.acquire(), ok=False)
+    assert not a.healthy
+    with patch.object(a.session, "get", return_value=_reply()), \
+         patch.object(pool.endpoints[1].session, "get", side_effect=requests.ConnectionError()):
+        pool.check()
+    assert a.healthy and not pool.endpoints[1].healthy
+
+def test_mk_repo_reads_endpoints_section():
+    from swarm.main import mk_repo
+    cfg = {"endpoints": {"ollama": {"urls": [A, B], "health_interval": None}}}
+    repo = mk_repo("ollama", "llama3", {}, cfg)
+    assert [e.url for e in repo.pool.endpoints] == [A, B]
+    repo = mk_repo("ollama", "llama3", {"endpoints": [C]}, cfg)
+    assert [e.url for e in repo.pool.endpoints] == [C]
+
+def test_ollama_warm_up_loads_model_on_every_endpoint():
+    repo = OllamaRepository("llama3", endpoints=[A, B], health_interval=None, keep_alive="10m")
+    a, b = repo.pool.endpoints
+    with patch.object(a.session, "post", return_value=_reply()) as post_a, \
+         patch.object(b.session, "post", return_value=_reply()) as post_b:
+        repo.warm_up()
+    for post in (post_a, post_b):
+        assert post.call_args[1]["json"] == {"model": "llama3", "keep_alive": "10m"}
+
+def test_warm_up_pings_each_provider_model_once_below_the_layers():
+    from swarm.main import build_agent_repo, warm_up
+    from swarm.agents.repositories import AIRepository
+
+    class Pinged(AIRepository):
+        provider = "fake"
+
+        def __init__(self, model, error=None):
+            self.model, self.error, self.pings = model, error, 0
+
+        def run(self, prompt, **kwargs):
+            self.pings += 1
+            if self.error:
+                raise self.error
+            return "OK"
+
+    shared, broken = Pinged("m"), Pinged("down", ConnectionError("refused"))
+    cfg = {"rate_limits": {"fake": {"rpm": 1}}}
+    with patch("swarm.main.mk_repo", side_effect=[shared, shared, broken]):
+        agents = [MagicMock(repo=build_agent_repo({"repo": "fake", "model": "m"}, cfg)) for _ in range(2)]
+        agents.append(MagicMock(repo=build_agent_repo({"repo": "fake", "model": "down"}, cfg)))
+
+    report = warm_up(agents)
+    assert shared.pings == 1 and broken.pings == 1
+    assert report["fake/m"][1] is None
+    assert report["fake/down"][1] == "ConnectionError: refused"
+
+def test_async_clients_are_per_loop_and_closed_with_it():
+    async def twice():
+        return get_openai_client("k", async_=True), get_openai_client("k", async_=True)
+    first, again = asyncio.run(twice())
+    second, _ = asyncio.run(twice())
+    assert first is again and first is not second
+    # asyncio.run cerró cada loop: sus clientes se cerraron y no quedan en el registro
+    assert first.is_closed() and second.is_closed()
+    assert clients._loop_clients == {} and clients._loop_closers == {}
+
+def test_clients_of_a_loop_closed_without_asyncio_run_are_dropped():
+    loop = asyncio.new_event_loop()
+    async def get():
+        return get_async_http_client("http://localhost:11434")
+    client = loop.run_until_complete(get())
+    loop.close()
+    assert asyncio.run(get()) is not client
+    assert loop not in clients._loop_clients
+
+def test_reset_clients_closes_what_it_drops():
+    session = get_http_session(A)
+    with patch.object(session, "close") as close:
+        reset_clients()
+    close.assert_called_once()
+
+    loop = asyncio.new_event_loop()
+    async def get():
+        return get_async_http_client(A)
+    client = loop.run_until_complete(get())
+    reset_clients()
+    assert client.is_closed
+    loop.close()
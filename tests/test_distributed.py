@@ -0,0 +1,103 @@
+import threading
+import requests
+from swarm.core.checkpoint import Checkpoint, dump_negotiation
+from swarm.core.shards import split_components
+from swarm.distributed import Coordinator, run_worker
+from swarm.main import build_from_config, run_shard, run_swarm
+from tests.conftest import outcome
+
+def test_expired_lease_is_reassigned_with_the_streamed_state(market_config, fake_clock):
+    path, _ = market_config
+    _, _, negos = build_from_config(path)
+    coordinator = Coordinator(split_components(negos), lease_s=10, clock=fake_clock)
+
+    job = coordinator.lease("w1")
+    assert job["shard"] == 0 and job["state"] == {"negotiations": {}, "errors": {}}
+    partial_state = {"N1_buyer1": {"turns": [["buyer1", "How about $900?", 1.0]],
+                                   "status": "ONGOING", "final_terms": None}}
+    report = {"worker": "w1", "shard": 0, "lease": job["lease"], "negotiations": partial_state}
+    assert coordinator.progress(report) == {"ok": True}
+
+    fake_clock.now = 11
+    retry = coordinator.lease("w2")
+    assert retry["shard"] == 0 and retry["lease"] != job["lease"]
+    assert retry["state"]["negotiations"] == partial_state
+    assert coordinator.reassigned == 1
+    # El worker original ya no puede reportar ni completar el shard
+    assert coordinator.progress(report) == {"ok": False}
+    assert coordinator.complete(report) == {"ok": False}
+
+    # El nuevo worker sigue la negociación desde el turno reportado
+    result = run_shard(path, retry["negotiation_ids"], {"policy": "fifo"}, state=retry["state"])
+    turns = result["negotiations"]["N1_buyer1"]["turns"]
+    assert turns[0] == ["buyer1", "How about $900?", 1.0]
+    assert len(turns) == 1 or turns[1][0] == "seller1"
+    coordinator.server.server_close()
+
+def test_workers_on_localhost_finish_the_run_after_one_dies(market_config):
+    path, cfg = market_config
+    sellers, buyers, expected = build_from_config(path)
+    run_swarm(sellers, buyers, expected, cfg, {"policy": "fifo"})
+
+    _, _, negos = build_from_config(path)
+    coordinator = Coordinator(split_components(negos), lease_s=0.6)
+    coordinator.start()
+
+    # Un worker toma un shard y muere sin reportar nada
+    dead = requests.post(f"{coordinator.url}/lease", json={"worker": "dead"}).json()
+    assert dead["shard"] is not None
+
+    execute = lambda ids, state, reporter: run_shard(path, ids, {"policy": "fifo"},
+                                                     state=state, progress=reporter)
+    completed = {}
+    workers = [threading.Thread(target=lambda w=w: completed.update(
+                   {w: run_worker(coordinator.url, execute, worker=w, poll_interval=0.1)}))
+               for w in ("w1", "w2")]
+    for t in workers:
+        t.start()
+    results = coordinator.wait(timeout=30)
+    for t in workers:
+        t.join(timeout=10)
+
+    assert sum(completed.values()) == len(results) == 3
+    assert coordinator.reassigned >= 1
+    assert outcome(negos) == outcome(expected)
+
+def test_served_run_is_checkpointed_and_resumes_from_it(market_config, tmp_path):
+    path, _ = market_config
+    _, _, negos = build_from_config(path)
+    coordinator = Coordinator(split_components(negos), checkpoint=Checkpoint(str(tmp_path / "ckpt")))
+    coordinator.start()
+    execute = lambda ids, state, reporter: run_shard(path, ids, {"policy": "fifo"},
+                                                     state=state, progress=reporter)
+    worker = threading.Thread(target=run_worker, args=(coordinator.url, execute),
+                              kwargs={"poll_interval": 0.1})
+    worker.start()
+    coordinator.wait(timeout=30)
+    worker.join(timeout=10)
+
+    _, _, restored = build_from_config(path)
+    Checkpoint(str(tmp_path / "ckpt")).restore(restored)
+    assert outcome(restored) == outcome(negos)
+
+    # Al retomar, cada shard sale con las negociaciones restauradas y sus errores
+    resumed = Coordinator(split_components(restored), errors={"N1_buyer1": "buyer1: boom"})
+    jobs = [resumed.lease("w") for _ in range(3)]
+    states = {nid: saved for job in jobs for nid, saved in job["state"]["negotiations"].items()}
+    assert states == {n.id: dump_negotiation(n) for n in negos}
+    assert any(job["state"]["errors"] == {"N1_buyer1": "buyer1: boom"} for job in jobs)
+    resumed.server.server_close()
+
+def test_status_endpoint(market_config):
+    path, _ = market_config
+    _, _, negos = build_from_config(path)
+    coordinator = Coordinator(split_components(negos))
+    coordinator.start()
+    try:
+        requests.post(f"{coordinator.url}/lease", json={"worker": "w"})
+        assert requests.get(f"{coordinator.url}/status").json() == \
+            {"pending": 2, "leased": 1, "done": 0, "reassigned": 0}
+        assert requests.post(f"{coordinator.url}/nope", json={}).status_code == 404
+    finally:
+        coordinator.server.shutdown()
+        coordinator.server.server_close()
@@ -173,4 +173,48 @@ def test_create_negotiation_prompt(negotiator):
     assert "Current situation:" in prompt
     assert "$1200" in prompt
     assert "10 days" in prompt
-    assert "75%" in prompt 
\ No newline at end of file
+    assert "75%" in prompt 
+
+def test_parse_terms_drops_value_on_the_table(negotiator):
+    terms, confident = negotiator.parse_terms(
+        "$1100 is too low. I propose $1300, delivery in 12 days and 60% upfront.",
+        {"price": 1100, "delivery_time": 10, "payment_terms": 75})
+    assert confident
+    assert terms == {"price": 1300, "delivery_time": 12, "payment_terms": 60}
+
+def test_parse_terms_flags_ambiguous_offers(negotiator):
+    terms, confident = negotiator.parse_terms(
+        "I could do $1300 with 60% upfront, or $1250 with 70% upfront.",
+        {"price": 1100, "delivery_time": 10, "payment_terms": 75})
+    assert not confident
+    assert terms["price"] == 1300
+
+    assert negotiator.parse_terms("Let's keep talking.")[1]
+    assert not negotiator.parse_terms("How about one thousand, in 2 weeks?")[1]
+
+def test_extract_terms_calls_llm_only_when_not_confident(negotiator):
+    negotiator.ai_model = MagicMock()
+    negotiator.ai_model.generate_text.return_value = '{"price": 1250, "delivery_time": null, "payment_terms": 70}'
+
+    assert negotiator.extract_terms("I propose $1300, delivery in 12 days.") == {"price": 1300, "delivery_time": 12}
+    negotiator.ai_model.generate_text.assert_not_called()
+
+    terms = negotiator.extract_terms("I could do $1300 with 60% upfront, or $1250 with 70% upfront.")
+    assert terms == {"price": 1250, "payment_terms": 70}
+    assert negotiator.ai_model.generate_text.call_count == 1
+
+def test_extract_terms_modes(negotiator):
+    negotiator.ai_model = MagicMock()
+    negotiator.ai_model.generate_text.return_value = '{"price": 1250, "delivery_time": null, "payment_terms": null}'
+    ambiguous = "I could do $1300 or $1350."
+
+    negotiator.term_extraction = "parser"
+    assert negotiator.extract_terms(ambiguous) == {"price": 1300}
+    negotiator.ai_model.generate_text.assert_not_called()
+
+    negotiator.term_extraction = "llm"
+    assert negotiator.extract_terms("I propose $1300") == {"price": 1250}
+    assert negotiator.ai_model.generate_text.call_count == 1
+
+    with pytest.raises(ValueError):
+        AINegotiator(name="x", is_seller=True, constraints={}, term_extraction="regex")
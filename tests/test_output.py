@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+from swarm.agents.base import current_agent, current_negotiation
+from swarm.agents.output import OutputReportRepository
+from swarm.agents.repositories import (AIRepository, AnthropicRepository, OllamaRepository,
+                                       OpenAIRepository, report_completion)
+from swarm.core.negotiation import Negotiation
+from swarm.core.terms import Range, ItemTerms
+
+terms = ItemTerms(
+    price=Range(800, 1500, 1200),
+    delivery_days=Range(3, 14, 7),
+    upfront_pct=Range(0, 100, 50)
+)
+
+class CappedRepository(AIRepository):
+    """Fake provider that reports a cut whenever the reply is longer than `cap` chars."""
+    provider = "fake"
+
+    def __init__(self, replies, cap):
+        self.model = "m"
+        self.replies = list(replies)
+        self.cap = cap
+
+    def run(self, prompt, **kwargs):
+        reply = self.replies.pop(0)
+        report_completion(truncated=len(reply) > self.cap)
+        return reply[:self.cap]
+
+def _as_agent(agent_id, fn):
+    n = Negotiation(id="N", seller_id="s", buyer_id="b", item_id="item1", terms=terms)
+    tokens = current_negotiation.set(n), current_agent.set(agent_id)
+    try:
+        return fn()
+    finally:
+        current_agent.reset(tokens[1])
+        current_negotiation.reset(tokens[0])
+
+def test_report_counts_truncated_and_usable_replies_per_agent():
+    inner = CappedRepository(["I can do $1100, delivery in 7 days.",
+                              "Let me explain our company history at great length first",
+                              "ok"], cap=20)
+    repo = OutputReportRepository(inner)
+    for _ in range(3):
+        _as_agent("b", lambda: repo.run("p"))
+
+    stats = repo.stats()
+    assert stats["b/m:calls"] == 3
+    assert stats["b/m:truncated_rate"] == 0.667
+    assert stats["b/m:truncated_usable"] == 1        # "$1100" sobrevivió al corte
+    assert stats["b/m:usable_rate"] == 0.333
+
+def test_report_async_path_sees_provider_report():
+    repo = OutputReportRepository(CappedRepository(["x" * 50], cap=10))
+    asyncio.run(repo.arun("p"))
+    assert repo.stats()["fake/m:truncated_rate"] == 1.0
+
+def test_limit_output_maps_to_native_parameters():
+    openai_repo = OpenAIRepository("gpt-4o-mini", "key")
+    openai_repo.limit_output(max_tokens=200, stop=["\n\n", "a", "b", "c", "d"])
+    assert openai_repo.generation_params == {"temperature": 0, "max_tokens": 200,
+                                             "stop": ["\n\n", "a", "b", "c"]}
+
+    ollama = OllamaRepository("llama3", options={"num_ctx": 4096})
+    ollama.limit_output(max_tokens=150, stop=["Buyer:"])
+    assert ollama.generation_params == {"options": {"num_ctx": 4096, "num_predict": 150,
+                                                    "stop": ["Buyer:"]}}
+
+    with patch.dict("sys.modules", anthropic=MagicMock()):
+        claude = AnthropicRepository("claude-3-haiku-20240307", "key")
+    claude.limit_output(max_tokens=300, stop=["Buyer:"])
+    assert claude.generation_params["max_tokens"] == 300
+    assert claude.generation_params["stop_sequences"] == ["Buyer:"]
+
+def test_ollama_reports_length_cut():
+    repo = OllamaRepository("llama3")
+    response = MagicMock()
+    response.json.return_value = {"response": "cut", "done": True, "done_reason": "length"}
+    report = OutputReportRepository(repo)
+    with patch.object(repo.session, "post", return_value=response):
+        report.run("hi")
+    assert report.stats()["ollama/llama3:truncated_rate"] == 1.0
+
+def test_wrap_repo_applies_agent_cap_over_global_default():
+    from swarm.main import wrap_repo
+    inner = OpenAIRepository("gpt-4o-mini", "key")
+    repo = wrap_repo(inner, {"repo": "openai", "model": "gpt-4o-mini", "max_output_tokens": 120},
+                     {"max_output_tokens": 400, "stop": ["###"]})
+    assert isinstance(repo, OutputReportRepository)
+    assert inner.generation_params["max_tokens"] == 120 and inner.generation_params["stop"] == ["###"]
@@ -1,7 +1,19 @@
+import asyncio, json, threading, time
 import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
 from main import OllamaRepository, OpenAIRepository
-from swarm.agents.repositories import AnthropicRepository, GoogleRepository
+from swarm.agents.clients import configure_clients, reset_clients
+from swarm.agents.repositories import (AIRepository, AnthropicRepository, GoogleRepository,
+                                       RateLimitedRepository, RateLimiter, StreamingRepository,
+                                       TokenBucket, get_rate_limiter, ConcurrencyLimiter,
+                                       OpenAICompatibleRepository)
+from swarm.agents.repositories import OllamaRepository as SwarmOllamaRepository
+from swarm.agents.repositories import OpenAIRepository as SwarmOpenAIRepository
+from swarm.main import wrap_repo
+from swarm.agents.base import current_agent, current_negotiation
+from swarm.core.negotiation import Negotiation, Turn
+from swarm.core.terms import ItemTerms, Range
 import openai
 
 def test_ollama_run_success():
@@ -93,6 +105,16 @@ def test_anthropic_initialization():
     except ImportError:
         pytest.skip("anthropic library not installed")
 
+def test_providers_place_system_prefix_for_caching():
+    messages = SwarmOpenAIRepository._messages("turn", "rules")
+    assert messages == [{"role": "system", "content": "rules"}, {"role": "user", "content": "turn"}]
+
+    with patch.dict("sys.modules", anthropic=MagicMock()):
+        repo = AnthropicRepository("claude-3-5-haiku-latest", "key")
+    request = repo._request("turn", "rules", None)
+    assert request["system"][0]["cache_control"] == {"type": "ephemeral"}
+    assert request["messages"] == [{"role": "user", "content": "turn"}]
+
 def test_google_initialization():
     # Test that we can at least instantiate the class if google-generativeai is available
     # This will be skipped if google-generativeai is not installed
@@ -103,4 +125,342 @@ def test_google_initialization():
         assert repo.model == "gemini-1.5-pro"
         assert repo.client is not None
     except ImportError:
-        pytest.skip("google-generativeai library not installed") 
\ No newline at end of file
+        pytest.skip("google-generativeai library not installed") 
+
+def test_token_bucket_waits_when_empty(fake_clock):
+    bucket = TokenBucket(per_minute=60, clock=fake_clock)   # 1 unidad por segundo
+
+    assert bucket.take(60) == 0.0
+    assert bucket.take(1) == pytest.approx(1.0)
+    assert bucket.take(1) == pytest.approx(2.0)
+    fake_clock.now = 10.0
+    assert bucket.take(1) == 0.0
+
+def test_rate_limiter_combines_request_and_token_buckets(fake_clock):
+    limiter = RateLimiter(rpm=600, tpm=60, clock=fake_clock)
+
+    assert limiter.reserve(tokens=30) == 0.0
+    # Queda presupuesto de requests pero no de tokens
+    assert limiter.reserve(tokens=60) == pytest.approx(30.0)
+
+def test_rate_limiters_are_shared_per_provider_and_model():
+    a = get_rate_limiter("openai", "shared-model", rpm=10)
+    b = get_rate_limiter("openai", "shared-model", rpm=99)
+    c = get_rate_limiter("openai", "other-model", rpm=10)
+    assert a is b
+    assert a is not c
+
+def test_rate_limited_repository_paces_and_delegates():
+    inner = MagicMock()
+    inner.run.return_value = "ok"
+    inner.model = "m"
+    limiter = MagicMock(spec=RateLimiter)
+
+    repo = RateLimitedRepository(inner, limiter)
+    assert repo.run("hello world") == "ok"
+    assert repo.model == "m"
+    limiter.acquire.assert_called_once()
+    limiter.consume.assert_called_once()
+
+def test_wrap_repo_applies_rate_limits_from_config():
+    cfg = {"rate_limits": {"ollama": {"rpm": 100}, "ollama/llama3": {"tpm": 5000}}}
+
+    repo = wrap_repo(MagicMock(), {"repo": "ollama", "model": "llama3"}, cfg)
+    assert isinstance(repo, RateLimitedRepository)
+    assert repo.limiter.rpm == 100 and repo.limiter.tpm == 5000
+    assert wrap_repo(inner := MagicMock(), {"repo": "openai", "model": "gpt-4o"}, cfg) is inner
+
+class ChunkedRepository:
+    """Fake provider whose stream records how many chunks were pulled."""
+    provider = "fake"
+    generation_params = {}
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.pulled = 0
+        self.closed = False
+
+    def stream(self, prompt):
+        try:
+            for c in self.chunks:
+                self.pulled += 1
+                yield c
+        finally:
+            self.closed = True
+
+    async def astream(self, prompt):
+        for c in self.stream(prompt):
+            yield c
+
+DEAL_CHUNKS = ["Great. ", "Done deal! price=1100,", " delivery=7, upfront=40", ". I look forward", " to working", " with you."]
+
+def test_streaming_stops_once_offer_is_complete():
+    inner = ChunkedRepository(DEAL_CHUNKS)
+    repo = StreamingRepository(inner)
+
+    out = repo.run("prompt")
+    assert out.startswith("Great. Done deal! price=1100, delivery=7, upfront=40")
+    assert inner.pulled == 4 and inner.closed
+    assert repo.stats()["early_stops"] == 1
+
+def test_streaming_enforces_max_chars():
+    inner = ChunkedRepository(["a" * 10] * 10)
+    repo = StreamingRepository(inner, max_chars=25)
+
+    assert repo.run("prompt") == "a" * 25
+    assert inner.pulled == 3
+    assert repo.stats()["length_stops"] == 1
+
+def test_streaming_async_path():
+    inner = ChunkedRepository(DEAL_CHUNKS)
+    out = asyncio.run(StreamingRepository(inner).arun("prompt"))
+    assert "upfront=40" in out and inner.pulled == 4
+
+def test_streaming_params_are_part_of_cache_key():
+    repo = StreamingRepository(ChunkedRepository([]), max_chars=100)
+    assert repo.generation_params["max_chars"] == 100
+
+def test_ollama_stream_parses_ndjson():
+    repo = SwarmOllamaRepository("llama3")
+    lines = [b'{"response": "Hel", "done": false}', b'', b'{"response": "lo", "done": false}',
+             b'{"response": "", "done": true}']
+    response = MagicMock()
+    response.iter_lines.return_value = lines
+    with patch.object(repo.session, "post", return_value=response) as post:
+        assert "".join(repo.stream("hi")) == "Hello"
+    assert post.call_args[1]["json"]["stream"] is True
+    response.close.assert_called_once()
+
+def test_default_astream_falls_back_to_run():
+    class Plain(AIRepository):
+        def run(self, prompt):
+            return "whole answer"
+
+    async def collect():
+        return [c async for c in Plain().astream("p")]
+    assert asyncio.run(collect()) == ["whole answer"]
+
+class SlowOllama(BaseHTTPRequestHandler):
+    """Stand-in Ollama: answers after `delay` seconds and tracks peak concurrency."""
+    delay = 0.3
+    state = {"in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            self.state["in_flight"] += 1
+            self.state["peak"] = max(self.state["peak"], self.state["in_flight"])
+        time.sleep(self.delay)
+        with self.lock:
+            self.state["in_flight"] -= 1
+        if payload["stream"]:
+            body = b"".join(json.dumps({"response": c, "done": False}).encode() + b"\n"
+                            for c in ("o", "k")) + b'{"response": "", "done": true}\n'
+        else:
+            body = json.dumps({"response": "ok"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class BacklogServer(ThreadingHTTPServer):
+    request_queue_size = 128
+
+@pytest.fixture
+def slow_ollama():
+    SlowOllama.state.update(in_flight=0, peak=0)
+    server = BacklogServer(("127.0.0.1", 0), SlowOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reset_clients()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    configure_clients(pool_size=10)
+    reset_clients()
+
+def test_ollama_arun_keeps_every_call_in_flight(slow_ollama):
+    calls = 64                              # más que los hilos del executor por defecto
+    configure_clients(pool_size=calls)
+    repo = SwarmOllamaRepository("llama3", base_url=slow_ollama)
+
+    async def burst():
+        return await asyncio.gather(*(repo.arun(f"p{i}") for i in range(calls)))
+    assert asyncio.run(burst()) == ["ok"] * calls
+    assert SlowOllama.state["peak"] == calls
+
+def test_ollama_astream_is_native(slow_ollama):
+    repo = SwarmOllamaRepository("llama3", base_url=slow_ollama)
+
+    async def collect():
+        return [c async for c in repo.astream("p")]
+    assert asyncio.run(collect()) == ["o", "k"]
+
+class FakeOpenAIServer(BaseHTTPRequestHandler):
+    """Stand-in OpenAI-compatible chat server (vLLM style), echoing the last user message."""
+    delay = 0.05
+    state = {"in_flight": 0, "peak": 0, "auth": None}
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            self.state["in_flight"] += 1
+            self.state["peak"] = max(self.state["peak"], self.state["in_flight"])
+            self.state["auth"] = self.headers.get("Authorization")
+        time.sleep(self.delay)
+        with self.lock:
+            self.state["in_flight"] -= 1
+        reply = f"echo {body['messages'][-1]['content']}"
+        base = {"id": "x", "created": 0, "model": body["model"]}
+        if body.get("stream"):
+            events = [{**base, "object": "chat.completion.chunk",
+                       "choices": [{"index": 0, "delta": {"content": w}, "finish_reason": None}]}
+                      for w in (reply[:4], reply[4:])]
+            payload = b"".join(b"data: " + json.dumps(e).encode() + b"\n\n" for e in events)
+            payload += b"data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps({**base, "object": "chat.completion", "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": reply},
+                 "finish_reason": "stop"}]}).encode()
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def openai_server():
+    FakeOpenAIServer.state.update(in_flight=0, peak=0, auth=None)
+    server = BacklogServer(("127.0.0.1", 0), FakeOpenAIServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reset_clients()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    reset_clients()
+
+def test_openai_compatible_against_local_server(openai_server):
+    repo = OpenAICompatibleRepository("local-model", openai_server)
+    assert repo.run("hi", system="be brief") == "echo hi"
+    assert "".join(repo.stream("hi")) == "echo hi"
+    assert FakeOpenAIServer.state["auth"] == "Bearer not-needed"
+
+def test_openai_compatible_caps_in_flight_requests(openai_server):
+    repos = [OpenAICompatibleRepository(f"m{i}", openai_server, max_concurrency=4) for i in range(2)]
+    assert repos[0].limiter is repos[1].limiter          # el límite es por endpoint
+
+    async def burst():
+        return await asyncio.gather(*(repos[i % 2].arun(f"p{i}") for i in range(20)))
+    assert asyncio.run(burst()) == [f"echo p{i}" for i in range(20)]
+    assert FakeOpenAIServer.state["peak"] == 4
+
+def test_concurrency_limiter_is_shared_by_threads_and_can_grow():
+    from concurrent.futures import ThreadPoolExecutor
+    limiter = ConcurrencyLimiter(2)
+    state = {"in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def call(_):
+        with limiter.slot():
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.02)
+            with lock:
+                state["in_flight"] -= 1
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(call, range(16)))
+    assert state["peak"] == 2
+
+    limiter.set_limit(3)
+    state["peak"] = 0
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(call, range(16)))
+    assert state["peak"] == 3 and limiter.in_flight == 0
+
+def test_mk_repo_openai_compatible(monkeypatch):
+    from swarm.main import mk_repo
+    monkeypatch.setenv("VLLM_KEY", "secret")
+    cfg = {"endpoints": {"openai_compatible/qwen": {"base_url": "http://gpu:8000/v1/",
+                                                    "max_concurrency": 32}}}
+    repo = mk_repo("openai_compatible", "qwen", {"api_key_env": "VLLM_KEY"}, cfg)
+    assert repo.base_url == "http://gpu:8000/v1" and repo.api_key == "secret"
+    assert repo.limiter.limit == 32
+    with pytest.raises(ValueError, match="base_url"):
+        mk_repo("openai_compatible", "other", {}, {})
+
+def _ollama_chat(repo, negotiation, agent_id, prompt):
+    """Run one turn of `agent_id` and return the payload posted to Ollama."""
+    response = MagicMock()
+    response.json.return_value = {"message": {"role": "assistant", "content": "reply"}}
+    tokens = current_negotiation.set(negotiation), current_agent.set(agent_id)
+    try:
+        with patch.object(repo.session, "post", return_value=response) as post:
+            assert repo.run(prompt, system="persona") == "reply"
+    finally:
+        current_agent.reset(tokens[1])
+        current_negotiation.reset(tokens[0])
+    assert post.call_args[0][0].endswith("/api/chat")
+    return post.call_args[1]["json"]
+
+def test_ollama_session_transcript_only_grows():
+    terms = ItemTerms(price=Range(800, 1500, 1200), delivery_days=Range(3, 14, 7),
+                      upfront_pct=Range(0, 100, 50))
+    n = Negotiation(id="N", seller_id="s", buyer_id="b", item_id="item1", terms=terms, max_turns=5)
+    repo = SwarmOllamaRepository("llama3", keep_alive="30m", options={"num_ctx": 8192}, sessions=True)
+
+    first = _ollama_chat(repo, n, "b", "full prompt, turn 1")
+    assert first["keep_alive"] == "30m" and first["options"] == {"num_ctx": 8192}
+    assert [m["role"] for m in first["messages"]] == ["system", "user"]
+
+    n.add_turn(Turn("b", "I offer 900", 0))
+    n.add_turn(Turn("s", "1300 is my price", 0))
+    second = _ollama_chat(repo, n, "b", "full prompt, turn 2")
+    n.add_turn(Turn("b", "Meet at 1100?", 0))
+    n.add_turn(Turn("s", "Done deal! price=1100, delivery=7, upfront=40", 0))
+    third = _ollama_chat(repo, n, "b", "full prompt, turn 3")
+
+    # Lo ya enviado no cambia: sólo se agrega al final (prefijo reutilizable)
+    assert third["messages"][:len(second["messages"]) - 1] == second["messages"][:-1]
+    assert second["messages"][2] == {"role": "assistant", "content": "I offer 900"}
+    assert second["messages"][3]["content"] == "s: 1300 is my price\n\nRounds left: 4"
+    assert all("full prompt, turn 2" not in m["content"] for m in third["messages"])
+    assert set(repo.sessions) == {("b", "N")}
+
+def test_ollama_without_negotiation_uses_generate():
+    repo = SwarmOllamaRepository("llama3", sessions=True)
+    response = MagicMock()
+    response.json.return_value = {"response": "ok"}
+    with patch.object(repo.session, "post", return_value=response) as post:
+        assert repo.run("hi") == "ok"
+    assert post.call_args[0][0].endswith("/api/generate")
+    assert "keep_alive" not in post.call_args[1]["json"] and not repo.sessions
+
+def test_mk_repo_ollama_runtime_options():
+    from swarm.main import mk_repo
+    cfg = {"ollama": {"keep_alive": "10m", "num_ctx": 4096, "session": True}}
+    repo = mk_repo("ollama", "llama3", {"ollama": {"num_predict": 200}}, cfg)
+    assert repo.keep_alive == "10m" and repo.sessions_enabled and repo.max_sessions == 1024
+    assert repo.generation_params == {"options": {"num_ctx": 4096, "num_predict": 200}}
+    assert mk_repo("ollama", "llama3", {}, {}).generation_params == {}
+
+def test_ollama_sessions_evict_the_least_recently_used():
+    terms = ItemTerms(price=Range(800, 1500, 1200), delivery_days=Range(3, 14, 7),
+                      upfront_pct=Range(0, 100, 50))
+    negos = {nid: Negotiation(id=nid, seller_id="s", buyer_id="b", item_id="item1", terms=terms)
+             for nid in ("N1", "N2", "N3")}
+    repo = SwarmOllamaRepository("llama3", sessions=True, max_sessions=2)
+
+    _ollama_chat(repo, negos["N1"], "b", "prompt")
+    _ollama_chat(repo, negos["N2"], "b", "prompt")
+    # N1 sigue abierta y vuelve a hablar; N2 (cerrada) ya no: es la primera en salir
+    _ollama_chat(repo, negos["N1"], "b", "prompt")
+    _ollama_chat(repo, negos["N3"], "b", "prompt")
+    assert list(repo.sessions) == [("b", "N1"), ("b", "N3")]
@@ -0,0 +1,238 @@
+import asyncio
+import random
+import time
+import pytest
+import requests
+from swarm.agents.repositories import AIRepository
+from swarm.agents.cache import CachedRepository, ResponseCache
+from swarm.agents.resilience import (AIMDLimiter, AdaptiveConcurrencyRepository, CircuitBreaker, CircuitBreakerRepository, CircuitOpen,
+                                     DeadlineExceeded, FallbackReply, LatencyTracker, ResilientRepository,
+                                     is_transient)
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+class FlakyRepository(AIRepository):
+    """Fails with `errors` (in order) and then answers; `delays` per call."""
+    provider = "fake"
+
+    def __init__(self, errors=(), delays=()):
+        self.model = "m"
+        self.errors = list(errors)
+        self.delays = list(delays)
+        self.calls = 0
+
+    def _step(self):
+        self.calls += 1
+        delay = self.delays.pop(0) if self.delays else 0.0
+        error = self.errors.pop(0) if self.errors else None
+        return delay, error, f"reply {self.calls}"
+
+    def run(self, prompt, **kwargs):
+        delay, error, reply = self._step()
+        time.sleep(delay)
+        if error:
+            raise error
+        return reply
+
+    async def arun(self, prompt, **kwargs):
+        delay, error, reply = self._step()
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return reply
+
+def _resilient(inner, **kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return ResilientRepository(inner, rng=random.Random(0), **kwargs)
+
+def test_transient_classification():
+    assert is_transient(HTTPStatusError(429)) and is_transient(HTTPStatusError(503))
+    assert not is_transient(HTTPStatusError(400)) and not is_transient(ValueError())
+    assert is_transient(requests.ConnectionError())
+    response = requests.Response()
+    response.status_code = 502
+    assert is_transient(requests.HTTPError(response=response))
+    assert not is_transient(DeadlineExceeded())
+
+def test_retries_transient_errors_then_succeeds():
+    inner = FlakyRepository(errors=[HTTPStatusError(503), requests.Timeout()])
+    repo = _resilient(inner, retries=2)
+    assert repo.run("p") == "reply 3"
+    assert repo.stats()["retries"] == 2 and repo.stats()["failures"] == 0
+
+def test_does_not_retry_permanent_errors_and_gives_up_after_retries():
+    repo = _resilient(FlakyRepository(errors=[HTTPStatusError(401)]), retries=3)
+    with pytest.raises(HTTPStatusError):
+        repo.run("p")
+    assert repo.inner.calls == 1
+
+    repo = _resilient(FlakyRepository(errors=[HTTPStatusError(500)] * 5), retries=2)
+    with pytest.raises(HTTPStatusError):
+        asyncio.run(repo.arun("p"))
+    assert repo.inner.calls == 3 and repo.stats()["failures"] == 1
+
+def test_backoff_is_jittered_exponential_and_capped():
+    repo = ResilientRepository(FlakyRepository(), backoff_base=1.0, backoff_max=4.0)
+    delays = [repo.backoff(attempt, Exception()) for attempt in range(6)]
+    assert all(0 <= d <= min(4.0, 2 ** a) for a, d in enumerate(delays))
+    assert len(set(delays)) > 1
+
+def test_hedge_wins_over_slow_primary():
+    for call in ("run", "arun"):
+        inner = FlakyRepository(delays=[0.5, 0.01])
+        repo = _resilient(inner, hedge_after=0.05)
+        t0 = time.time()
+        out = repo.run("p") if call == "run" else asyncio.run(repo.arun("p"))
+        assert out == "reply 2" and time.time() - t0 < 0.3
+        assert repo.stats()["hedges"] == 1 and repo.stats()["hedge_wins"] == 1
+
+def test_quantile_hedging_waits_for_samples():
+    tracker = LatencyTracker()
+    repo = _resilient(FlakyRepository(), hedge_after="p95", hedge_min_samples=3, tracker=tracker)
+    assert repo.hedge_delay() is None
+    for s in (0.1, 0.2, 0.3, 0.4):
+        tracker.record(s)
+    assert repo.hedge_delay() == 0.4
+
+def test_deadline_bounds_the_call():
+    for call in ("run", "arun"):
+        repo = _resilient(FlakyRepository(delays=[1.0]), deadline=0.05)
+        t0 = time.time()
+        with pytest.raises(DeadlineExceeded):
+            repo.run("p") if call == "run" else asyncio.run(repo.arun("p"))
+        assert time.time() - t0 < 0.5
+        assert repo.stats()["deadlines"] == 1
+
+def test_wrap_repo_resolves_provider_and_agent_settings():
+    from swarm.main import wrap_repo
+    cfg = {"resilience": {"fake": {"retries": 4, "deadline": 30}}}
+    repo = wrap_repo(FlakyRepository(), {"repo": "fake", "model": "m",
+                                         "resilience": {"deadline": 10}}, cfg)
+    assert isinstance(repo, ResilientRepository)
+    assert repo.retries == 4 and repo.deadline == 10
+
+def test_circuit_opens_on_error_rate_and_recovers_through_half_open(fake_clock):
+    breaker = CircuitBreaker("fake/m", window=4, min_calls=4, failure_rate=0.5, open_for=10, clock=fake_clock)
+    events = []
+    breaker.listeners.append(lambda name, old, new: events.append((name, old, new)))
+    inner = FlakyRepository(errors=[HTTPStatusError(400), HTTPStatusError(400), HTTPStatusError(503)])
+    repo = CircuitBreakerRepository(inner, breaker, clock=fake_clock)
+
+    for _ in range(3):
+        with pytest.raises(HTTPStatusError):
+            repo.run("p")
+    repo.run("p")
+    assert breaker.state == "closed"        # un 400 no cuenta: culpa de la request
+    inner.errors = [HTTPStatusError(503)]
+    with pytest.raises(HTTPStatusError):
+        repo.run("p")
+    assert breaker.state == "open"
+
+    calls = inner.calls
+    with pytest.raises(CircuitOpen):
+        repo.run("p")
+    assert inner.calls == calls             # falla rápido, sin tocar el proveedor
+
+    fake_clock.now = 10
+    assert repo.run("p").startswith("reply")
+    assert breaker.state == "closed" and breaker.stats()["fake/m:rejected"] == 1
+    assert events == [("fake/m", "closed", "open"), ("fake/m", "open", "half_open"),
+                      ("fake/m", "half_open", "closed")]
+
+def test_half_open_trial_failure_reopens_and_slow_calls_count(fake_clock):
+    breaker = CircuitBreaker("fake/m", min_calls=2, failure_rate=1.0, slow_after=5, open_for=1, clock=fake_clock)
+    breaker.record(6.0)
+    breaker.record(7.0)
+    assert breaker.state == "open"
+    fake_clock.now = 1
+    assert breaker.allow() and not breaker.allow()      # una sola llamada de prueba
+    breaker.record(0.1, HTTPStatusError(429))
+    assert breaker.state == "open" and breaker.opened == 2
+
+def test_open_circuit_uses_fallback():
+    breaker = CircuitBreaker("fake/m", min_calls=1)
+    breaker.record(0.0, requests.ConnectionError())
+    fallback = FlakyRepository()
+    repo = CircuitBreakerRepository(FlakyRepository(), breaker, fallback=fallback)
+    assert asyncio.run(repo.arun("p")) == "reply 1"
+    assert fallback.calls == 1 and repo.inner.calls == 0
+
+def test_fallback_replies_are_not_cached_as_the_primary_model(fake_clock):
+    breaker = CircuitBreaker("fake/m", min_calls=1, open_for=10, clock=fake_clock)
+    breaker.record(0.0, requests.ConnectionError())
+    fallback = FlakyRepository()
+    fallback.calls = 100                    # sus respuestas: "reply 101", "reply 102"...
+    primary = FlakyRepository()
+    repo = CachedRepository(CircuitBreakerRepository(primary, breaker, fallback=fallback, clock=fake_clock),
+                            ResponseCache(path=None))
+
+    out = repo.run("p")
+    assert out == "reply 101" and isinstance(out, FallbackReply) and out.served_by == "fake/m"
+    assert asyncio.run(repo.arun("p")) == "reply 102"   # abierto: de nuevo al fallback, nada en caché
+
+    fake_clock.now = 10                     # half-open → el primario responde y cierra el circuito
+    assert repo.run("p") == "reply 1" and breaker.state == "closed"
+    assert repo.run("p") == "reply 1"       # ahora sí desde la caché, y es la del primario
+    assert primary.calls == 1 and fallback.calls == 102
+    assert repo.cache.stats()["misses"] == 3
+
+def test_wrap_repo_builds_breaker_with_fallback():
+    from unittest.mock import patch
+    from swarm.main import wrap_repo
+    from swarm.agents.resilience import _breakers
+    cfg = {"circuit_breaker": {"fake": {"min_calls": 3, "fallback": {"model": "backup"}}}}
+    backup = FlakyRepository()
+    with patch("swarm.main.mk_repo", return_value=backup) as mk_repo:
+        repo = wrap_repo(FlakyRepository(), {"repo": "fake", "model": "breaker-test"}, cfg)
+    assert isinstance(repo, CircuitBreakerRepository) and repo.breaker.min_calls == 3
+    assert repo.fallback is backup and mk_repo.call_args[0][:2] == ("fake", "backup")
+    _breakers.pop(("fake", "breaker-test"))
+
+def test_aimd_grows_additively_and_cuts_once_per_burst(fake_clock):
+    limiter = AIMDLimiter(initial=4, max_limit=6, min_samples=100, clock=fake_clock)
+    for _ in range(8):
+        limiter.observe(fake_clock(), 0.1)
+    assert limiter.limit == 5                     # +1 por cada `limit` llamadas sanas
+    for _ in range(20):
+        limiter.observe(fake_clock(), 0.1)
+    assert limiter.limit == 6 and limiter.peak == 6
+
+    started = fake_clock()
+    fake_clock.now = 1
+    for _ in range(3):                            # ráfaga de 429 de llamadas ya en vuelo
+        limiter.observe(started, 0.1, HTTPStatusError(429))
+    assert limiter.limit == 3 and limiter.cuts == 1
+    limiter.observe(fake_clock(), 0.1, HTTPStatusError(400))
+    assert limiter.limit == 3
+
+def test_aimd_cuts_on_latency_spike():
+    limiter = AIMDLimiter(initial=8, min_samples=5, latency_factor=2.0)
+    for _ in range(5):
+        limiter.observe(limiter.clock(), 0.1)
+    limiter.observe(limiter.clock(), 0.5)
+    assert limiter.limit == 4
+
+def test_adaptive_repository_caps_in_flight_and_reports_limit():
+    limiter = AIMDLimiter(initial=2)
+    inner = FlakyRepository(delays=[0.05] * 6)
+    repo = AdaptiveConcurrencyRepository(inner, limiter)
+    peak, in_flight = [0], [0]
+    original = inner.arun
+
+    async def tracked(prompt, **kwargs):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        try:
+            return await original(prompt, **kwargs)
+        finally:
+            in_flight[0] -= 1
+    inner.arun = tracked
+
+    async def burst():
+        return await asyncio.gather(*(repo.arun("p") for _ in range(6)))
+    asyncio.run(burst())
+    assert peak[0] <= 3 and limiter.in_flight == 0
+    assert repo.stats()["fake:limit"] == limiter.limit >= 2
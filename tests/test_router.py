@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock
+from swarm.agents.base import current_negotiation
+from swarm.agents.repositories import AIRepository
+from swarm.agents.router import RoutedRepository, RouteStats, validate_reply
+from swarm.core.negotiation import Negotiation
+from swarm.core.terms import Range, ItemTerms, MultiItemTerms, ItemRequest
+
+terms = ItemTerms(
+    price=Range(800, 1500, 1200),
+    delivery_days=Range(3, 14, 7),
+    upfront_pct=Range(0, 100, 50)
+)
+
+def _negotiation(t=terms):
+    return Negotiation(id="N", seller_id="s", buyer_id="b", item_id="item1", terms=t)
+
+class FixedRepository(AIRepository):
+    provider = "fake"
+
+    def __init__(self, model, reply):
+        self.model = model
+        self.reply = reply
+        self.calls = 0
+
+    def run(self, prompt, **kwargs):
+        self.calls += 1
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return self.reply
+
+def test_validate_reply_reasons():
+    n = _negotiation()
+    assert validate_reply("   ", n) == "empty"
+    assert validate_reply("Let me think about it.", n) == "no_offer"
+    assert validate_reply("I can do $1,100 with delivery in 7 days.", n) is None
+    assert validate_reply("My price is 1200.", n) is None
+    assert validate_reply("How about $50?", n) == "bounds"
+    assert validate_reply("Done deal! price=1100, delivery=7, upfront=40", n) is None
+    assert validate_reply("Done deal! price=1100, delivery=30, upfront=40", n) == "bounds"
+    # Sin negociación sólo se descarta la respuesta vacía
+    assert validate_reply("Let me think about it.") is None
+
+def test_validate_multi_item_total():
+    multi = MultiItemTerms(items={"item1": terms}, requests=[ItemRequest("item1", 3)])
+    n = _negotiation(multi)
+    assert validate_reply("Done deal! total=3000, delivery=7, upfront=50", n) is None
+    assert validate_reply("Done deal! total=9000, delivery=7, upfront=50", n) == "bounds"
+    assert validate_reply("$1000 per unit, $3000 for the lot", n) is None
+
+def _routed(*replies, route_stats=None):
+    tiers = [FixedRepository(f"m{i}", r) for i, r in enumerate(replies)]
+    return RoutedRepository(tiers, route_stats=route_stats), tiers
+
+def _run(repo, call="run"):
+    token = current_negotiation.set(_negotiation())
+    try:
+        return repo.run("p") if call == "run" else asyncio.run(repo.arun("p"))
+    finally:
+        current_negotiation.reset(token)
+
+def test_first_valid_tier_serves_the_turn():
+    repo, tiers = _routed("$1100?", "$1200?")
+    assert _run(repo) == "$1100?"
+    assert tiers[1].calls == 0
+
+    repo, tiers = _routed("", "Maybe later", RuntimeError("down"), "$1200?")
+    assert _run(repo, "arun") == "$1200?"
+    stats = repo.stats()
+    assert stats["escalations"] == 3
+    assert stats["fake/m0:hit_rate"] == 0.0 and stats["fake/m3:hit_rate"] == 1.0
+
+def test_last_tier_is_used_even_if_invalid_and_errors_propagate():
+    repo, _ = _routed("", "Maybe later")
+    assert _run(repo) == "Maybe later"
+    repo, _ = _routed("", RuntimeError("down"))
+    with pytest.raises(RuntimeError):
+        _run(repo)
+
+def test_labels_see_through_wrapped_tiers():
+    from swarm.agents.repositories import RateLimitedRepository, RateLimiter
+    tiers = [RateLimitedRepository(FixedRepository("m", "$1100?"), RateLimiter()),
+             FixedRepository("m", "$1200?")]
+    tiers[1].provider = "other"
+    assert RoutedRepository(tiers).labels == ["fake/m", "other/m"]
+
+def test_hit_rates_are_shared_across_agents():
+    shared = RouteStats()
+    a, _ = _routed("$1100?", "$1200?", route_stats=shared)
+    b, _ = _routed("", "$1200?", route_stats=shared)
+    _run(a)
+    _run(b)
+    assert shared.stats()["fake/m0:hit_rate"] == 0.5
+
+def test_build_agent_repo_escalate_and_runtime_stats():
+    from swarm.main import build_agent_repo, runtime_stats
+    agent_cfg = {"repo": "simulated", "model": "cheap", "simulated": {"accept_prob": 0.0},
+                 "escalate": [{"repo": "simulated", "model": "big"}]}
+    cfg = {"rate_limits": {"simulated": {"rpm": 100000}}, "resilience": {"simulated": {"retries": 1}}}
+    repo = build_agent_repo(agent_cfg, cfg, route_stats=RouteStats())
+    assert isinstance(repo, RoutedRepository)
+    assert [t.model for t in repo.tiers] == ["cheap", "big"]
+    # Los tiers van envueltos (resilience → rate limit) y conservan su etiqueta real
+    assert repo.labels == ["simulated/cheap", "simulated/big"]
+
+    _run(repo)
+    agent = MagicMock()
+    agent.repo = repo
+    stats = runtime_stats([agent])
+    assert stats["router"]["simulated/cheap:served"] == 1
+    assert stats["simulated"]["calls"] == 1
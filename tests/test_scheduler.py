@@ -0,0 +1,224 @@
+import asyncio
+import time
+import pytest
+from swarm.agents.base import SellerAgent, BuyerAgent, current_negotiation
+from swarm.core.negotiation import Negotiation, NegotiationStatus
+from swarm.core.scheduler import SwarmManager, AsyncSwarmManager
+from swarm.core.ready_queue import PriorityGate
+from tests.conftest import DEAL, TERMS, ScriptedRepository, make_agent, make_market, make_negotiation
+
+pytestmark = pytest.mark.usefixtures("tmp_logs")
+
+def test_sync_agreement_closes_competing_negotiations():
+    swarm, negos = make_market(SwarmManager, ScriptedRepository(accept_after=2),
+                               {"b1": ScriptedRepository(), "b2": ScriptedRepository()})
+    swarm.run()
+
+    assert negos[0].status == NegotiationStatus.AGREEMENT
+    assert negos[0].final_terms == {"price": 1100.0, "delivery_days": 7.0, "upfront_pct": 40.0}
+    assert negos[1].status == NegotiationStatus.FAILED
+    assert swarm.sold_sellers == {"s1"} and swarm.bought_buyers == {"b1"}
+
+def test_agreement_closes_only_negotiations_sharing_seller_or_buyer():
+    sellers = {sid: make_agent(SellerAgent, sid, ScriptedRepository()) for sid in ("s1", "s2")}
+    buyers = {"b1": make_agent(BuyerAgent, "b1", ScriptedRepository(accept_after=0)),
+              "b2": make_agent(BuyerAgent, "b2", ScriptedRepository()),
+              "b3": make_agent(BuyerAgent, "b3", ScriptedRepository())}
+    negos = [make_negotiation("A", "s1", "b1"), make_negotiation("B", "s1", "b2"),
+             make_negotiation("C", "s2", "b1"), make_negotiation("D", "s2", "b3")]
+    swarm = SwarmManager(sellers, buyers, negos)
+    assert set(swarm.open_by_seller["s1"]) == {"A", "B"}
+    assert set(swarm.open_by_buyer["b1"]) == {"A", "C"}
+
+    swarm._apply_message(negos[0], "b1", DEAL)
+
+    assert [n.status.name for n in negos] == ["AGREEMENT", "FAILED", "FAILED", "ONGOING"]
+    assert "s1" not in swarm.open_by_seller and "b1" not in swarm.open_by_buyer
+    assert set(swarm.open_by_seller["s2"]) == {"D"} and set(swarm.open_by_buyer["b3"]) == {"D"}
+    assert swarm.open_by_buyer["b2"] == {}
+
+def test_buyer_acceptance_skips_seller_turn():
+    seller_repo = ScriptedRepository()
+    swarm, negos = make_market(SwarmManager, seller_repo, {"b1": ScriptedRepository(accept_after=0)})
+    swarm.run()
+
+    assert negos[0].status == NegotiationStatus.AGREEMENT
+    assert [t.sender_id for t in negos[0].turns] == ["b1"]
+    assert seller_repo.calls == 0
+
+def test_max_turns_marks_failed():
+    swarm, negos = make_market(SwarmManager, ScriptedRepository(), {"b1": ScriptedRepository()})
+    swarm.run()
+
+    assert negos[0].status == NegotiationStatus.FAILED
+    assert len(negos[0].turns) == negos[0].max_turns * 2
+
+def test_async_matches_sync_outcome():
+    swarm, negos = make_market(AsyncSwarmManager, ScriptedRepository(accept_after=2),
+                               {"b1": ScriptedRepository(), "b2": ScriptedRepository()})
+    swarm.run()
+
+    statuses = sorted(n.status.name for n in negos)
+    assert statuses == ["AGREEMENT", "FAILED"]
+    agreed = next(n for n in negos if n.status == NegotiationStatus.AGREEMENT)
+    assert [t.sender_id for t in agreed.turns] == [agreed.buyer_id, "s1", agreed.buyer_id, "s1"]
+
+def test_async_wall_clock_tracks_longest_negotiation():
+    delay = 0.05
+    sellers = {f"s{i}": make_agent(SellerAgent, f"s{i}", ScriptedRepository(delay=delay)) for i in range(6)}
+    buyers = {f"b{i}": make_agent(BuyerAgent, f"b{i}", ScriptedRepository(delay=delay)) for i in range(6)}
+    negos = [make_negotiation(f"N{i}", f"s{i}", f"b{i}", max_turns=2) for i in range(6)]
+
+    t0 = time.time()
+    AsyncSwarmManager(sellers, buyers, negos).run()
+    elapsed = time.time() - t0
+
+    # 6 negociaciones x 4 llamadas x 50ms = 1.2s en serie; en paralelo ~0.2s
+    assert all(n.status == NegotiationStatus.FAILED for n in negos)
+    assert elapsed < 0.6
+
+def test_async_max_concurrency_limits_in_flight_calls():
+    in_flight, peak = 0, 0
+
+    class CountingRepository(ScriptedRepository):
+        async def arun(self, prompt):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            try:
+                return await super().arun(prompt)
+            finally:
+                in_flight -= 1
+
+    sellers = {f"s{i}": make_agent(SellerAgent, f"s{i}", CountingRepository(delay=0.01)) for i in range(4)}
+    buyers = {f"b{i}": make_agent(BuyerAgent, f"b{i}", CountingRepository(delay=0.01)) for i in range(4)}
+    negos = [make_negotiation(f"N{i}", f"s{i}", f"b{i}", max_turns=2) for i in range(4)]
+    AsyncSwarmManager(sellers, buyers, negos, max_concurrency=2).run()
+
+    assert peak == 2
+
+class RecordingRepository(ScriptedRepository):
+    """Records the id of the negotiation each call belongs to."""
+    def __init__(self, order, **kwargs):
+        super().__init__(**kwargs)
+        self.order = order
+
+    def _answer(self, prompt):
+        self.order.append(current_negotiation.get().id)
+        return super()._answer(prompt)
+
+def _two_markets(order, urgencies=(0.5, 0.5), **kwargs):
+    sellers = {f"s{i}": make_agent(SellerAgent, f"s{i}", RecordingRepository(order)) for i in range(2)}
+    buyers = {f"b{i}": make_agent(BuyerAgent, f"b{i}", RecordingRepository(order)) for i in range(2)}
+    for i, urgency in enumerate(urgencies):
+        buyers[f"b{i}"].urgency = urgency
+    negos = [make_negotiation("N0", "s0", "b0", max_turns=3), make_negotiation("N1", "s1", "b1", max_turns=2)]
+    return SwarmManager(sellers, buyers, negos, **kwargs), negos
+
+def test_fifo_policy_keeps_round_robin_order():
+    order = []
+    swarm, _ = _two_markets(order)
+    swarm.run()
+    assert order == ["N0", "N0", "N1", "N1"] * 2 + ["N0", "N0"]
+
+def test_rounds_left_policy_favours_negotiations_close_to_the_end():
+    order = []
+    swarm, negos = _two_markets(order, policy="rounds_left")
+    swarm.run()
+    # N1 (2 rondas) va primero y sigue adelante mientras le queden menos rondas que a N0
+    assert order == ["N1"] * 4 + ["N0"] * 6
+    assert all(n.status == NegotiationStatus.FAILED for n in negos)
+
+def test_urgency_and_custom_policies():
+    order = []
+    swarm, _ = _two_markets(order, urgencies=(0.2, 0.9), policy="urgency")
+    swarm.run()
+    assert order[:4] == ["N1"] * 4
+
+    order.clear()
+    swarm, _ = _two_markets(order, policy=lambda n, agents: (-len(n.id), n.id != "N0"))
+    swarm.run()
+    assert order[:6] == ["N0"] * 6
+
+    with pytest.raises(ValueError):
+        SwarmManager({}, {}, [], policy="random")
+
+def test_priority_gate_admits_waiters_by_priority():
+    admitted = []
+
+    async def scenario():
+        gate = PriorityGate(1)
+        await gate.acquire()
+
+        async def wait(priority):
+            await gate.acquire((priority,))
+            admitted.append(priority)
+            gate.release()
+
+        tasks = [asyncio.create_task(wait(p)) for p in (3, 1, 2)]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return gate.in_use
+
+    assert asyncio.run(scenario()) == 0
+    assert admitted == [1, 2, 3]
+
+def test_incremental_extractor_waits_for_complete_number():
+    from swarm.core.scheduler import IncrementalTermExtractor
+    ex = IncrementalTermExtractor()
+    assert ex.feed("Done deal! price=1100, deli") is None
+    assert ex.feed("very=7, upfront=4") is None
+    assert ex.feed("0") is None                     # podría seguir otro dígito
+    assert ex.feed(". Thanks!") == {"price": 1100.0, "delivery_days": 7.0, "upfront_pct": 40.0}
+
+def test_incremental_extractor_multi_item_total():
+    from swarm.core.scheduler import IncrementalTermExtractor
+    from swarm.core.terms import MultiItemTerms, ItemRequest
+    multi = MultiItemTerms(items={"item1": TERMS}, requests=[ItemRequest("item1", 2)])
+    n = Negotiation(id="M", seller_id="s", buyer_id="b", item_id="multi", terms=multi)
+
+    ex = IncrementalTermExtractor(n)
+    assert ex.feed("Done deal! total=2000, delivery=7, upfront=50") is None
+    assert ex.feed("\n")["total_price"] == 2000.0
+    # Sin negociación multi-item el formato total no corta el stream
+    assert IncrementalTermExtractor().feed("total=2000, delivery=7, upfront=50 ok") is None
+
+def test_incremental_extractor_finish_matches_batch_parser():
+    from swarm.core.scheduler import IncrementalTermExtractor, extract_terms_from_message
+    ex = IncrementalTermExtractor()
+    msg = "Done deal! price=1100, delivery=7, upfront=40"
+    for ch in msg:
+        ex.feed(ch)
+    assert ex.finish() == extract_terms_from_message(msg)
+
+@pytest.mark.parametrize("manager_cls", [SwarmManager, AsyncSwarmManager])
+def test_repository_error_fails_only_its_negotiation(manager_cls):
+    from swarm.agents.resilience import ResilientRepository
+    stuck = ResilientRepository(ScriptedRepository(delay=1.0), retries=0, deadline=0.05)
+    sellers = {"s1": make_agent(SellerAgent, "s1", ScriptedRepository()),
+               "s2": make_agent(SellerAgent, "s2", ScriptedRepository(accept_after=2))}
+    buyers = {"b1": make_agent(BuyerAgent, "b1", stuck),
+              "b2": make_agent(BuyerAgent, "b2", ScriptedRepository())}
+    negos = [make_negotiation("N1", "s1", "b1"), make_negotiation("N2", "s2", "b2")]
+    swarm = manager_cls(sellers, buyers, negos)
+    swarm.run()
+
+    assert negos[0].status == NegotiationStatus.FAILED and negos[0].turns == []
+    assert negos[1].status == NegotiationStatus.AGREEMENT
+    assert swarm.errors["N1"].startswith("b1: DeadlineExceeded")
+
+def test_async_error_after_cascade_close_is_not_recorded():
+    class SlowFailingRepository(ScriptedRepository):
+        async def arun(self, prompt):
+            await asyncio.sleep(0.05)
+            raise RuntimeError("provider down")
+
+    swarm, negos = make_market(AsyncSwarmManager, ScriptedRepository(),
+                               {"b1": ScriptedRepository(accept_after=0), "b2": SlowFailingRepository()})
+    swarm.run()
+
+    # b1 cierra trato mientras la llamada de b2 sigue en vuelo; su error llega tarde
+    assert negos[0].status == NegotiationStatus.AGREEMENT
+    assert negos[1].status == NegotiationStatus.FAILED
+    assert swarm.errors == {}
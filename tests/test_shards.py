@@ -0,0 +1,29 @@
+from swarm.core.negotiation import NegotiationStatus
+from swarm.core.shards import split_components, pack_shards
+from swarm.main import build_from_config, run_sharded, run_swarm
+from swarm.utils.evaluator import evaluate_swarm
+from tests.conftest import make_negotiation as _n, outcome
+
+def test_split_components_follows_shared_sellers_and_buyers():
+    negos = [_n("A", "s1", "b1"), _n("B", "s2", "b2"), _n("C", "s1", "b3"),
+             _n("D", "s3", "b3"), _n("E", "s4", "b4"), _n("F", "x", "x")]
+    components = split_components(negos)
+    assert [[n.id for n in c] for c in components] == [["A", "C", "D"], ["B"], ["E"], ["F"]]
+
+    shards = pack_shards(components, 2)
+    assert [[n.id for n in s] for s in shards] == [["A", "C", "D"], ["B", "E", "F"]]
+    assert len(pack_shards(components, 10)) == 4
+
+def test_sharded_run_matches_single_process(market_config):
+    path, cfg = market_config
+    sellers, buyers, expected = build_from_config(path)
+    run_swarm(sellers, buyers, expected, cfg, {"policy": "fifo"})
+
+    sellers, buyers, negos = build_from_config(path)
+    results = run_sharded(path, negos, {"policy": "fifo"}, shards=2)
+
+    assert len(results) == 2
+    assert outcome(negos) == outcome(expected)
+    assert any(n.status == NegotiationStatus.AGREEMENT for n in negos)
+    assert evaluate_swarm(negos, buyers, sellers) == evaluate_swarm(expected, buyers, sellers)
+    assert all(any(name.startswith("simulated") for name in r["stats"]) for r in results)
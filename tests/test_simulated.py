@@ -0,0 +1,118 @@
+import asyncio
+import time
+import pytest
+from swarm.agents.base import current_agent, current_negotiation
+from swarm.agents.simulated import LatencyModel, SimulatedRepository
+from swarm.benchmark import run_benchmark
+from swarm.core.negotiation import Negotiation, NegotiationStatus
+from swarm.core.scheduler import extract_terms_from_message
+from swarm.core.terms import Range, ItemTerms, MultiItemTerms, ItemRequest
+
+terms = ItemTerms(
+    price=Range(800, 1500, 1200),
+    delivery_days=Range(3, 14, 7),
+    upfront_pct=Range(0, 100, 50)
+)
+
+pytestmark = pytest.mark.usefixtures("tmp_logs")
+
+def _with_negotiation(n, fn):
+    token = current_negotiation.set(n)
+    try:
+        return fn()
+    finally:
+        current_negotiation.reset(token)
+
+def test_accepts_in_extractable_format_within_bounds():
+    n = Negotiation(id="N", seller_id="s", buyer_id="b", item_id="item1", terms=terms)
+    repo = SimulatedRepository(accept_prob=1.0)
+    msg = _with_negotiation(n, lambda: repo.run("prompt"))
+
+    agreed = extract_terms_from_message(msg, n)
+    assert msg.startswith("Done deal!")
+    assert 800 <= agreed["price"] <= 1500 and 3 <= agreed["delivery_days"] <= 14
+
+def test_counter_offers_are_not_taken_as_agreements():
+    repo = SimulatedRepository(accept_prob=0.0)
+    for i in range(20):
+        assert extract_terms_from_message(repo.run(f"prompt {i}")) is None
+
+def test_min_turns_delays_acceptance():
+    n = Negotiation(id="N", seller_id="s", buyer_id="b", item_id="item1", terms=terms)
+    repo = SimulatedRepository(accept_prob=1.0, min_turns=2)
+    assert not _with_negotiation(n, lambda: repo.run("p")).startswith("Done deal!")
+
+def test_multi_item_uses_total_format():
+    multi = MultiItemTerms(items={"item1": terms}, requests=[ItemRequest("item1", 3)])
+    n = Negotiation(id="M", seller_id="s", buyer_id="b", item_id="multi", terms=multi)
+    msg = _with_negotiation(n, lambda: SimulatedRepository(accept_prob=1.0).run("p"))
+    assert 2400 <= extract_terms_from_message(msg, n)["total_price"] <= 4500
+
+def test_replies_are_deterministic_per_seed_and_prompt():
+    a, b = SimulatedRepository(seed=7), SimulatedRepository(seed=7)
+    assert [a.run(f"p{i}") for i in range(5)] == [b.run(f"p{i}") for i in range(5)]
+    assert SimulatedRepository(seed=8).run("p0") != SimulatedRepository(seed=7).run("p0")
+
+def test_accept_rate_across_agents_follows_accept_prob():
+    repo = SimulatedRepository(accept_prob=0.3)
+    accepted = 0
+    for i in range(2000):
+        n = Negotiation(id=f"N{i}", seller_id="s", buyer_id=f"b{i}", item_id="item1", terms=terms)
+        token = current_agent.set(f"b{i}")
+        try:
+            # Mismo prompt para todos, como la apertura de cada comprador
+            accepted += _with_negotiation(n, lambda: repo.run("same opening")).startswith("Done deal!")
+        finally:
+            current_agent.reset(token)
+    assert abs(accepted / 2000 - 0.3) < 0.04
+    assert repo.stats()["accepts"] == accepted
+    # Otro modelo con la misma semilla tampoco repite las mismas decisiones
+    assert SimulatedRepository("a").run("p") != SimulatedRepository("b").run("p")
+
+def test_script_is_cycled():
+    repo = SimulatedRepository(script=["one", "two"])
+    assert [repo.run("x") for _ in range(3)] == ["one", "two", "one"]
+
+def test_latency_distributions():
+    assert LatencyModel("fixed", ms=250).sample() == 0.25
+    replay = LatencyModel("replay", values_ms=[10, 20], scale=2)
+    assert [replay.sample() for _ in range(3)] == [0.02, 0.04, 0.02]
+    lognormal = [LatencyModel("lognormal", median_ms=100, seed=1).sample() for _ in range(2)]
+    assert lognormal[0] == lognormal[1] and lognormal[0] > 0
+    with pytest.raises(ValueError):
+        LatencyModel("uniform")
+
+def test_replay_reads_recorded_timings(tmp_path):
+    path = tmp_path / "timings.txt"
+    path.write_text("100\n\n300\n")
+    model = LatencyModel("replay", path=str(path))
+    assert [model.sample() for _ in range(3)] == [0.1, 0.3, 0.1]
+
+def test_async_run_sleeps_without_blocking():
+    repo = SimulatedRepository(latency={"dist": "fixed", "ms": 50})
+    async def many():
+        return await asyncio.gather(*(repo.arun(f"p{i}") for i in range(10)))
+    t0 = time.time()
+    asyncio.run(many())
+    assert time.time() - t0 < 0.3
+    assert repo.stats()["calls"] == 10
+
+def test_benchmark_runs_end_to_end():
+    res = run_benchmark(sellers=3, buyers=6, buyers_per_seller=2, mode="async",
+                        sim_cfg={"accept_prob": 0.5})
+    assert res["negotiations"] == 6
+    assert 0 < res["agreements"] <= 3
+    assert res["agreements"] + res["cascaded"] <= 6
+    assert res["calls"] >= res["turns"]
+
+def test_build_from_config_with_simulated_repo():
+    from pathlib import Path
+    from swarm.main import build_from_config
+    from swarm.core.scheduler import SwarmManager
+    cfg = Path(__file__).resolve().parent.parent / "swarm" / "config_simulated.yaml"
+    sellers, buyers, negotiations = build_from_config(str(cfg))
+
+    assert isinstance(sellers["seller1"].repo, SimulatedRepository)
+    assert sellers["seller2"].repo.accept_prob == 0.1
+    SwarmManager(sellers, buyers, negotiations).run()
+    assert all(n.status != NegotiationStatus.ONGOING for n in negotiations)
@@ -0,0 +1,124 @@
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from swarm.agents.base import SellerAgent, BuyerAgent
+from swarm.agents.repositories import OllamaRepository, OpenAIRepository
+from swarm.agents.router import validate_reply
+from swarm.agents.simulated import SimulatedRepository
+from swarm.core.negotiation import Negotiation, NegotiationStatus
+from swarm.core.scheduler import SwarmManager
+from swarm.core.structured import AgentReply, parse_reply, reply_schema
+from swarm.core.terms import Range, ItemTerms, MultiItemTerms, ItemRequest
+
+terms = ItemTerms(
+    price=Range(800, 1500, 1200),
+    delivery_days=Range(3, 14, 7),
+    upfront_pct=Range(0, 100, 50)
+)
+multi_terms = MultiItemTerms(items={"cpu": terms, "ram": terms},
+                             requests=[ItemRequest("cpu", 2), ItemRequest("ram", 4)])
+weights = {"price": 0.6, "delivery_days": 0.2, "upfront_pct": 0.2}
+
+def _negotiation(t=terms, nid="N1_b1", buyer="b1"):
+    return Negotiation(id=nid, seller_id="s1", buyer_id=buyer, item_id="item1", terms=t)
+
+pytestmark = pytest.mark.usefixtures("tmp_logs")
+
+def test_schema_follows_the_negotiation_terms():
+    single = reply_schema(terms)
+    assert single["required"] == ["message", "offer", "accept"]
+    assert single["properties"]["offer"]["required"] == ["price", "delivery_days", "upfront_pct"]
+
+    items = reply_schema(multi_terms)["properties"]["offer"]["properties"]["items"]
+    assert items["required"] == ["cpu", "ram"] and items["additionalProperties"] is False
+
+def test_parse_accepted_reply_gives_terms_without_regex():
+    text = json.dumps({"message": "Agreed.", "accept": True,
+                       "offer": {"price": 1100, "delivery_days": 7, "upfront_pct": 40}})
+    reply = parse_reply(text, _negotiation())
+    assert isinstance(reply, AgentReply)
+    assert reply.terms == {"price": 1100.0, "delivery_days": 7.0, "upfront_pct": 40.0}
+    assert reply.endswith("Done deal! price=1100, delivery=7, upfront=40")
+
+def test_parse_counter_offer_has_no_terms_and_no_deal_text():
+    offer = {"items": {"cpu": {"quantity": 2, "price": 900}, "ram": {"quantity": 4, "price": 1000}},
+             "delivery_days": 10, "upfront_pct": 30}
+    n = _negotiation(multi_terms)
+    reply = parse_reply(json.dumps({"message": "How about this?", "offer": offer, "accept": False}), n)
+    assert reply.terms is None and reply.offer == offer
+    from swarm.core.scheduler import extract_terms_from_message
+    assert extract_terms_from_message(reply, n) is None
+
+    accepted = parse_reply(json.dumps({"message": "Deal", "offer": offer, "accept": True}), n)
+    assert accepted.terms["total_price"] == 2 * 900 + 4 * 1000
+
+def test_invalid_json_is_not_a_structured_reply():
+    assert parse_reply("Done deal! price=1100, delivery=7, upfront=40", _negotiation()) is None
+    assert parse_reply('{"message": "hi"}', _negotiation()) is None
+
+_offer = {"price": 1100, "delivery_days": 7, "upfront_pct": 40}
+_multi_offer = {"items": {"cpu": {"quantity": 2, "price": 900}, "ram": {"quantity": 4, "price": 1000}},
+                "delivery_days": 10, "upfront_pct": 30}
+
+@pytest.mark.parametrize("reply", [
+    {"message": "Deal", "offer": _offer, "accept": True, "note": "extra"},   # clave desconocida
+    {"message": "Deal", "offer": _offer, "accept": "true"},                   # accept no booleano
+    {"message": "Deal", "offer": _offer, "accept": 1},
+    {"message": 42, "offer": _offer, "accept": False},                        # message no es texto
+    {"message": "Deal", "offer": {**_offer, "price": "1100"}, "accept": True},  # número como texto
+    {"message": "Deal", "offer": {**_offer, "price": True}, "accept": True},
+    {"message": "Deal", "offer": {**_offer, "price": float("nan")}, "accept": True},
+    {"message": "Deal", "offer": {"price": 1100, "delivery_days": 7}, "accept": True},  # falta un término
+    {"message": "Deal", "offer": {**_offer, "warranty": 2}, "accept": True},
+    {"message": "Deal", "offer": _multi_offer, "accept": True},               # oferta multi-ítem
+    ["Deal", _offer, True],
+])
+def test_reply_not_matching_the_schema_is_rejected(reply):
+    assert parse_reply(json.dumps(reply), _negotiation()) is None
+
+@pytest.mark.parametrize("items", [
+    {"cpu": {"quantity": 2, "price": 900}},                                     # falta un ítem
+    {**_multi_offer["items"], "gpu": {"quantity": 1, "price": 500}},            # ítem ajeno
+    {"cpu": {"quantity": 2, "price": 900}, "disk": {"quantity": 4, "price": 1000}},
+    {"cpu": {"quantity": 2.5, "price": 900}, "ram": {"quantity": 4, "price": 1000}},  # cantidad no entera
+])
+def test_multi_item_reply_must_list_exactly_the_negotiated_items(items):
+    reply = {"message": "Deal", "offer": {**_multi_offer, "items": items}, "accept": True}
+    assert parse_reply(json.dumps(reply), _negotiation(multi_terms)) is None
+
+def test_structured_swarm_closes_deals_from_json():
+    def agent(cls, aid, accept_prob):
+        return cls(agent_id=aid, prompt_path="unused.j2", urgency=0.5, term_weights=weights,
+                   repo=SimulatedRepository(seed=1, accept_prob=accept_prob, min_turns=2),
+                   custom_prompt="{{ conversation_history }}", structured=True)
+    sellers = {"s1": agent(SellerAgent, "s1", 0.0)}
+    buyers = {"b1": agent(BuyerAgent, "b1", 1.0)}
+    n = _negotiation()
+    with patch("swarm.core.scheduler.extract_terms_from_message") as regex:
+        SwarmManager(sellers, buyers, [n]).run()
+    regex.assert_not_called()
+    assert n.status == NegotiationStatus.AGREEMENT
+    assert 800 <= n.final_terms["price"] <= 1500
+    assert n.turns[0].message.endswith("upfront)") and "Done deal!" in n.turns[-1].message
+
+def test_providers_receive_native_schema_parameters():
+    schema = reply_schema(terms)
+    openai_repo = OpenAIRepository("gpt-4o-mini", "key")
+    assert openai_repo._params(schema)["response_format"]["json_schema"]["schema"] == schema
+    assert "response_format" not in openai_repo._params(None)
+
+    ollama = OllamaRepository("llama3")
+    response = MagicMock()
+    response.json.return_value = {"response": "{}"}
+    with patch.object(ollama.session, "post", return_value=response) as post:
+        ollama.run("p", schema=schema)
+    assert post.call_args[1]["json"]["format"] == schema
+
+def test_router_validates_structured_offer():
+    n = _negotiation()
+    ok = json.dumps({"message": "m", "accept": False,
+                     "offer": {"price": 1100, "delivery_days": 7, "upfront_pct": 40}})
+    out = json.dumps({"message": "m", "accept": True,
+                      "offer": {"price": 5000, "delivery_days": 7, "upfront_pct": 40}})
+    assert validate_reply(ok, n) is None
+    assert validate_reply(out, n) == "bounds"
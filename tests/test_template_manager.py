@@ -0,0 +1,63 @@
+from unittest.mock import MagicMock
+from swarm.agents.base import SellerAgent, BuyerAgent
+from swarm.core.negotiation import Negotiation, Turn
+from swarm.core.terms import Range, ItemTerms
+from swarm.utils.template_manager import TemplateManager
+
+terms = ItemTerms(
+    price=Range(800, 1500, 1200),
+    delivery_days=Range(3, 14, 7),
+    upfront_pct=Range(0, 100, 50)
+)
+weights = {"price": 0.6, "delivery_days": 0.2, "upfront_pct": 0.2}
+
+def _negotiation():
+    return Negotiation(id="N1_b1", seller_id="s1", buyer_id="b1", item_id="item1", terms=terms)
+
+def test_split_at_first_dynamic_line():
+    tm = TemplateManager()
+    prefix, tail = tm.split_source("You sell {{ constraints.price.reference }}.\nHistory: {{ conversation_history }}\nBye")
+    assert prefix == "You sell {{ constraints.price.reference }}.\n"
+    assert tail.startswith("History:")
+
+def test_split_falls_back_when_cut_leaves_open_block():
+    tm = TemplateManager()
+    source = "{% if constraints %}\nStatic\n{{ rounds_left }}\n{% endif %}\n"
+    assert tm.split_source(source) == (None, source)
+
+def test_split_without_static_head():
+    tm = TemplateManager()
+    assert tm.split_source("{{ conversation_history }}") == (None, "{{ conversation_history }}")
+
+def test_split_render_keeps_all_content():
+    tm = TemplateManager()
+    ctx = dict(constraints=terms, conversation_history="b1: hi", rounds_left=3,
+               other_negotiations=[], urgency=0.5, agent_name="s1", weights=weights)
+    system, user = tm.render_split("buyer_prompt.j2", **ctx)
+    assert "Your objectives" in system and "b1: hi" not in system
+    assert "b1: hi" in user and "Rounds left: 3" in user
+    full = tm.render("buyer_prompt.j2", **ctx)
+    assert (system + "\n" + user).split() == full.split()
+
+def test_system_prefix_is_stable_across_turns():
+    repo = MagicMock()
+    repo.run.return_value = "ok"
+    seller = SellerAgent(agent_id="s1", prompt_path="seller_prompt.j2", repo=repo,
+                         urgency=0.5, term_weights=weights)
+    n = _negotiation()
+
+    seller.decide(n)
+    n.add_turn(Turn("b1", "How about $900?", 0.0))
+    seller.decide(n)
+
+    (first_prompt,), first_kw = repo.run.call_args_list[0]
+    (second_prompt,), second_kw = repo.run.call_args_list[1]
+    assert first_kw["system"] == second_kw["system"]
+    assert first_prompt != second_prompt and "$900" in second_prompt
+
+def test_custom_prompt_without_static_head_sends_no_system():
+    repo = MagicMock()
+    buyer = BuyerAgent(agent_id="b1", prompt_path="unused.j2", repo=repo, urgency=0.5,
+                       term_weights=weights, custom_prompt="{{ conversation_history }}")
+    buyer.decide(_negotiation())
+    assert repo.run.call_args[1] == {}